@@ -0,0 +1,280 @@
+"""
+Headless JSON API of the blogs, served by the `api/posts/` routes of
+`BlogIndexPage`.
+
+Listings and posts are read with `values()` projections of only the
+requested fields, `?fields=id,title,date,url` (see `FIELDS`), so no page
+model is ever instantiated. Rich text is sent as stored, and only expanded
+into HTML with `?richtext=html`.
+
+Listings are ordered from the newest post, and paginated with the opaque
+cursor of the last post of each page, `?cursor=...&limit=...`: the next page
+is a seek on `(date, id)`, so deep pages cost the same as the first one.
+The JSON is streamed a post at a time.
+
+The `api/tags/` route suggests the most used tags of the blog that start with
+a `?prefix=...`, for autocompletes.
+
+Responses carry a weak `ETag` that changes whenever a page is published or
+unpublished, and requests that send it back in `If-None-Match` are answered
+with 304 Not Modified, without reading the posts.
+"""
+from django.conf import settings
+from django.db.models import Q
+from django.http import (HttpResponse, HttpResponseNotModified,
+                         StreamingHttpResponse)
+from django.utils import six
+from django.utils.encoding import force_bytes, force_text
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from wagtail.wagtailcore.rich_text import expand_db_html
+
+from wagtailbase import cache, tagcloud
+from wagtailbase.listings import LISTINGS
+from wagtailbase.pageurls import get_page_url_by_id
+
+from datetime import datetime
+
+import hashlib
+import json
+
+# Fields of the API, and the columns they are read from
+FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'slug': 'slug',
+    'date': 'date',
+    'url': 'id',
+    'owner': 'owner__username',
+    'search_description': 'search_description',
+    'featured': 'featured',
+    'content': 'content',
+    # Read with a query of its own
+    'tags': None,
+}
+
+DEFAULT_FIELDS = ('id', 'title', 'slug', 'date', 'url')
+
+CONTENT_TYPE = 'application/json'
+
+
+class BadRequest(Exception):
+
+    """Raised for the parameters the API cannot serve."""
+
+
+def bad_request(error):
+    return HttpResponse(json.dumps({'error': six.text_type(error)}),
+                        content_type=CONTENT_TYPE, status=400)
+
+
+def get_fields(request):
+    """Returns the fields requested."""
+    fields = request.GET.get('fields')
+
+    if not fields:
+        return DEFAULT_FIELDS
+
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in FIELDS]
+
+    if unknown:
+        raise BadRequest('Unknown fields: {0}'.format(', '.join(unknown)))
+
+    return fields
+
+
+def get_limit(request, blog):
+    """Returns the number of posts requested, capped at
+    `WAGTAILBASE_MAX_ITEMS_PER_PAGE`."""
+    try:
+        limit = int(request.GET.get('limit') or blog.get_items_per_page())
+    except ValueError:
+        raise BadRequest('Invalid limit')
+
+    return max(1, min(limit, getattr(
+        settings, 'WAGTAILBASE_MAX_ITEMS_PER_PAGE', 100)))
+
+
+def encode_cursor(post):
+    return force_text(urlsafe_base64_encode(force_bytes(
+        '{0}:{1}'.format(post['date'].isoformat(), post['id']))))
+
+
+def decode_cursor(cursor):
+    """Returns the date and the id of the post of the cursor."""
+    try:
+        value, pk = force_text(urlsafe_base64_decode(cursor)).split(':')
+        return datetime.strptime(value, '%Y-%m-%d').date(), int(pk)
+    except (TypeError, ValueError):
+        raise BadRequest('Invalid cursor')
+
+
+def get_etag(request):
+    """Returns the validator of the response to the request, that changes
+    when anything is published or unpublished."""
+    return 'W/"{0}-{1}"'.format(
+        cache.get_generation(LISTINGS),
+        hashlib.md5(force_bytes(request.get_full_path())).hexdigest())
+
+
+def not_modified(request, etag):
+    """Returns a 304 response if the client has the current version of the
+    response, otherwise None."""
+    if etag in [value.strip() for value in request.META.get(
+            'HTTP_IF_NONE_MATCH', '').split(',')]:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+
+def get_tags(post_ids):
+    """Returns the tag names of the posts, in a single query."""
+    from wagtailbase.models import BlogPostTag
+
+    tags = dict((post_id, []) for post_id in post_ids)
+
+    for post_id, name in BlogPostTag.objects.filter(
+            content_object__in=post_ids).values_list(
+                'content_object_id', 'tag__name').order_by('tag__name'):
+        tags[post_id].append(name)
+
+    return tags
+
+
+def serialize(request, posts, fields):
+    """Yields the dictionaries of the posts, read as values, with the
+    requested fields only."""
+    richtext = request.GET.get('richtext') == 'html'
+    site = getattr(request, 'site', None)
+    tags = {}
+
+    if 'tags' in fields:
+        tags = get_tags([post['id'] for post in posts])
+
+    for post in posts:
+        item = {}
+
+        for field in fields:
+            if field == 'url':
+                url = get_page_url_by_id(post['id'], site)
+                item[field] = url and request.build_absolute_uri(url)
+            elif field == 'tags':
+                item[field] = tags[post['id']]
+            elif field == 'date':
+                item[field] = post['date'].isoformat()
+            elif field == 'content' and richtext:
+                item[field] = expand_db_html(post['content'])
+            else:
+                item[field] = post[FIELDS[field]]
+
+        yield item
+
+
+def get_columns(fields):
+    """Returns the columns to read for the fields. The date and the id are
+    always read, for the cursors."""
+    return sorted(set(['id', 'date']) | set(
+        FIELDS[field] for field in fields if FIELDS[field]))
+
+
+def get_next_url(request, cursor):
+    """Returns the url of the page after the cursor."""
+    query = request.GET.copy()
+    query['cursor'] = cursor
+
+    return '{0}?{1}'.format(request.path, query.urlencode())
+
+
+def stream(request, posts, fields, next_url):
+    """Yields the JSON of the page of posts, a post at a time."""
+    yield '{"results": ['
+
+    for i, item in enumerate(serialize(request, posts, fields)):
+        yield (', ' if i else '') + json.dumps(item)
+
+    yield '], "next": {0}}}'.format(json.dumps(next_url))
+
+
+def listing(request, blog, posts):
+    """Returns the JSON response of a page of the posts."""
+    etag = get_etag(request)
+    response = not_modified(request, etag)
+
+    if response is not None:
+        return response
+
+    try:
+        fields = get_fields(request)
+        limit = get_limit(request, blog)
+        cursor = request.GET.get('cursor')
+
+        if cursor:
+            date, pk = decode_cursor(cursor)
+            posts = posts.filter(Q(date__lt=date) | Q(date=date, id__lt=pk))
+    except BadRequest as e:
+        return bad_request(e)
+
+    posts = list(posts.order_by('-date', '-id').values(
+        *get_columns(fields))[:limit + 1])
+
+    next_url = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_url = get_next_url(request, encode_cursor(posts[-1]))
+
+    response = StreamingHttpResponse(
+        stream(request, posts, fields, next_url), content_type=CONTENT_TYPE)
+    response['ETag'] = etag
+
+    return response
+
+
+def detail(request, posts, slug):
+    """Returns the JSON response of the post with the given slug, or None if
+    there is none."""
+    etag = get_etag(request)
+    response = not_modified(request, etag)
+
+    if response is not None:
+        return response
+
+    try:
+        fields = get_fields(request)
+    except BadRequest as e:
+        return bad_request(e)
+
+    posts = list(posts.filter(slug=slug).values(*get_columns(fields))[:1])
+
+    if not posts:
+        return None
+
+    post = next(serialize(request, posts, fields))
+    response = HttpResponse(json.dumps(post), content_type=CONTENT_TYPE)
+    response['ETag'] = etag
+
+    return response
+
+
+def tag_completions(request, blog):
+    """Returns the JSON response of the tags of the blog that start with the
+    requested prefix."""
+    etag = get_etag(request)
+    response = not_modified(request, etag)
+
+    if response is not None:
+        return response
+
+    prefix = request.GET.get('prefix', '').strip()
+
+    if not prefix:
+        return bad_request('Missing prefix')
+
+    results = [{'name': tag['name'], 'count': tag['post_count']}
+               for tag in tagcloud.complete(blog.pk, prefix)]
+
+    response = HttpResponse(json.dumps({'results': results}),
+                            content_type=CONTENT_TYPE)
+    response['ETag'] = etag
+
+    return response
@@ -0,0 +1,100 @@
+"""
+Streamed archive of every post of a blog, served by the `archive/` route of
+`BlogIndexPage`.
+
+The archive lists the posts by year and month, however many there are,
+without holding them in memory: the posts are read in chunks of
+`WAGTAILBASE_ARCHIVE_CHUNK_SIZE`, as `values_list` rows of only the id, the
+title and the date, each chunk seeking on `(date, id)` from the last post of
+the previous one. The page is sent as it is rendered, the page around the
+archive first, then each month as soon as its last post is read.
+
+The archive is not cached, and `ESIMiddleware` does not process streamed
+responses, so with `WAGTAILBASE_ESI = True` it needs an ESI proxy.
+"""
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
+
+from wagtailbase.pageurls import get_page_url_by_id
+
+from datetime import date
+
+# Where the months are written in the archive template
+MARKER = '<!-- wagtailbase:archive -->'
+
+TEMPLATE = 'wagtailbase/blog_archive.html'
+MONTH_TEMPLATE = 'wagtailbase/includes/blog_archive_month.html'
+
+
+def get_chunk_size():
+    return getattr(settings, 'WAGTAILBASE_ARCHIVE_CHUNK_SIZE', 500)
+
+
+def iter_posts(posts, chunk_size=None):
+    """Yields the id, title and date of the posts, newest first, reading them
+    in chunks."""
+    chunk_size = chunk_size or get_chunk_size()
+    posts = posts.order_by('-date', '-id')
+    last = None
+
+    while True:
+        chunk = posts
+
+        if last is not None:
+            chunk = chunk.filter(Q(date__lt=last[2]) |
+                                 Q(date=last[2], id__lt=last[0]))
+
+        chunk = list(chunk.values_list('id', 'title', 'date')[:chunk_size])
+
+        for post in chunk:
+            yield post
+
+        if len(chunk) < chunk_size:
+            return
+
+        last = chunk[-1]
+
+
+def iter_months(posts, site=None):
+    """Yields the month and the posts of every month with posts, newest
+    first. Only the posts of one month are held at a time."""
+    month, items = None, []
+
+    for pk, title, day in iter_posts(posts):
+        key = date(day.year, day.month, 1)
+
+        if key != month:
+            if items:
+                yield month, items
+            month, items = key, []
+
+        items.append({'id': pk, 'title': title, 'date': day,
+                      'url': get_page_url_by_id(pk, site)})
+
+    if items:
+        yield month, items
+
+
+def stream(request, blog, posts):
+    """Yields the HTML of the archive, a month at a time."""
+    page = render_to_string(TEMPLATE, {'self': blog}, request=request)
+    head, tail = page.split(MARKER, 1)
+
+    yield head
+
+    template = get_template(MONTH_TEMPLATE)
+    year = None
+
+    for month, items in iter_months(posts, getattr(request, 'site', None)):
+        yield template.render({'month': month, 'posts': items,
+                               'new_year': month.year != year})
+        year = month.year
+
+    yield tail
+
+
+def archive(request, blog, posts):
+    """Returns the streamed response of the archive of the posts."""
+    return StreamingHttpResponse(stream(request, blog, posts))
@@ -0,0 +1,156 @@
+"""
+Directory of the authors of each blog.
+
+`BlogAuthor` keeps, for every blog and every owner of its live posts, the
+author slug used by the `author` route, the display name, the number of
+posts and the date of the latest one. When a post is published or
+unpublished only the row of its owner is counted again, in the blogs the
+post belongs to; renaming a user updates the slug and name of their rows.
+Run `python manage.py wagtailbase_authors` to rebuild the whole table, e.g.
+after importing posts or changing the owner of published posts.
+
+The `authors` route of `BlogIndexPage`, the `blog_authors` tag and the
+bylines of the posts read the directory of the blog from the cache, as a
+single entry per blog, so they never look up the users of the posts.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AbstractBaseUser
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from wagtail.wagtailcore.signals import page_published, page_unpublished
+
+from wagtailbase import cache
+from wagtailbase.util import get_blogs, unslugify, update_rows
+
+DIRECTORY = 'author-directory'
+
+
+def get_timeout():
+    return getattr(settings, 'WAGTAILBASE_AUTHOR_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_name(user):
+    """Returns the author slug and the display name of the user."""
+    slug = user.get_username()
+
+    return slug, user.get_full_name() or unslugify(slug)
+
+
+def get_names(user_ids):
+    """Returns the author slugs and the display names of the users, in a
+    single query."""
+    user_model = get_user_model()
+
+    return dict((user.pk, get_name(user)) for user in
+                user_model._default_manager.filter(pk__in=list(user_ids)))
+
+
+def count(blog_path, user_ids=None, exclude=None):
+    """Returns the number of live posts and the date of the latest one of
+    each author of the blog, or of the given authors only."""
+    from wagtailbase.models import BlogPost
+
+    posts = BlogPost.objects.filter(live=True, path__startswith=blog_path,
+                                    owner__isnull=False)
+
+    if user_ids is not None:
+        posts = posts.filter(owner__in=list(user_ids))
+
+    if exclude is not None:
+        posts = posts.exclude(pk=exclude)
+
+    return dict((row['owner'], (row['count'], row['latest']))
+                for row in posts.order_by().values('owner').annotate(
+                    count=Count('pk'), latest=Max('date')))
+
+
+def update(blogs, user_ids=None, exclude=None):
+    """Counts again the posts of the given authors, or of all the authors,
+    in the given blogs, as (id, path) pairs."""
+    from wagtailbase.models import BlogAuthor
+
+    counts = dict((blog_id, count(path, user_ids, exclude))
+                  for blog_id, path in blogs)
+    names = get_names(set(
+        user_id for authors in counts.values() for user_id in authors))
+
+    with transaction.atomic():
+        for blog_id, authors in counts.items():
+            update_rows(BlogAuthor, blog_id, 'user', dict(
+                (user_id, {'slug': names[user_id][0],
+                           'name': names[user_id][1],
+                           'post_count': post_count, 'latest_date': latest})
+                for user_id, (post_count, latest) in authors.items()),
+                user_ids)
+
+    cache.bump_generation(DIRECTORY)
+
+
+def rebuild():
+    """Builds the directories of every blog. Returns the number of blogs."""
+    from wagtailbase.models import BlogIndexPage
+
+    blogs = list(BlogIndexPage.objects.values_list('pk', 'path'))
+    update(blogs)
+
+    return len(blogs)
+
+
+def _build_directory(blog_id):
+    from wagtailbase.models import BlogAuthor
+
+    return list(BlogAuthor.objects.filter(blog=blog_id).order_by(
+        'name', 'slug').values(
+            'user_id', 'slug', 'name', 'post_count', 'latest_date'))
+
+
+def get_directory(blog_id):
+    """Returns the authors of the blog, by name, as dictionaries of their
+    `user_id`, `slug`, `name`, `post_count` and `latest_date`."""
+    return cache.get(DIRECTORY, (blog_id,),
+                     lambda: _build_directory(blog_id), get_timeout())
+
+
+def get_author(blog_id, user_id):
+    """Returns the directory entry of the user in the blog, or None."""
+    for author in get_directory(blog_id):
+        if author['user_id'] == user_id:
+            return author
+
+    return None
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def update_published_post(sender, instance, **kwargs):
+    from wagtailbase.models import BlogPost
+
+    if not isinstance(instance, BlogPost) or instance.owner_id is None:
+        return
+
+    # Posts are unpublished in memory only before they are deleted
+    update(get_blogs(instance), [instance.owner_id],
+           exclude=None if instance.live else instance.pk)
+
+
+@receiver(post_save)
+def update_renamed_author(sender, instance, **kwargs):
+    from wagtailbase.models import BlogAuthor
+
+    if not issubclass(sender, AbstractBaseUser) or kwargs.get('created'):
+        return
+
+    # e.g. the last_login update
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not set(update_fields) - set(['last_login']):
+        return
+
+    slug, name = get_name(instance)
+
+    if BlogAuthor.objects.filter(user=instance).exclude(
+            slug=slug, name=name).update(slug=slug, name=name):
+        cache.bump_generation(DIRECTORY)
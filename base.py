@@ -3,6 +3,7 @@ from django.db.models.signals import post_init
 
 from django.conf import settings
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.http import Http404
 from django.shortcuts import render
 from django.template.loader import select_template
 
@@ -18,10 +19,27 @@ from wagtail.wagtailcore.fields import RichTextField
 
 from wagtail.wagtailsearch import index
 
+from wagtailbase import cache, profiling
+from wagtailbase.instrumentation import instrumented
+from wagtailbase.pageurls import get_page_url, get_page_url_by_id
+from wagtailbase.purging import record
+from wagtailbase.util import specific_pages
+
 import logging
 
 logger = logging.getLogger(__name__)
 
+TEMPLATES = 'templates'
+TEMPLATE_TIMEOUT = 60 * 60
+
+FRAGMENT_PARAMETER = 'fragment'
+
+
+def is_fragment(request):
+    """Returns True if the request is for the fragment variant of a
+    listing."""
+    return bool(request.GET.get(FRAGMENT_PARAMETER))
+
 
 class AbstractLinkField(models.Model):
 
@@ -40,8 +58,10 @@ class AbstractLinkField(models.Model):
 
     @property
     def link(self):
-        if self.link_page:
-            return self.link_page.url
+        if self.link_page_id:
+            # Looked up by id, without loading the page
+            return (get_page_url_by_id(self.link_page_id) or
+                    self.link_page.url)
         elif self.link_document:
             return self.link_document.url
         else:
@@ -106,38 +126,41 @@ class BasePage(Page):
         """Registers a new kind of subpage that this page can be a parent """
         cls.subpage_types = cls.subpage_types + [new_page_type]
 
+    @profiling.profiled
+    def serve(self, request, *args, **kwargs):
+        """Serves the page, profiling the requests that ask for it."""
+        return super(BasePage, self).serve(request, *args, **kwargs)
+
     def is_current_or_ancestor(self, page):
         """Returns True if the given page is the current page or is an ancestor
-        of the current page."""
-        page = page.specific
-
-        if self.id == page.id:
+        of the current page. Ancestors are found from the tree path, without
+        fetching them, and only wagtailbase pages count as ancestors, e.g. not
+        the root page."""
+        if self.pk == page.pk:
             return True
 
-        parent = self.get_parent().specific
-
-        if parent and isinstance(
-                parent, BasePage) and parent.is_current_or_ancestor(page):
-            return True
-
-        return False
+        return (self.path.startswith(page.path) and
+                issubclass(page.specific_class, BasePage))
 
     def get_template(self, request, *args, **kwargs):
         """Checks if there is a template with the page path, and uses that
-        instead of using the generic page type template."""
-        page_template = '{0}.html'.format(self.url.strip('/'))
+        instead of using the generic page type template. The resolution is
+        kept in the in-process cache, templates only change on deploys."""
+        page_template = '{0}.html'.format(get_page_url(self).strip('/'))
         logger.debug('get_template: page_template: {0}'.format(page_template))
         default_template = super(BasePage, self).get_template(request,
                                                               *args, **kwargs)
         logger.debug('get_template: default_template:{0}'.format(
             default_template))
 
-        template = select_template([page_template, default_template])
+        template_name = cache.get(
+            TEMPLATES, (page_template, default_template),
+            lambda: select_template(
+                [page_template, default_template]).template.name,
+            TEMPLATE_TIMEOUT, shared=False)
 
-        print template.template.name
-
-        logger.debug('get_template: {0}'.format(template.template.name))
-        return template.template.name
+        logger.debug('get_template: {0}'.format(template_name))
+        return template_name
 
 
 class BaseIndexPage(RoutablePageMixin, BasePage):
@@ -145,6 +168,10 @@ class BaseIndexPage(RoutablePageMixin, BasePage):
     """Base class for index pages. Index pages are pages that will have
     children pages."""
     introduction = RichTextField(blank=True)
+    items_per_page = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text='Number of items in each page of the listing, the site '
+                  'default if not set')
 
     search_fields = Page.search_fields + (  # Inherit search_fields from Page
         index.SearchField('introduction'),
@@ -152,29 +179,74 @@ class BaseIndexPage(RoutablePageMixin, BasePage):
 
     is_abstract = True
 
+    # Template of the items of the listing, rendered on its own by the
+    # fragment variant of the listing routes
+    fragment_template = 'wagtailbase/includes/index_page_children_items.html'
+
+    # Whether the listing shows the specific instances of the children, for
+    # templates that read the fields of their page types, with one query
+    # per page type
+    specific_listing = False
+
     @property
     def children(self):
         """Returns a list of the pages that are children of this page."""
         return self.get_children().filter(live=True)
 
-    @route(r'^$')
-    def serve_listing(self, request):
-        """Renders the children pages."""
-        pages = self.children
-
-        # Pagination
+    @property
+    def specific_children(self):
+        """Returns the specific instances of the children of this page, with
+        one query per page type."""
+        return specific_pages(self.children)
+
+    def get_items_per_page(self):
+        """Returns the page size of the listing, capped at
+        `WAGTAILBASE_MAX_ITEMS_PER_PAGE`."""
+        return min(self.items_per_page or settings.ITEMS_PER_PAGE,
+                   getattr(settings, 'WAGTAILBASE_MAX_ITEMS_PER_PAGE', 100))
+
+    def _paginate(self, request, items):
+        """Paginates the items. Fragments of pages that do not exist are not
+        found, rather than the last page again."""
         page = request.GET.get('page')
-        paginator = Paginator(pages, settings.ITEMS_PER_PAGE)
+        paginator = Paginator(items, self.get_items_per_page())
 
         try:
-            pages = paginator.page(page)
+            return paginator.page(page)
         except EmptyPage:
-            pages = paginator.page(paginator.num_pages)
+            if is_fragment(request):
+                raise Http404('No more items')
+            return paginator.page(paginator.num_pages)
         except PageNotAnInteger:
-            pages = paginator.page(1)
+            return paginator.page(1)
+
+    def render_listing(self, request, context):
+        """Renders the listing, or only its items and the cursor of the next
+        page for the fragment variant, `?fragment=1`."""
+        if is_fragment(request):
+            return render(request, self.fragment_template,
+                          dict(context, fragment=True))
+
+        return render(request, self.get_template(request), context)
+
+    def serve_preview(self, request, mode_name):
+        # Flags the request, so that previews are not served from, or stored
+        # in, the listings cache
+        request.is_preview = True
+        return super(BaseIndexPage, self).serve_preview(request, mode_name)
+
+    @route(r'^$')
+    @profiling.profiled
+    @instrumented('route.serve_listing')
+    def serve_listing(self, request):
+        """Renders the children pages."""
+        record('children', self.path)
+        pages = self._paginate(request, self.children)
+
+        if self.specific_listing:
+            pages.object_list = specific_pages(pages.object_list)
 
-        return render(request, self.get_template(request),
-                      {'self': self, 'pages': pages})
+        return self.render_listing(request, {'self': self, 'pages': pages})
 
 
 class BaseRichTextPage(BasePage):
@@ -0,0 +1,308 @@
+"""
+End-to-end load harness for a synthetic wagtailbase site.
+
+`run` builds a synthetic site (see `wagtailbase.benchmarks.synthetic`) in the
+current database and drives it through the Django WSGI application from a
+pool of threads, with no web server or network in between. Requests are
+drawn from a weighted mix of the kinds of pages a wagtailbase site serves:
+the home page, deep rich text pages, index and blog listings, paged archives,
+tag, author and date listings and blog posts.
+
+The report has the throughput and the p50/p95/p99 latencies of the whole run
+and of every kind of page. It is a plain dict, so it can be dumped as JSON
+and compared between commits with `compare`.
+
+Requests run in threads of a single process, so the throughput is bound by
+the GIL; the numbers are meant to be compared with each other, on the same
+machine, rather than read as the capacity of a production deployment.
+"""
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
+from django.utils.six import BytesIO
+from django.utils.six.moves import queue
+
+from taggit.models import Tag
+
+from wagtailbase import cache
+from wagtailbase.benchmarks import synthetic
+from wagtailbase.models import BlogPost, BlogPostTag
+
+import math
+import platform
+import random
+import threading
+import timeit
+
+DEFAULT_SIZES = {
+    'depth': 8,
+    'width': 200,
+    'posts': 5000,
+    'tags': 100,
+    'authors': 20,
+    'attachments': 1,
+}
+
+# Relative weight of every kind of page in the traffic mix
+DEFAULT_MIX = {
+    'home': 20,
+    'deep_page': 15,
+    'index_listing': 5,
+    'blog_listing': 15,
+    'blog_archive_page': 10,
+    'blog_post': 20,
+    'tag': 6,
+    'author': 5,
+    'date': 4,
+}
+
+PERCENTILES = (50, 95, 99)
+
+
+def build_site(sizes):
+    """Builds the synthetic site, returns the urls of every kind of page."""
+    home = synthetic.create_home()
+    image = synthetic.create_image()
+    deep = synthetic.build_deep_tree(home, sizes['depth'])
+    wide = synthetic.build_wide_index(home, sizes['width'])
+    blog = synthetic.build_blog(home, sizes['posts'], tags=sizes['tags'],
+                                authors=sizes['authors'],
+                                attachments=sizes['attachments'],
+                                image=image)
+
+    posts = BlogPost.objects.filter(
+        path__startswith=blog.path).order_by('-date')
+    blog_url = blog.url
+    pages = max(1, sizes['posts'] // 10)
+    tags = Tag.objects.filter(id__in=BlogPostTag.objects.filter(
+        content_object__path__startswith=blog.path).values('tag_id')
+    ).values_list('name', flat=True)
+    authors = posts.values_list(
+        'owner__username', flat=True).order_by().distinct()
+    years = sorted(set(d.year for d in posts.values_list('date', flat=True)
+                       .order_by().distinct()))
+
+    return {
+        'home': [home.url],
+        'deep_page': [deep.url, deep.get_parent().url],
+        'index_listing': [wide.url, '{0}?page=2'.format(wide.url)],
+        'blog_listing': [blog_url],
+        'blog_archive_page': ['{0}?page={1}'.format(blog_url, page)
+                              for page in range(2, min(pages, 50) + 1)],
+        'blog_post': [post.url for post in posts[:200]],
+        'tag': ['{0}tag/{1}/'.format(blog_url,
+                                     name.replace(' ', '_').lower())
+                for name in tags],
+        'author': ['{0}author/{1}/'.format(blog_url, username)
+                   for username in authors],
+        'date': ['{0}date/{1}/'.format(blog_url, year) for year in years],
+    }
+
+
+def schedule(urls, mix, count, seed=0):
+    """Returns a list of count (kind, url) requests, drawn from the urls of
+    every kind of page in the proportions of the mix. The same seed always
+    gives the same schedule, so runs are comparable. Raises ValueError if
+    no kind of page with urls has a weight."""
+    rng = random.Random(seed)
+    kinds = [(kind, weight) for kind, weight in sorted(mix.items())
+             if weight and urls.get(kind)]
+
+    if not kinds:
+        raise ValueError('No kind of page of the mix has a weight and urls')
+
+    total = sum(weight for kind, weight in kinds)
+    requests = []
+
+    for i in range(count):
+        point = rng.uniform(0, total)
+        for kind, weight in kinds:
+            point -= weight
+            if point <= 0:
+                break
+
+        requests.append((kind, rng.choice(urls[kind])))
+
+    return requests
+
+
+def _environ(url, hostname='localhost', port=80):
+    path, _, query = url.partition('?')
+
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SCRIPT_NAME': '',
+        'SERVER_NAME': hostname,
+        'SERVER_PORT': str(port),
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': hostname,
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': BytesIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+def request(application, url):
+    """Sends a GET request for the url to the WSGI application, consuming
+    the whole response. Returns the status code."""
+    status = []
+
+    def start_response(status_line, headers, exc_info=None):
+        status.append(int(status_line.split(' ', 1)[0]))
+
+    response = application(_environ(url), start_response)
+    try:
+        for chunk in response:
+            pass
+    finally:
+        if hasattr(response, 'close'):
+            response.close()
+
+    return status[0]
+
+
+def _worker(application, requests, results):
+    try:
+        while True:
+            try:
+                kind, url = requests.get_nowait()
+            except queue.Empty:
+                return
+
+            start = timeit.default_timer()
+            try:
+                status = request(application, url)
+            except Exception:
+                status = None
+            elapsed = (timeit.default_timer() - start) * 1000
+
+            results.append((kind, url, status, elapsed))
+    finally:
+        connections.close_all()
+
+
+def drive(application, requests, concurrency):
+    """Sends the (kind, url) requests to the application from concurrency
+    threads. Returns the (kind, url, status, milliseconds) of every request,
+    and the wall time of the whole run in seconds."""
+    pending = queue.Queue()
+    for item in requests:
+        pending.put(item)
+
+    results = []
+    threads = [threading.Thread(target=_worker,
+                                args=(application, pending, results))
+               for i in range(concurrency)]
+
+    start = timeit.default_timer()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results, timeit.default_timer() - start
+
+
+def percentile(values, percent):
+    """Returns the nearest rank percentile of the sorted values."""
+    if not values:
+        return None
+
+    rank = int(math.ceil(percent / 100.0 * len(values))) - 1
+
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+def summarise(results, elapsed):
+    """Returns the request count, errors, throughput and latencies of the
+    (kind, url, status, milliseconds) results."""
+    timings = sorted(result[3] for result in results)
+    errors = [result for result in results
+              if result[2] is None or result[2] >= 400]
+    summary = {
+        'requests': len(results),
+        'errors': len(errors),
+        'rps': round(len(results) / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(timings) / len(timings), 3) if timings else None,
+        'max_ms': round(timings[-1], 3) if timings else None,
+    }
+
+    for percent in PERCENTILES:
+        value = percentile(timings, percent)
+        summary['p{0}_ms'.format(percent)] = (
+            round(value, 3) if value is not None else None)
+
+    return summary
+
+
+def run(sizes=None, mix=None, requests=2000, concurrency=8, warmup=200,
+        seed=0):
+    """Builds the synthetic site, warms it up and runs the load. Returns a
+    dict with the run metadata, the summary of the whole run and the summary
+    of every kind of page. The wagtailbase caches are kept in a private
+    cache for the run, see `synthetic.private_cache`."""
+    with synthetic.private_cache():
+        sizes = dict(DEFAULT_SIZES, **(sizes or {}))
+        mix = dict(DEFAULT_MIX, **(mix or {}))
+        urls = build_site(sizes)
+        application = WSGIHandler()
+
+        cache.clear()
+        drive(application, schedule(urls, mix, warmup, seed=seed + 1),
+              concurrency)
+
+        results, elapsed = drive(
+            application, schedule(urls, mix, requests, seed=seed), concurrency)
+
+        kinds = {}
+        for result in results:
+            kinds.setdefault(result[0], []).append(result)
+
+        return {
+            'meta': {
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'sizes': sizes,
+                'mix': mix,
+                'requests': requests,
+                'concurrency': concurrency,
+                'warmup': warmup,
+                'seed': seed,
+                'elapsed_s': round(elapsed, 3),
+            },
+            'total': summarise(results, elapsed),
+            'results': dict((kind, summarise(kind_results, elapsed))
+                            for kind, kind_results in kinds.items()),
+        }
+
+
+def compare(baseline, current, threshold=1.2):
+    """Compares two run reports. Returns a list of (key, metric, baseline
+    value, current value) for every p95 latency that grew, and every
+    throughput that fell, by more than the threshold ratio, and for every
+    new error."""
+    regressions = []
+    pairs = [('total', baseline['total'], current['total'])] + [
+        (kind, baseline['results'][kind], result)
+        for kind, result in sorted(current['results'].items())
+        if kind in baseline['results']]
+
+    for key, before, after in pairs:
+        if after['errors'] > before['errors']:
+            regressions.append(
+                (key, 'errors', before['errors'], after['errors']))
+
+        if after['p95_ms'] > before['p95_ms'] * threshold:
+            regressions.append(
+                (key, 'p95_ms', before['p95_ms'], after['p95_ms']))
+
+    if current['total']['rps'] * threshold < baseline['total']['rps']:
+        regressions.append(('total', 'rps', baseline['total']['rps'],
+                            current['total']['rps']))
+
+    return regressions
@@ -0,0 +1,184 @@
+"""
+Micro-benchmarks for the wagtailbase template tags and page helpers.
+
+`run` builds a synthetic site (a deep hierarchy, a wide index page and a big
+blog, see `wagtailbase.benchmarks.synthetic`) in the current database and
+measures the wall time and the number of queries of every tag in
+`wagtailbase_tags` and of the page helpers, in each scenario. The results are
+plain dicts, so they can be dumped as JSON and compared between commits with
+`compare`.
+"""
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.template import Context, Template
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from wagtail.wagtailcore.models import Site
+
+from wagtailbase import cache
+from wagtailbase.benchmarks import synthetic
+from wagtailbase.models import BlogPost
+
+import platform
+import timeit
+
+DEFAULT_SIZES = {
+    'depth': 12,
+    'width': 500,
+    'posts': 50000,
+    'tags': 200,
+    'authors': 20,
+    'attachments': 2,
+}
+
+# (name, template source) for every tag and filter in wagtailbase_tags
+TAGS = (
+    ('breadcrumbs', '{% breadcrumbs root page %}'),
+    ('are_comments_allowed', '{% are_comments_allowed as value %}'),
+    ('get_disqus_shortname', '{% get_disqus_shortname as value %}'),
+    ('get_request_parameters',
+     '{% get_request_parameters exclude="page" as value %}'),
+    ('get_site_root', '{% get_site_root as value %}'),
+    ('has_local_menu', '{% has_local_menu page as value %}'),
+    ('is_current_or_ancestor', '{{ root|is_current_or_ancestor:page }}'),
+    ('latest_blog_post', '{% latest_blog_post %}'),
+    ('latest_blog_post_parent', '{% latest_blog_post parent=blog %}'),
+    ('featured_blog_post', '{% featured_blog_post %}'),
+    ('featured_blog_post_parent', '{% featured_blog_post parent=blog %}'),
+    ('latest_n_blog_posts', '{% latest_n_blog_posts 5 %}'),
+    ('local_menu', '{% local_menu current_page=page %}'),
+    ('main_menu', '{% main_menu root=root current_page=page %}'),
+    ('slugurl', '{% slugurl "deep-page" %}'),
+    ('archiveurl', '{% archiveurl blog post.owner %}'),
+    ('unslugify', '{{ "some_author"|unslugify }}'),
+    ('get_item', '{{ params|get_item:"page" }}'),
+)
+
+# (name, function of the scenario context) for the page helpers
+HELPERS = (
+    ('is_current_or_ancestor',
+     lambda context: context['page'].is_current_or_ancestor(context['root'])),
+    ('index_page', lambda context: context['page'].index_page),
+    ('blog_index', lambda context: context['post'].blog_index),
+    ('active_months', lambda context: context['blog'].active_months),
+)
+
+
+def build_site(sizes):
+    """Builds the synthetic site, returns the context of every scenario."""
+    home = synthetic.create_home()
+    image = synthetic.create_image()
+    deep = synthetic.build_deep_tree(home, sizes['depth'])
+    wide = synthetic.build_wide_index(home, sizes['width'])
+    blog = synthetic.build_blog(home, sizes['posts'], tags=sizes['tags'],
+                                authors=sizes['authors'],
+                                attachments=sizes['attachments'],
+                                image=image)
+    post = BlogPost.objects.filter(
+        path__startswith=blog.path).order_by('-date').first()
+    wide_child = wide.get_children().type(
+        synthetic.RichTextPage).first().specific
+
+    common = {'home': home, 'blog': blog, 'post': post,
+              'params': {'page': '2'}}
+
+    return {
+        'deep': dict(common, root=home, page=deep),
+        'wide': dict(common, root=wide, page=wide_child),
+        'blog': dict(common, root=home, page=post),
+    }
+
+
+def _request():
+    request = RequestFactory().get('/', {'page': '2', 'tag': 'news'})
+    request.site = Site.objects.get(is_default_site=True)
+    request.user = AnonymousUser()
+
+    return request
+
+
+def measure(func, repeat):
+    """Calls func once with a cold cache, and then repeat times more. Returns
+    the query counts of the cold and the first warm call, and the timings of
+    the warm calls in milliseconds."""
+    cache.clear()
+
+    with CaptureQueriesContext(connection) as cold_queries:
+        func()
+
+    with CaptureQueriesContext(connection) as warm_queries:
+        func()
+
+    timings = []
+    for i in range(repeat):
+        start = timeit.default_timer()
+        func()
+        timings.append((timeit.default_timer() - start) * 1000)
+
+    timings.sort()
+
+    return {
+        'queries': len(cold_queries),
+        'warm_queries': len(warm_queries),
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(timings[len(timings) // 2], 3),
+        'max_ms': round(timings[-1], 3),
+    }
+
+
+def run(sizes=None, repeat=5):
+    """Builds the synthetic site and benchmarks every tag and helper in each
+    scenario. Returns a dict with the run metadata and the results, keyed by
+    scenario/tag or scenario/helper name. The wagtailbase caches are kept in
+    a private cache for the run, see `synthetic.private_cache`."""
+    with synthetic.private_cache():
+        sizes = dict(DEFAULT_SIZES, **(sizes or {}))
+        scenarios = build_site(sizes)
+        results = {}
+
+        for scenario, values in sorted(scenarios.items()):
+            for name, source in TAGS:
+                template = Template('{% load wagtailbase_tags %}' + source)
+                context = dict(values, request=_request())
+
+                results['{0}/tag/{1}'.format(scenario, name)] = measure(
+                    lambda: template.render(Context(context)), repeat)
+
+            for name, helper in HELPERS:
+                results['{0}/helper/{1}'.format(scenario, name)] = measure(
+                    lambda: helper(values), repeat)
+
+        return {
+            'meta': {
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'sizes': sizes,
+                'repeat': repeat,
+            },
+            'results': results,
+        }
+
+
+def compare(baseline, current, threshold=1.2):
+    """Compares two run results. Returns a list of (key, metric, baseline
+    value, current value) for every query count that went up and every
+    median time that grew by more than the threshold ratio."""
+    regressions = []
+
+    for key, result in sorted(current['results'].items()):
+        previous = baseline['results'].get(key)
+        if previous is None:
+            continue
+
+        for metric in ('queries', 'warm_queries'):
+            if result[metric] > previous[metric]:
+                regressions.append(
+                    (key, metric, previous[metric], result[metric]))
+
+        if result['median_ms'] > previous['median_ms'] * threshold:
+            regressions.append(
+                (key, 'median_ms', previous['median_ms'],
+                 result['median_ms']))
+
+    return regressions
@@ -0,0 +1,247 @@
+"""
+Builders for synthetic wagtailbase sites, used by the benchmarks and by the
+query budget tests.
+
+Pages are inserted in bulk, one INSERT per table of the page model hierarchy
+for each batch, instead of going through `add_child` for every page. This
+keeps building a blog with tens of thousands of posts practical, but it also
+skips the page save signals, so nothing is added to the search index.
+
+`private_cache` points the wagtailbase caches to an in-memory cache of their
+own, so that the benchmarks can clear them without clearing the shared cache
+of the project.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import AutoField, F
+from django.test.utils import override_settings
+from django.utils.six import BytesIO
+
+from taggit.models import Tag
+
+from wagtail.wagtailcore.models import Page, Site
+from wagtail.wagtailimages.models import get_image_model
+
+from wagtailbase.models import (BlogIndexPage, BlogPost, BlogPostAttachment,
+                                BlogPostTag, HomePage, IndexPage,
+                                RichTextPage)
+
+CONTENT = ('<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed '
+           'do eiusmod tempor incididunt ut labore et dolore magna aliqua. '
+           'Ut enim ad minim veniam, quis nostrud exercitation ullamco.</p>')
+
+CACHE_ALIAS = 'wagtailbase-synthetic'
+
+
+def private_cache():
+    """Returns a settings override that points the wagtailbase caches to a
+    private in-memory cache, usable as a context manager."""
+    caches = dict(settings.CACHES, **{CACHE_ALIAS: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': CACHE_ALIAS,
+    }})
+
+    return override_settings(CACHES=caches, WAGTAILBASE_CACHE=CACHE_ALIAS)
+
+
+def _insert(model, objs, using):
+    """Inserts the objects in the table of the given model only, i.e.
+    without the tables of the parent models."""
+    fields = [field for field in model._meta.local_concrete_fields
+              if not isinstance(field, AutoField)]
+    batch_size = max(
+        1, connections[using].ops.bulk_batch_size(fields, objs) or len(objs))
+
+    for start in range(0, len(objs), batch_size):
+        model._base_manager._insert(objs[start:start + batch_size],
+                                    fields=fields, using=using)
+
+
+def add_children(parent, model, items, using='default'):
+    """Appends pages of the given model as children of the parent page. Each
+    item is a dict with the field values of one page, it must include at
+    least the title and slug. Returns the ids of the new pages, in order."""
+    if not items:
+        return []
+
+    content_type = ContentType.objects.get_for_model(model)
+    last_child = parent.get_last_child()
+    position = Page._str2int(
+        last_child.path[-Page.steplen:]) if last_child else 0
+
+    pages = []
+    for offset, values in enumerate(items, 1):
+        values = dict(values)
+        values.setdefault('live', True)
+        values.setdefault('has_unpublished_changes', False)
+        values.setdefault('owner', parent.owner)
+
+        page = model(content_type=content_type,
+                     depth=parent.depth + 1,
+                     numchild=0,
+                     path=Page._get_path(parent.path, parent.depth + 1,
+                                         position + offset),
+                     url_path='{0}{1}/'.format(parent.url_path,
+                                               values['slug']),
+                     **values)
+        pages.append(page)
+
+    # The rows of the page itself go first, to get the ids for the rows of
+    # the tables of the subclasses
+    _insert(Page, pages, using)
+
+    ids = dict(Page.objects.using(using).filter(
+        path__in=[page.path for page in pages]).values_list('path', 'id'))
+
+    for page in pages:
+        page_id = ids[page.path]
+        for layer in [model] + list(model._meta.get_parent_list()):
+            setattr(page, layer._meta.pk.attname, page_id)
+
+    for layer in reversed(model._meta.get_parent_list()):
+        if layer is not Page:
+            _insert(layer, pages, using)
+    _insert(model, pages, using)
+
+    Page.objects.using(using).filter(pk=parent.pk).update(
+        numchild=F('numchild') + len(pages))
+    parent.numchild += len(pages)
+
+    return [page.pk for page in pages]
+
+
+def create_image(title='Synthetic image', width=1600, height=1200):
+    """Creates an image with a real file, so that renditions can be made."""
+    from PIL import Image as PILImage
+
+    data = BytesIO()
+    PILImage.new('RGB', (width, height), (120, 140, 160)).save(data, 'PNG')
+
+    return get_image_model().objects.create(
+        title=title, file=ContentFile(data.getvalue(), name='synthetic.png'))
+
+
+def create_users(count, prefix='author'):
+    """Creates the given number of users, returns them."""
+    user_model = get_user_model()
+    usernames = ['{0}{1}'.format(prefix, i) for i in range(count)]
+
+    user_model.objects.bulk_create(
+        [user_model(**{user_model.USERNAME_FIELD: username})
+         for username in usernames])
+
+    return list(user_model.objects.filter(**{
+        '{0}__in'.format(user_model.USERNAME_FIELD): usernames}))
+
+
+def create_home(title='Home', slug='synthetic-home', hostname=None):
+    """Adds a HomePage under the tree root. The page becomes the root page of
+    a new site for the hostname, if one is given, otherwise of the default
+    site."""
+    root = Page.objects.get(depth=1)
+    home = root.add_child(instance=HomePage(
+        title=title, slug=slug, content=CONTENT, live=True))
+
+    if hostname:
+        Site.objects.create(hostname=hostname, root_page=home)
+    elif not Site.objects.filter(is_default_site=True).update(
+            root_page=home):
+        Site.objects.create(hostname='localhost', root_page=home,
+                            is_default_site=True)
+
+    return home
+
+
+def build_deep_tree(parent, depth, show_in_menus=True):
+    """Builds a chain of index pages, depth levels deep, under the parent
+    page, with a rich text page at the bottom. Returns the rich text page."""
+    for level in range(depth):
+        parent = IndexPage.objects.get(pk=add_children(parent, IndexPage, [{
+            'title': 'Level {0}'.format(level),
+            'slug': 'level-{0}'.format(level),
+            'introduction': CONTENT,
+            'show_in_menus': show_in_menus}])[0])
+
+    return RichTextPage.objects.get(pk=add_children(parent, RichTextPage, [{
+        'title': 'Deep page', 'slug': 'deep-page', 'content': CONTENT,
+        'show_in_menus': show_in_menus}])[0])
+
+
+def build_wide_index(parent, width, slug='wide-index', show_in_menus=True):
+    """Builds an index page with width children, a mix of rich text, index
+    and blog index pages. Returns the index page."""
+    index = IndexPage.objects.get(pk=add_children(parent, IndexPage, [{
+        'title': 'Wide index', 'slug': slug, 'introduction': CONTENT,
+        'show_in_menus': show_in_menus}])[0])
+
+    models = [RichTextPage, RichTextPage, IndexPage, BlogIndexPage]
+    for model in models:
+        extra = {'content': CONTENT} if model is RichTextPage else {
+            'introduction': CONTENT}
+        add_children(index, model, [
+            dict(extra, title='Child {0}'.format(i),
+                 slug='child-{0}'.format(i),
+                 show_in_menus=show_in_menus)
+            for i in range(width) if models[i % len(models)] is model])
+
+    return index
+
+
+def build_blog(parent, posts, tags=50, tags_per_post=3, authors=10,
+               attachments=1, image=None, slug='blog', start=None,
+               days=3650):
+    """Builds a blog index page with the given number of posts under the
+    parent page. Posts are spread over the given number of days before start
+    (today by default), tagged and owned in rotation and have the given
+    number of attachments each. Returns the blog index page."""
+    start = start or date.today()
+
+    with transaction.atomic():
+        blog = BlogIndexPage.objects.get(pk=add_children(
+            parent, BlogIndexPage, [{
+                'title': 'Blog', 'slug': slug, 'introduction': CONTENT,
+                'show_in_menus': True}])[0])
+
+        # Names include the blog id, to keep them unique across blogs. They
+        # also round trip through the slugs of the author and tag routes
+        prefix = '{0}{1}'.format(slug.replace('-', '_'), blog.pk)
+        users = create_users(authors, prefix='{0}_author'.format(prefix))
+        tag_names = ['{0} tag {1}'.format(prefix, i).capitalize()
+                     for i in range(tags)]
+        Tag.objects.bulk_create(
+            [Tag(name=name, slug=name.replace(' ', '-'))
+             for name in tag_names])
+        tag_ids = list(Tag.objects.filter(
+            name__in=tag_names).values_list('id', flat=True))
+
+        post_ids = add_children(blog, BlogPost, [{
+            'title': 'Post {0}'.format(i),
+            'slug': 'post-{0}'.format(i),
+            'content': CONTENT,
+            'date': start - timedelta(days=i % days),
+            'featured': i % 50 == 0,
+            'owner': users[i % len(users)]} for i in range(posts)])
+
+        if tag_ids:
+            BlogPostTag.objects.bulk_create([
+                BlogPostTag(content_object_id=post_id,
+                            tag_id=tag_ids[(i + n) % len(tag_ids)])
+                for i, post_id in enumerate(post_ids)
+                for n in range(min(tags_per_post, len(tag_ids)))],
+                batch_size=500)
+
+        if attachments:
+            image = image or create_image()
+            BlogPostAttachment.objects.bulk_create([
+                BlogPostAttachment(page_id=post_id, image=image,
+                                   caption='Attachment {0}'.format(n),
+                                   sort_order=n)
+                for post_id in post_ids for n in range(attachments)],
+                batch_size=500)
+
+    return blog
@@ -0,0 +1,291 @@
+"""
+Bulk publication and unpublication of pages, e.g. of the blog posts of an
+embargo or of a retraction.
+
+The live state of the pages is changed with one update per batch of
+`WAGTAILBASE_BULK_BATCH_SIZE` pages, plus one save for each page with a
+draft to publish, each batch in its own transaction,
+instead of saving the pages one at a time and sending `page_published` or
+`page_unpublished` for each of them. The work of those signals is then done
+once for the whole set: the search index is updated in bulk for each page
+type, the listings and menus caches are invalidated once, the frontend cache
+is purged with a single set of urls, and the related posts, the author
+directories and the tag counts are counted again once for all the affected
+posts, authors and tags. `pages_published` and `pages_unpublished` are sent
+once with all the pages, for the receivers of other applications.
+
+Publishing makes the latest revision of each page live, as publishing it
+from the editor would, see `set_live` for the scheduled publication dates.
+Run it with the `wagtailbase_bulk_publish` command, or from the bulk
+publication view of the admin, see `wagtailbase.wagtail_hooks`.
+"""
+from django.conf import settings
+from django.conf.urls import patterns, url
+from django.contrib import messages
+from django.db import transaction
+from django.dispatch import Signal
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
+
+from wagtail.wagtailcore.models import (Page, PageRevision,
+                                        UserPagePermissionsProxy)
+from wagtail.wagtailsearch.backends import get_search_backends
+
+from wagtailbase import (authors, cache, neighbours, purging, related,
+                         renditions, tagcloud)
+from wagtailbase.listings import LISTINGS, MENUS
+from wagtailbase.util import attach_blog_indexes, get_blogs, specific_pages
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+pages_published = Signal(providing_args=['pages'])
+pages_unpublished = Signal(providing_args=['pages'])
+
+
+def get_batch_size():
+    return getattr(settings, 'WAGTAILBASE_BULK_BATCH_SIZE', 500)
+
+
+def _batches(items):
+    items = sorted(items)
+    batch_size = get_batch_size()
+
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def get_latest_revisions(page_ids):
+    """Returns the latest revisions of the pages with unpublished changes,
+    with one query."""
+    revisions = {}
+
+    for revision in PageRevision.objects.filter(
+            page__in=page_ids, page__has_unpublished_changes=True).order_by(
+                'page', '-created_at', '-id').select_related('page'):
+        revisions.setdefault(revision.page_id, revision)
+
+    return list(revisions.values())
+
+
+def apply_revisions(page_ids, now):
+    """Makes the content of the latest revisions of the pages the stored
+    content, as wagtail does when publishing a revision."""
+    for revision in get_latest_revisions(page_ids):
+        page = revision.as_page_object()
+        page.live = True
+        page.expired = False
+        page.has_unpublished_changes = False
+        if page.first_published_at is None:
+            page.first_published_at = now
+        page.save()
+
+
+def set_live(page_ids, live):
+    """Publishes or unpublishes the pages with the given ids, in batched
+    transactions. Returns the ids of the pages that changed.
+
+    Publishing applies the latest revision of the pages with unpublished
+    changes, one save per page, and unpublishing marks the pages as having
+    unpublished changes, as by wagtail. Pages past their `expire_at` are not
+    published, and publishing ignores `go_live_at`: the pages go live at
+    once. Either way, the revisions scheduled with `approved_go_live_at` or
+    submitted for moderation are settled, as by wagtail."""
+    changed = []
+    now = timezone.now()
+
+    for batch in _batches(set(page_ids)):
+        with transaction.atomic():
+            pages = Page.objects.filter(pk__in=batch, live=not live)
+
+            if live:
+                pages = pages.exclude(expire_at__lte=now)
+
+            ids = list(pages.values_list('pk', flat=True))
+
+            if not ids:
+                continue
+
+            pages = Page.objects.filter(pk__in=ids)
+
+            if live:
+                apply_revisions(ids, now)
+                pages.update(live=True, expired=False,
+                             has_unpublished_changes=False)
+                pages.filter(first_published_at__isnull=True).update(
+                    first_published_at=now)
+                PageRevision.objects.filter(page__in=ids).update(
+                    approved_go_live_at=None, submitted_for_moderation=False)
+            else:
+                pages.update(live=False, has_unpublished_changes=True)
+                PageRevision.objects.filter(page__in=ids).update(
+                    approved_go_live_at=None)
+
+        changed.extend(ids)
+
+    return changed
+
+
+def get_pages(page_ids):
+    """Returns the specific instances of the pages, with one query per batch
+    and page type."""
+    pages = []
+
+    for batch in _batches(page_ids):
+        pages.extend(specific_pages(Page.objects.filter(pk__in=batch)))
+
+    return pages
+
+
+def update_search_index(pages):
+    """Indexes the pages again, in bulk for each page type."""
+    by_model = {}
+
+    for page in pages:
+        by_model.setdefault(type(page), []).append(page)
+
+    for backend in get_search_backends(with_auto_update=True):
+        for model, objects in by_model.items():
+            backend.add_bulk(model, objects)
+
+
+def update_summaries(posts, live):
+    """Counts again the related posts, authors and tags affected by the
+    publication or the unpublication of the posts, once for all of them."""
+    from wagtailbase.models import BlogPostTag
+
+    post_ids = [post.pk for post in posts]
+
+    if getattr(settings, 'WAGTAILBASE_RELATED_POSTS_ON_PUBLISH', True):
+        related.update(post_ids)
+
+    blogs = get_blogs(*posts)
+    owner_ids = set(post.owner_id for post in posts) - set([None])
+
+    if owner_ids:
+        authors.update(blogs, owner_ids)
+
+    tag_ids = set()
+    for batch in _batches(post_ids):
+        tag_ids.update(BlogPostTag.objects.filter(
+            content_object__in=batch).values_list('tag_id', flat=True))
+
+    if tag_ids:
+        tagcloud.update(blogs, tag_ids)
+
+    for post in dict((neighbours.get_namespace(post), post)
+                     for post in posts).values():
+        neighbours.invalidate(post)
+
+    if live:
+        for post in posts:
+            renditions.update_page(post)
+
+
+def purge_pages(pages):
+    """Purges the urls affected by the publication of any of the pages, with
+    a single set of urls."""
+    urls = set()
+
+    for page in pages:
+        urls |= purging.get_page_urls(page)
+
+    if urls:
+        purging.purge(urls)
+
+    return urls
+
+
+def _run(page_ids, live):
+    from wagtailbase.models import BlogPost
+
+    changed = set_live(page_ids, live)
+
+    if not changed:
+        return []
+
+    pages = get_pages(changed)
+
+    update_search_index(pages)
+
+    cache.bump_generation(LISTINGS)
+    cache.bump_generation(MENUS)
+
+    posts = attach_blog_indexes(
+        page for page in pages if isinstance(page, BlogPost))
+    if posts:
+        update_summaries(posts, live)
+
+    if purging.is_enabled():
+        purge_pages(pages)
+
+    signal = pages_published if live else pages_unpublished
+    signal.send(sender=Page, pages=pages)
+
+    logger.info('Bulk %s %s pages', 'published' if live else 'unpublished',
+                len(pages))
+
+    return pages
+
+
+def publish(page_ids):
+    """Publishes the pages with the given ids. Returns the pages that were
+    not live."""
+    return _run(page_ids, True)
+
+
+def unpublish(page_ids):
+    """Unpublishes the pages with the given ids. Returns the pages that were
+    live."""
+    return _run(page_ids, False)
+
+
+def admin_view(request, parent_id=None):
+    """Lists the children of a page, to publish or unpublish a selection of
+    them at once. Without a page, lists the blogs."""
+    from wagtailbase.models import BlogIndexPage
+
+    if parent_id is None:
+        return render(request, 'wagtailbase/admin/bulk_publish.html', {
+            'blogs': BlogIndexPage.objects.order_by('path')})
+
+    parent = get_object_or_404(Page, pk=parent_id)
+
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        permissions = UserPagePermissionsProxy(request.user)
+        allowed = ('can_unpublish' if action == 'unpublish'
+                   else 'can_publish')
+        pages = [page for page in parent.get_children().filter(
+            pk__in=request.POST.getlist('page'))
+            if getattr(permissions.for_page(page), allowed)()]
+
+        if action == 'publish':
+            done = publish([page.pk for page in pages])
+        elif action == 'unpublish':
+            done = unpublish([page.pk for page in pages])
+        else:
+            done = None
+
+        if done is None:
+            messages.error(request, 'Unknown action.')
+        else:
+            messages.success(request, '{0} {1} pages.'.format(
+                action.capitalize() + 'ed', len(done)))
+
+        return redirect('wagtailbase_bulk_publish', parent.pk)
+
+    return render(request, 'wagtailbase/admin/bulk_publish.html', {
+        'parent': parent,
+        'pages': parent.get_children().order_by('-latest_revision_created_at',
+                                                'path'),
+    })
+
+
+urlpatterns = patterns(
+    '',
+    url(r'^$', admin_view, name='wagtailbase_bulk_publish'),
+    url(r'^(?P<parent_id>\d+)/$', admin_view,
+        name='wagtailbase_bulk_publish'),
+)
@@ -0,0 +1,345 @@
+"""
+Helpers for the entries wagtailbase keeps in the Django cache.
+
+Related entries are grouped in namespaces. Every namespace has a generation
+counter that is part of the keys of its entries, bumping the generation
+invalidates all the entries in the namespace at once.
+
+The hot lookups are kept in two tiers: a bounded in-process LRU in front of
+the shared Django cache (`WAGTAILBASE_CACHE`, the default cache unless set).
+The generation counters live in the shared cache, so a bump in one worker
+invalidates the local entries of every worker. Workers read the counters at
+most once every `WAGTAILBASE_GENERATION_CHECK_INTERVAL` seconds, which is
+how long another worker may keep serving an invalidated local entry.
+
+The values are computed with the reads on the primary database, see
+`wagtailbase.routers`.
+"""
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import six
+from django.utils.encoding import force_bytes
+
+from wagtailbase.routers import use_primary
+
+import hashlib
+import threading
+import time
+
+KEY_PREFIX = 'wagtailbase'
+
+# Time a worker holds the lock of an entry it is refreshing, and the time
+# the other workers wait for an entry that is being built, in seconds
+LOCK_TIMEOUT = 30
+WAIT_TIMEOUT = 5
+WAIT_INTERVAL = 0.05
+
+
+def make_key(namespace, *parts):
+    """Returns a cache key for the given namespace and key parts. The parts
+    are hashed, so any value (e.g. an unslugified name with spaces) is safe to
+    use as part of a memcached key."""
+    digest = hashlib.md5(force_bytes(
+        ':'.join(six.text_type(part) for part in parts))).hexdigest()
+
+    return '{0}:{1}:{2}'.format(KEY_PREFIX, namespace, digest)
+
+
+def _generation_key(namespace):
+    return '{0}:generation:{1}'.format(KEY_PREFIX, namespace)
+
+
+def _lock_key(key):
+    return '{0}:lock'.format(key)
+
+
+def _compute(compute):
+    with use_primary():
+        return compute()
+
+
+class LocalCache(object):
+
+    """Bounded, thread safe, in-process LRU cache."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is None or entry[1] < time.time():
+                return default
+
+            # Moved back in at the end, as the most recently used entry
+            self._entries[key] = entry
+
+            return entry[0]
+
+    def set(self, key, value, timeout):
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time() + timeout)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TieredCache(object):
+
+    """An in-process LRU in front of a shared cache, with the namespace
+    generations kept in the shared cache."""
+
+    def __init__(self, shared, max_entries=1000, local_timeout=60,
+                 check_interval=1):
+        self.shared = shared
+        self.local = LocalCache(max_entries)
+        self.local_timeout = local_timeout
+        self.check_interval = check_interval
+        self._generations = {}
+
+    def get_generation(self, namespace):
+        """Returns the current generation of the given namespace."""
+        generation, checked = self._generations.get(namespace, (None, 0))
+
+        if time.time() - checked < self.check_interval:
+            return generation
+
+        key = _generation_key(namespace)
+        generation = self.shared.get(key)
+
+        if generation is None:
+            # The counter is seeded with the current time so that a counter
+            # that has been evicted never goes back to a generation already
+            # in use
+            self.shared.add(key, int(time.time() * 1000), None)
+            generation = self.shared.get(key)
+
+        self._generations[namespace] = (generation, time.time())
+
+        return generation
+
+    def bump_generation(self, namespace):
+        """Invalidates all the cache entries in the given namespace, in every
+        worker."""
+        key = _generation_key(namespace)
+
+        try:
+            generation = self.shared.incr(key)
+        except ValueError:
+            # The counter is not in the shared cache, so no shared entry can
+            # be using it, but local entries may still use the last one seen
+            seen = self._generations.get(namespace, (None, 0))[0] or 0
+            self.shared.add(key, max(int(time.time() * 1000), seen + 1), None)
+            generation = self.shared.get(key)
+
+        self._generations[namespace] = (generation, time.time())
+
+        return generation
+
+    def versioned_key(self, namespace, *parts):
+        """Returns a cache key for the given parts in the current generation
+        of the namespace."""
+        return make_key(namespace, self.get_generation(namespace), *parts)
+
+    def get(self, namespace, parts, compute, timeout, shared=True):
+        """Returns the value for the given parts in the namespace, from the
+        local tier, the shared tier or, if it is in neither, from compute.
+        Values kept in the local tier only (shared=False) must not need
+        invalidation across workers. Local values are shared by the requests
+        of the process, so they must not be modified. compute must not
+        return None."""
+        key = self.versioned_key(namespace, *parts)
+        value = self.local.get(key)
+
+        if value is not None:
+            return value
+
+        if shared:
+            value = self.shared.get(key)
+
+        if value is None:
+            value = _compute(compute)
+
+            if shared:
+                self.shared.set(key, value, timeout)
+
+        self.local.set(key, value, min(timeout, self.local_timeout))
+
+        return value
+
+    def _acquire(self, key):
+        return self.shared.add(_lock_key(key), True, LOCK_TIMEOUT)
+
+    def _release(self, key):
+        self.shared.delete(_lock_key(key))
+
+    def _wait(self, key, generation):
+        """Waits for another worker to build the entry. Returns the entry,
+        or None if it is not built in time."""
+        deadline = time.time() + WAIT_TIMEOUT
+
+        while time.time() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            entry = self.shared.get(key)
+
+            if entry is not None and entry[1] == generation:
+                return entry
+
+            if self.shared.get(_lock_key(key)) is None:
+                # The other worker gave up, or its entry was evicted already
+                break
+
+        return None
+
+    def fetch(self, namespace, parts, compute, timeout=300,
+              stale_timeout=3600, local=False):
+        """Returns the cached value for the given parts in the namespace,
+        calling compute to build it when it is missing or stale.
+
+        Entries are stale once they are older than timeout seconds, or once
+        the generation of the namespace is bumped, and they are kept for
+        stale_timeout seconds more. Only one worker at a time rebuilds an
+        entry: while it does, the other workers are served the stale value,
+        or, if there is no value at all yet, wait for it.
+
+        The entries, e.g. whole rendered listings, are only kept in the
+        shared tier, so that they neither evict the small hot entries of the
+        local tier nor take memory in every worker. Small entries can be
+        kept in the local tier as well (local=True), as by `get`."""
+        if local:
+            local_key = self.versioned_key(namespace, *parts)
+            value = self.local.get(local_key)
+
+            if value is not None:
+                return value
+
+        key = make_key(namespace, *parts)
+        generation = self.get_generation(namespace)
+        entry = self.shared.get(key)
+
+        if entry is not None:
+            value, entry_generation, expires = entry
+
+            if entry_generation == generation and expires > time.time():
+                if local and value is not None:
+                    self.local.set(local_key, value,
+                                   min(expires - time.time(),
+                                       self.local_timeout))
+
+                return value
+
+            if not self._acquire(key):
+                return value
+        elif not self._acquire(key):
+            entry = self._wait(key, generation)
+
+            if entry is not None:
+                return entry[0]
+
+            # Build it without the lock, rather than keep the request waiting
+            return _compute(compute)
+
+        try:
+            value = _compute(compute)
+            entry = (value, generation, time.time() + timeout)
+            self.shared.set(key, entry, timeout + stale_timeout)
+        finally:
+            self._release(key)
+
+        if local and value is not None:
+            self.local.set(local_key, value, min(timeout, self.local_timeout))
+
+        return value
+
+    def clear(self):
+        """Clears both tiers."""
+        self.shared.clear()
+        self.local.clear()
+        self._generations.clear()
+
+
+_cache = None
+
+
+def get_cache():
+    """Returns the tiered cache of this process, configured with the
+    `WAGTAILBASE_CACHE`, `WAGTAILBASE_LOCAL_CACHE_MAX_ENTRIES`,
+    `WAGTAILBASE_LOCAL_CACHE_TIMEOUT` and
+    `WAGTAILBASE_GENERATION_CHECK_INTERVAL` settings."""
+    global _cache
+
+    if _cache is None:
+        _cache = TieredCache(
+            caches[getattr(settings, 'WAGTAILBASE_CACHE', 'default')],
+            max_entries=getattr(
+                settings, 'WAGTAILBASE_LOCAL_CACHE_MAX_ENTRIES', 1000),
+            local_timeout=getattr(
+                settings, 'WAGTAILBASE_LOCAL_CACHE_TIMEOUT', 60),
+            check_interval=getattr(
+                settings, 'WAGTAILBASE_GENERATION_CHECK_INTERVAL', 1))
+
+    return _cache
+
+
+@receiver(setting_changed)
+def reset_cache(setting, **kwargs):
+    """Configures the tiered cache again when its settings change, e.g. with
+    `override_settings`."""
+    global _cache
+
+    if setting in ('CACHES', 'WAGTAILBASE_CACHE',
+                   'WAGTAILBASE_LOCAL_CACHE_MAX_ENTRIES',
+                   'WAGTAILBASE_LOCAL_CACHE_TIMEOUT',
+                   'WAGTAILBASE_GENERATION_CHECK_INTERVAL'):
+        _cache = None
+
+
+def get_generation(namespace):
+    """Returns the current generation of the given namespace."""
+    return get_cache().get_generation(namespace)
+
+
+def bump_generation(namespace):
+    """Invalidates all the cache entries in the given namespace."""
+    return get_cache().bump_generation(namespace)
+
+
+def versioned_key(namespace, *parts):
+    """Returns a cache key for the given parts in the current generation of
+    the namespace."""
+    return get_cache().versioned_key(namespace, *parts)
+
+
+def get(namespace, parts, compute, timeout, shared=True):
+    """See `TieredCache.get`."""
+    return get_cache().get(namespace, parts, compute, timeout, shared)
+
+
+def fetch(namespace, parts, compute, timeout=300, stale_timeout=3600,
+          local=False):
+    """See `TieredCache.fetch`."""
+    return get_cache().fetch(namespace, parts, compute, timeout,
+                             stale_timeout, local)
+
+
+def clear():
+    """Clears the shared cache and the local tier of this process."""
+    get_cache().clear()
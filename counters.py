@@ -0,0 +1,114 @@
+"""
+Buffered view counts of the blog posts.
+
+With `WAGTAILBASE_VIEW_COUNTS = True` every view of a blog post adds one to
+a counter held in the memory of the worker. The counters are written to
+`BlogPostViews` at most once every `WAGTAILBASE_VIEW_FLUSH_INTERVAL` seconds,
+by the first request after the interval, and when the worker exits: one
+update per distinct increment and one insert for the posts not counted yet,
+however many posts were read.
+
+The `popular_blog_posts` tag reads a ranking of the most read posts that is
+rebuilt every `WAGTAILBASE_LISTING_CACHE_TIMEOUT` seconds, never the counts
+as they are written.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+import atexit
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+_lock = threading.Lock()
+_pending = defaultdict(int)
+_flushed = [time.time()]
+
+
+def is_enabled():
+    return getattr(settings, 'WAGTAILBASE_VIEW_COUNTS', False)
+
+
+def record_view(post_id):
+    """Counts a view of the post, and writes the counts if they have not been
+    written for the flush interval."""
+    interval = getattr(settings, 'WAGTAILBASE_VIEW_FLUSH_INTERVAL', 60)
+
+    with _lock:
+        _pending[post_id] += 1
+        due = time.time() - _flushed[0] >= interval
+
+    if due:
+        flush()
+
+
+def _take_pending():
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _flushed[0] = time.time()
+
+    return pending
+
+
+def _write(pending):
+    """Writes the counts of a batch of posts."""
+    from wagtailbase.models import BlogPostViews
+
+    existing = set(BlogPostViews.objects.filter(
+        post_id__in=list(pending)).values_list('post_id', flat=True))
+
+    by_increment = defaultdict(list)
+    for post_id in existing:
+        by_increment[pending[post_id]].append(post_id)
+
+    for increment, post_ids in by_increment.items():
+        BlogPostViews.objects.filter(post_id__in=post_ids).update(
+            count=F('count') + increment)
+
+    BlogPostViews.objects.bulk_create([
+        BlogPostViews(post_id=post_id, count=count)
+        for post_id, count in pending.items() if post_id not in existing])
+
+
+def flush():
+    """Writes the buffered counts to the database. Returns the number of
+    posts written."""
+    pending = _take_pending()
+
+    if not pending:
+        return 0
+
+    post_ids = sorted(pending)
+
+    for start in range(0, len(post_ids), BATCH_SIZE):
+        batch = dict((post_id, pending[post_id])
+                     for post_id in post_ids[start:start + BATCH_SIZE])
+
+        try:
+            try:
+                with transaction.atomic():
+                    _write(batch)
+            except IntegrityError:
+                # Another worker counted one of the new posts first
+                with transaction.atomic():
+                    _write(batch)
+        except Exception:
+            # Counts are not worth failing a request for
+            logger.exception('Cannot write the views of %s posts',
+                             len(batch))
+
+    return len(pending)
+
+
+@atexit.register
+def flush_on_exit():
+    if is_enabled():
+        flush()
@@ -0,0 +1,210 @@
+"""
+Edge side includes (ESI) for the parts of the pages that vary per page or
+change often: the `main_menu`, `local_menu` and `latest_blog_post` tags.
+
+With `WAGTAILBASE_ESI = True` these tags render an `<esi:include>` marker
+instead of their content. The markers point to the fragment views in this
+module, mounted by `wagtailbase.urls` under `_fragments/`, that render the
+tags on their own with the `Cache-Control` max age set for each of them in
+`WAGTAILBASE_ESI_MAX_AGES`. The rest of the page can then be cached for
+longer at the edge.
+
+An ESI proxy (e.g. Varnish with `beresp.do_esi`) assembles the pages. For
+tests and for deployments without one, add `ESIMiddleware`, which replaces
+the markers with the fragments before the response leaves Django.
+"""
+from django.conf import settings
+from django.conf.urls import patterns, url
+from django.core.urlresolvers import resolve, reverse, Resolver404
+from django.http import Http404, HttpResponse, QueryDict
+from django.template import Context, Template
+from django.utils.http import urlencode
+from django.utils.cache import patch_cache_control
+
+from wagtail.wagtailcore.models import Page
+
+from wagtailbase.compression import decompress
+
+import copy
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Source and page arguments of the tag of every fragment
+FRAGMENTS = {
+    'main_menu': ('{% main_menu root=root current_page=current_page %}',
+                  ('root', 'current_page')),
+    'local_menu': ('{% local_menu current_page=current_page %}',
+                   ('current_page',)),
+    'latest_blog_post': ('{% latest_blog_post parent=parent %}',
+                         ('parent',)),
+}
+
+REQUIRED = {
+    'main_menu': ('root',),
+    'local_menu': ('current_page',),
+    'latest_blog_post': (),
+}
+
+# Page types of the page arguments that cannot be any page, from
+# wagtailbase.models
+TYPES = {
+    'latest_blog_post': {'parent': 'BlogIndexPage'},
+}
+
+DEFAULT_MAX_AGES = {
+    'main_menu': 300,
+    'local_menu': 300,
+    'latest_blog_post': 60,
+}
+
+ESI_INCLUDE = re.compile(r'<esi:include\s+src="([^"]+)"\s*/>')
+
+_templates = {}
+
+
+def is_enabled():
+    return getattr(settings, 'WAGTAILBASE_ESI', False)
+
+
+def get_max_age(name):
+    return dict(DEFAULT_MAX_AGES, **getattr(
+        settings, 'WAGTAILBASE_ESI_MAX_AGES', {}))[name]
+
+
+def esi_src(context, name, **pages):
+    """Returns the url of the fragment of the tag with the given name for
+    the given pages, or None if the tag must be rendered in place: when ESI
+    is disabled, when rendering a fragment and for pages that are not saved,
+    e.g. in previews."""
+    if not is_enabled():
+        return None
+
+    request = context.get('request')
+
+    if request is None or getattr(request, 'esi_fragment', False):
+        return None
+
+    params = []
+    for key, page in sorted(pages.items()):
+        if page is None:
+            continue
+        if page.pk is None:
+            return None
+        params.append((key, page.pk))
+
+    return '{0}?{1}'.format(
+        reverse('wagtailbase_fragment', args=[name]), urlencode(params))
+
+
+def _get_template(name):
+    if name not in _templates:
+        _templates[name] = Template(
+            '{% load wagtailbase_tags %}' + FRAGMENTS[name][0])
+
+    return _templates[name]
+
+
+def fragment(request, name):
+    """Renders the tag of the fragment with the given name on its own."""
+    from wagtailbase import models
+
+    if name not in FRAGMENTS:
+        raise Http404('Unknown fragment')
+
+    context = {'request': request}
+
+    for key in FRAGMENTS[name][1]:
+        pk = request.GET.get(key)
+
+        if not pk:
+            if key in REQUIRED[name]:
+                raise Http404('Missing {0}'.format(key))
+            context[key] = None
+            continue
+
+        try:
+            context[key] = Page.objects.get(pk=int(pk), live=True).specific
+        except (ValueError, Page.DoesNotExist):
+            raise Http404('Unknown {0}'.format(key))
+
+        page_type = TYPES.get(name, {}).get(key)
+        if page_type and not isinstance(context[key],
+                                        getattr(models, page_type)):
+            raise Http404('Unknown {0}'.format(key))
+
+    request.esi_fragment = True
+    response = HttpResponse(_get_template(name).render(Context(context)))
+    patch_cache_control(response, max_age=get_max_age(name))
+
+    return response
+
+
+urlpatterns = patterns(
+    '',
+    url(r'^(?P<name>\w+)/$', fragment, name='wagtailbase_fragment'),
+)
+
+
+class ESIMiddleware(object):
+
+    """Replaces the `<esi:include>` markers in the HTML responses with the
+    fragments they point to, for sites that are not behind an ESI proxy."""
+
+    def include(self, request, src):
+        path, _, query = src.replace('&amp;', '&').partition('?')
+
+        try:
+            match = resolve(path)
+        except Resolver404:
+            logger.warning('ESIMiddleware: cannot resolve %s', src)
+            return ''
+
+        sub_request = copy.copy(request)
+        sub_request.path = sub_request.path_info = path
+        sub_request.GET = QueryDict(query)
+        sub_request.META = dict(request.META, PATH_INFO=path,
+                                QUERY_STRING=query)
+
+        try:
+            response = match.func(sub_request, *match.args, **match.kwargs)
+        except Http404:
+            response = None
+
+        if response is None or response.status_code != 200:
+            logger.warning('ESIMiddleware: cannot include %s', src)
+            return ''
+
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+
+        return response.content.decode(response.charset)
+
+    def process_response(self, request, response):
+        if (response.streaming or
+                'html' not in response.get('Content-Type', '')):
+            return response
+
+        content = response.content
+        encoding = response.get('Content-Encoding')
+
+        if encoding:
+            # Pre-compressed cached renders, see wagtailbase.compression
+            content = decompress(content, encoding)
+
+        content = content.decode(response.charset)
+
+        if '<esi:include' not in content:
+            return response
+
+        if encoding:
+            del response['Content-Encoding']
+
+        response.content = ESI_INCLUDE.sub(
+            lambda match: self.include(request, match.group(1)), content)
+
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = str(len(response.content))
+
+        return response
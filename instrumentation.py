@@ -0,0 +1,270 @@
+"""
+Opt-in timing and query count instrumentation of the wagtailbase template
+tags and page routes.
+
+Set `WAGTAILBASE_INSTRUMENTATION = True` and add
+`wagtailbase.instrumentation.InstrumentationMiddleware` to the middleware
+classes. For every request the middleware then collects the elapsed time, the
+number of queries and the number of calls of each tag, include and route,
+and reports them:
+
+* in the `Server-Timing` response header;
+* as a JSON log line on the `wagtailbase.instrumentation` logger;
+* to the metrics sink set in `WAGTAILBASE_METRICS_SINK`, if any, e.g.::
+
+    WAGTAILBASE_METRICS_SINK = {
+        'BACKEND': 'wagtailbase.instrumentation.UDPSink',
+        'OPTIONS': {'host': '127.0.0.1', 'port': 8125},
+    }
+
+Timings are inclusive, a tag rendered inside another is counted in both.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django import template
+from django.conf import settings
+from django.db import connection
+from django.utils.decorators import available_attrs
+from django.utils.module_loading import import_string
+
+import functools
+import json
+import logging
+import socket
+import threading
+import timeit
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def is_enabled():
+    return getattr(settings, 'WAGTAILBASE_INSTRUMENTATION', False)
+
+
+class Timing(object):
+
+    """Elapsed time, in milliseconds, queries and calls of one measured
+    name in a request."""
+
+    def __init__(self):
+        self.calls = 0
+        self.elapsed = 0.0
+        self.queries = 0
+
+    def as_dict(self):
+        return {'calls': self.calls, 'ms': round(self.elapsed, 3),
+                'queries': self.queries}
+
+
+class QueryCount(object):
+
+    """Counts the queries run on the connection within a block, from the
+    query log the connection keeps while its debug cursor is forced."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.count = 0
+
+    def __enter__(self):
+        self.force_debug_cursor = self.connection.force_debug_cursor
+        self.connection.force_debug_cursor = True
+        self.initial = len(self.connection.queries_log)
+
+        return self
+
+    def __exit__(self, *exc_info):
+        self.connection.force_debug_cursor = self.force_debug_cursor
+        self.count = len(self.connection.queries_log) - self.initial
+
+    def __len__(self):
+        return self.count
+
+
+def get_timings():
+    """Returns the timings collected so far in the current request, or None
+    if the request is not being instrumented."""
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def measure(name):
+    """Adds the elapsed time and queries of the block to the timing of the
+    given name, when the current request is being instrumented."""
+    timings = get_timings()
+
+    if timings is None:
+        yield
+        return
+
+    timing = timings.setdefault(name, Timing())
+    queries = QueryCount(connection)
+    start = timeit.default_timer()
+
+    try:
+        with queries:
+            yield
+    finally:
+        timing.calls += 1
+        timing.elapsed += (timeit.default_timer() - start) * 1000
+        timing.queries += len(queries)
+
+
+def instrumented(name):
+    """Decorator that measures every call of the function under the given
+    name, when the current request is being instrumented."""
+    def decorator(func):
+        @functools.wraps(func, assigned=available_attrs(func))
+        def wrapper(*args, **kwargs):
+            with measure(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class InstrumentedNode(template.Node):
+
+    """Wraps the node of a tag, to measure its render."""
+
+    def __init__(self, name, node):
+        self.name = name
+        self.node = node
+
+    def render(self, context):
+        with measure(self.name):
+            return self.node.render(context)
+
+
+def instrument_library(library, prefix='tag'):
+    """Wraps every tag and filter in the template library so that they are
+    measured, when the current request is being instrumented."""
+    for name, compile_function in list(library.tags.items()):
+        library.tags[name] = _instrument_tag(
+            '{0}.{1}'.format(prefix, name), compile_function)
+
+    for name, filter_function in list(library.filters.items()):
+        library.filters[name] = _instrument_filter(
+            '{0}.{1}'.format(prefix, name), filter_function)
+
+    return library
+
+
+def _instrument_tag(name, compile_function):
+    @functools.wraps(compile_function,
+                     assigned=available_attrs(compile_function))
+    def compile_instrumented(parser, token):
+        return InstrumentedNode(name, compile_function(parser, token))
+
+    return compile_instrumented
+
+
+def _instrument_filter(name, filter_function):
+    wrapper = instrumented(name)(filter_function)
+    # The template engine checks the arguments of a filter against the
+    # signature of the decorated function
+    wrapper._decorated_function = getattr(
+        filter_function, '_decorated_function', filter_function)
+
+    return wrapper
+
+
+class MetricsSink(object):
+
+    """Base class of the metrics sinks, that receive the timings of every
+    instrumented request."""
+
+    def send(self, timings, request, response):
+        """Receives the timings of the request, does nothing by default."""
+
+
+class UDPSink(MetricsSink):
+
+    """Sends the timings as statsd metrics over UDP, e.g. to a local statsd
+    or telegraf agent. Errors are ignored, metrics are best effort."""
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='wagtailbase'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def format(self, timings):
+        lines = []
+
+        for name, timing in timings.items():
+            metric = '{0}.{1}'.format(self.prefix, name)
+            lines.append('{0}.time:{1:.3f}|ms'.format(metric, timing.elapsed))
+            lines.append('{0}.queries:{1}|c'.format(metric, timing.queries))
+            lines.append('{0}.calls:{1}|c'.format(metric, timing.calls))
+
+        return '\n'.join(lines)
+
+    def send(self, timings, request, response):
+        if not timings:
+            return
+
+        try:
+            self.socket.sendto(self.format(timings).encode('utf-8'),
+                               self.address)
+        except socket.error:
+            logger.debug('UDPSink: cannot send metrics to %s:%s',
+                         *self.address)
+
+
+_sink = None
+
+
+def get_sink():
+    """Returns the configured metrics sink, or None."""
+    global _sink
+
+    config = getattr(settings, 'WAGTAILBASE_METRICS_SINK', None)
+
+    if not config:
+        return None
+
+    if _sink is None or _sink.config != config:
+        _sink = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+        _sink.config = config
+
+    return _sink
+
+
+class InstrumentationMiddleware(object):
+
+    """Collects the timings of each request, and reports them."""
+
+    def process_request(self, request):
+        if is_enabled():
+            _local.timings = OrderedDict()
+
+    def process_response(self, request, response):
+        timings = get_timings()
+
+        if timings is None:
+            return response
+
+        del _local.timings
+
+        if timings:
+            response['Server-Timing'] = ', '.join(
+                '{0};dur={1:.3f};desc="{2} queries, {3} calls"'.format(
+                    name, timing.elapsed, timing.queries, timing.calls)
+                for name, timing in timings.items())
+
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'timings': OrderedDict(
+                (name, timing.as_dict()) for name, timing in timings.items()),
+        }))
+
+        sink = get_sink()
+        if sink is not None:
+            sink.send(timings, request, response)
+
+        return response
@@ -0,0 +1,147 @@
+"""
+Cached renders of the blog listing routes, and cached post lists and menus
+for the blog sidebar and menu tags.
+
+Entries are built with `wagtailbase.cache.fetch`, so only one worker at a
+time renders a given listing, and when a page is published or unpublished
+the other workers keep serving the previous render until the new one is
+ready, instead of all rendering it at once.
+
+Only anonymous GET requests are served from the cache, and only successful
+responses that do not use the CSRF cookie are cached. Renders are stored
+compressed, see `wagtailbase.compression`. The timeouts are set
+with `WAGTAILBASE_LISTING_CACHE_TIMEOUT`, 0 disables the cache, and
+`WAGTAILBASE_LISTING_CACHE_STALE_TIMEOUT`.
+
+Menus are read on every page, so they are kept in the in-process tier of
+the cache as well, see `wagtailbase.cache`, for
+`WAGTAILBASE_MENU_CACHE_TIMEOUT` seconds.
+"""
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from taggit.models import Tag
+
+from wagtail.wagtailcore.models import Page
+from wagtail.wagtailcore.signals import page_published, page_unpublished
+
+from wagtailbase import cache
+from wagtailbase.compression import compress, make_response
+
+import functools
+
+LISTINGS = 'listings'
+MENUS = 'menus'
+
+
+def get_timeouts():
+    """Returns the fresh and the stale timeouts of the listings."""
+    return (getattr(settings, 'WAGTAILBASE_LISTING_CACHE_TIMEOUT', 300),
+            getattr(settings, 'WAGTAILBASE_LISTING_CACHE_STALE_TIMEOUT',
+                    60 * 60))
+
+
+def is_cacheable(request):
+    """Returns True if the response to the request can be served from the
+    cache."""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+
+    if getattr(request, 'is_preview', False):
+        return False
+
+    user = getattr(request, 'user', None)
+
+    return user is None or not user.is_authenticated()
+
+
+class Uncacheable(Exception):
+
+    """Raised with the response of a render that must not be cached."""
+
+    def __init__(self, response):
+        super(Uncacheable, self).__init__()
+        self.response = response
+
+
+def cached_route(func):
+    """Decorator for the routes of the index pages, that serves their
+    renders from the cache."""
+    @functools.wraps(func)
+    def wrapper(page, request, *args, **kwargs):
+        timeout, stale_timeout = get_timeouts()
+
+        if not timeout or not is_cacheable(request):
+            return func(page, request, *args, **kwargs)
+
+        def render():
+            response = func(page, request, *args, **kwargs)
+
+            if (response.status_code != 200 or response.streaming or
+                    request.META.get('CSRF_COOKIE_USED')):
+                raise Uncacheable(response)
+
+            return compress(response.content), response['Content-Type']
+
+        parts = (page.pk, func.__name__, request.get_host(),
+                 request.get_full_path())
+
+        try:
+            encoded, content_type = cache.fetch(LISTINGS, parts, render,
+                                                timeout, stale_timeout)
+        except Uncacheable as e:
+            return e.response
+
+        return make_response(request, encoded, content_type)
+
+    return wrapper
+
+
+def cached_posts(name, parent, compute, *args):
+    """Returns the posts of the sidebar tag with the given name, for the
+    parent blog and arguments, calling compute to fetch them when they are
+    not cached. compute must return a post, or a list of posts, or None."""
+    timeout, stale_timeout = get_timeouts()
+
+    if not timeout:
+        return compute()
+
+    parts = (name, parent.pk if parent else None) + args
+
+    # The lists are small and read on every page, so they are kept in the
+    # local tier as well
+    return cache.fetch(LISTINGS, parts, compute, timeout, stale_timeout,
+                       local=True)
+
+
+def cached_menu(name, page, compute):
+    """Returns the menu of the tag with the given name for the page, calling
+    compute to build it when it is not cached. compute must not return
+    None."""
+    timeout = getattr(settings, 'WAGTAILBASE_MENU_CACHE_TIMEOUT', 300)
+
+    if not timeout or page.pk is None:
+        return compute()
+
+    return cache.get(MENUS, (name, page.pk), compute, timeout)
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def invalidate_listings(sender, **kwargs):
+    cache.bump_generation(LISTINGS)
+    cache.bump_generation(MENUS)
+
+
+@receiver(post_delete)
+def invalidate_listings_on_delete(sender, **kwargs):
+    if issubclass(sender, Page):
+        cache.bump_generation(LISTINGS)
+        cache.bump_generation(MENUS)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_listings_on_tag_change(sender, **kwargs):
+    cache.bump_generation(LISTINGS)
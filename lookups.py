@@ -0,0 +1,84 @@
+"""
+Resolution of the author and tag arguments of the blog routes to ids.
+
+Route arguments are either the exact username/tag name or a slugified
+version of it (see `wagtailbase.util.unslugify`). Resolving them once to an
+id, and caching the result, lets the listings filter with a plain equality
+on an indexed column instead of an OR across joins.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AbstractBaseUser
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from taggit.models import Tag
+
+from wagtailbase import cache
+from wagtailbase.util import unslugify
+
+AUTHORS = 'authors'
+TAGS = 'tags'
+
+# Cached in place of an id for the arguments that do not match anything, so
+# that unknown slugs are not looked up again
+MISSING = 0
+
+LOOKUP_TIMEOUT = 60 * 60 * 24
+
+
+def _lookup(queryset, field, slug):
+    """Returns the id of the object in the queryset whose field matches the
+    slug, or the unslugified slug, or None if there is no match."""
+    candidates = [slug, unslugify(slug)]
+    matches = dict(queryset.filter(
+        **{'{0}__in'.format(field): candidates}).values_list(field, 'id'))
+
+    for candidate in candidates:
+        if candidate in matches:
+            return matches[candidate]
+
+    return None
+
+
+def _resolve(namespace, slug, lookup):
+    object_id = cache.get(namespace, (slug,),
+                          lambda: lookup(slug) or MISSING, LOOKUP_TIMEOUT)
+
+    return object_id or None
+
+
+def resolve_author(slug):
+    """Returns the id of the user the author slug refers to, or None."""
+    def lookup(slug):
+        user_model = get_user_model()
+        return _lookup(user_model._default_manager.all(),
+                       user_model.USERNAME_FIELD, slug)
+
+    return _resolve(AUTHORS, slug, lookup)
+
+
+def resolve_tag(slug):
+    """Returns the id of the tag the tag slug refers to, or None."""
+    return _resolve(TAGS, slug,
+                    lambda slug: _lookup(Tag.objects.all(), 'name', slug))
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_author_lookups(sender, **kwargs):
+    if not issubclass(sender, AbstractBaseUser):
+        return
+
+    # Saves that do not touch the username, e.g. the last_login update, do
+    # not change the lookups
+    update_fields = kwargs.get('update_fields')
+    if update_fields and sender.USERNAME_FIELD not in update_fields:
+        return
+
+    cache.bump_generation(AUTHORS)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_lookups(sender, **kwargs):
+    cache.bump_generation(TAGS)
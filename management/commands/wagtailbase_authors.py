@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from wagtailbase import authors
+
+import time
+
+
+class Command(BaseCommand):
+    help = ('Builds the author directory of every blog, with the number of '
+            'posts of each author. Run it after migrating, and after bulk '
+            'changes to the posts or their owners, single publications '
+            'update the directory as they happen.')
+
+    def handle(self, *args, **options):
+        start = time.time()
+        count = authors.rebuild()
+
+        self.stdout.write('Built the author directories of {0} blogs in '
+                          '{1:.2f}s.'.format(count, time.time() - start))
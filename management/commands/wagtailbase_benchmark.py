@@ -0,0 +1,82 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+from wagtailbase.benchmarks import micro
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the wagtailbase template tags and page helpers '
+            'against a synthetic site, built in a throwaway test database. '
+            'Prints the results as JSON.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--posts', type='int', dest='posts',
+                    default=micro.DEFAULT_SIZES['posts'],
+                    help='Number of blog posts.'),
+        make_option('--depth', type='int', dest='depth',
+                    default=micro.DEFAULT_SIZES['depth'],
+                    help='Depth of the deep page hierarchy.'),
+        make_option('--width', type='int', dest='width',
+                    default=micro.DEFAULT_SIZES['width'],
+                    help='Number of children of the wide index page.'),
+        make_option('--tags', type='int', dest='tags',
+                    default=micro.DEFAULT_SIZES['tags'],
+                    help='Number of blog tags.'),
+        make_option('--authors', type='int', dest='authors',
+                    default=micro.DEFAULT_SIZES['authors'],
+                    help='Number of blog authors.'),
+        make_option('--attachments', type='int', dest='attachments',
+                    default=micro.DEFAULT_SIZES['attachments'],
+                    help='Number of attachments per blog post.'),
+        make_option('--repeat', type='int', dest='repeat', default=5,
+                    help='Number of timed runs of each benchmark.'),
+        make_option('--output', dest='output', default=None,
+                    help='Writes the results to this file.'),
+        make_option('--compare', dest='compare', default=None,
+                    help='Results file of a previous run to compare with.'),
+        make_option('--threshold', type='float', dest='threshold',
+                    default=1.2,
+                    help='Time ratio above which a benchmark regressed.'),
+    )
+
+    def handle(self, *args, **options):
+        sizes = dict((key, options[key]) for key in micro.DEFAULT_SIZES)
+
+        old_name = connection.settings_dict['NAME']
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                           serialize=False)
+
+        try:
+            results = micro.run(sizes, repeat=options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+            regressions = micro.compare(baseline, results,
+                                        options['threshold'])
+
+            for key, metric, before, after in regressions:
+                self.stderr.write('{0} {1}: {2} -> {3}'.format(
+                    key, metric, before, after))
+
+            if regressions:
+                raise CommandError(
+                    '{0} benchmarks regressed'.format(len(regressions)))
@@ -0,0 +1,53 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wagtail.wagtailcore.models import Page
+
+from wagtailbase import bulk
+
+import time
+
+
+class Command(BaseCommand):
+    args = '<page_id page_id ...>'
+    help = ('Publishes, or unpublishes, the given pages or the children of '
+            'a page at once, in batched transactions, then updates the '
+            'search index, caches and summaries once for all of them.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--unpublish', action='store_true', dest='unpublish',
+                    default=False, help='Unpublishes the pages.'),
+        make_option('--children-of', type='int', dest='parent',
+                    default=None,
+                    help='Id of the page whose children to (un)publish.'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            page_ids = [int(arg) for arg in args]
+        except ValueError:
+            raise CommandError('Page ids must be integers')
+
+        if options['parent'] is not None:
+            try:
+                parent = Page.objects.get(pk=options['parent'])
+            except Page.DoesNotExist:
+                raise CommandError('Unknown page {0}'.format(
+                    options['parent']))
+
+            page_ids.extend(parent.get_children().values_list(
+                'pk', flat=True))
+
+        if not page_ids:
+            raise CommandError('No pages given')
+
+        start = time.time()
+
+        if options['unpublish']:
+            pages, action = bulk.unpublish(page_ids), 'Unpublished'
+        else:
+            pages, action = bulk.publish(page_ids), 'Published'
+
+        self.stdout.write('{0} {1} pages in {2:.2f}s.'.format(
+            action, len(pages), time.time() - start))
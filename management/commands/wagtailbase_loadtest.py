@@ -0,0 +1,132 @@
+import json
+import os
+import shutil
+import tempfile
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+from wagtailbase.benchmarks import load
+
+
+class Command(BaseCommand):
+    help = ('Load tests a synthetic wagtailbase site, built in a throwaway '
+            'test database, through the WSGI application. Prints the '
+            'throughput and latency report as JSON.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--posts', type='int', dest='posts',
+                    default=load.DEFAULT_SIZES['posts'],
+                    help='Number of blog posts.'),
+        make_option('--depth', type='int', dest='depth',
+                    default=load.DEFAULT_SIZES['depth'],
+                    help='Depth of the deep page hierarchy.'),
+        make_option('--width', type='int', dest='width',
+                    default=load.DEFAULT_SIZES['width'],
+                    help='Number of children of the wide index page.'),
+        make_option('--tags', type='int', dest='tags',
+                    default=load.DEFAULT_SIZES['tags'],
+                    help='Number of blog tags.'),
+        make_option('--authors', type='int', dest='authors',
+                    default=load.DEFAULT_SIZES['authors'],
+                    help='Number of blog authors.'),
+        make_option('--attachments', type='int', dest='attachments',
+                    default=load.DEFAULT_SIZES['attachments'],
+                    help='Number of attachments per blog post.'),
+        make_option('--mix', dest='mix', default=None,
+                    help='Weights of the kinds of pages, e.g. '
+                         '"home=10,blog_post=30". Kinds not given keep '
+                         'their default weight.'),
+        make_option('--requests', type='int', dest='requests', default=2000,
+                    help='Number of timed requests.'),
+        make_option('--concurrency', type='int', dest='concurrency',
+                    default=8,
+                    help='Number of concurrent clients.'),
+        make_option('--warmup', type='int', dest='warmup', default=200,
+                    help='Number of untimed requests sent first.'),
+        make_option('--seed', type='int', dest='seed', default=0,
+                    help='Seed of the request schedule.'),
+        make_option('--output', dest='output', default=None,
+                    help='Writes the report to this file.'),
+        make_option('--compare', dest='compare', default=None,
+                    help='Report file of a previous run to compare with.'),
+        make_option('--threshold', type='float', dest='threshold',
+                    default=1.2,
+                    help='Latency or throughput ratio above which a run '
+                         'regressed.'),
+    )
+
+    def parse_mix(self, value):
+        mix = {}
+
+        for item in value.split(','):
+            kind, _, weight = item.partition('=')
+            kind = kind.strip()
+
+            if kind not in load.DEFAULT_MIX:
+                raise CommandError('Unknown kind of page: {0}'.format(kind))
+
+            try:
+                mix[kind] = int(weight)
+            except ValueError:
+                raise CommandError('Invalid weight: {0}'.format(item))
+
+        if not any(mix.values()):
+            raise CommandError('The mix has no weights')
+
+        return mix
+
+    def handle(self, *args, **options):
+        sizes = dict((key, options[key]) for key in load.DEFAULT_SIZES)
+        mix = self.parse_mix(options['mix']) if options['mix'] else None
+
+        old_name = connection.settings_dict['NAME']
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        temp_dir = None
+
+        if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            # The threads of the clients cannot share an in-memory database
+            temp_dir = tempfile.mkdtemp()
+            test_settings['NAME'] = os.path.join(temp_dir, 'load.sqlite3')
+
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                           serialize=False)
+
+        try:
+            report = load.run(sizes, mix=mix, requests=options['requests'],
+                              concurrency=options['concurrency'],
+                              warmup=options['warmup'], seed=options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+            if temp_dir:
+                del test_settings['NAME']
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+            regressions = load.compare(baseline, report,
+                                       options['threshold'])
+
+            for key, metric, before, after in regressions:
+                self.stderr.write('{0} {1}: {2} -> {3}'.format(
+                    key, metric, before, after))
+
+            if regressions:
+                raise CommandError(
+                    '{0} load metrics regressed'.format(len(regressions)))
@@ -0,0 +1,44 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wagtailbase import profiling
+
+
+class Command(BaseCommand):
+    args = '<profile profile ...>'
+    help = ('Prints the summary of the hottest wagtailbase functions and '
+            'template tags in the given profile dumps, or, with --token, a '
+            'signed header that enables the profiling of a request.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--token', action='store_true', dest='token',
+                    default=False,
+                    help='Prints a profiling header.'),
+        make_option('--user', dest='user', default='',
+                    help='Name recorded in the token, logged with every '
+                         'profiled request.'),
+        make_option('--limit', type='int', dest='limit', default=30,
+                    help='Number of functions in each summary.'),
+        make_option('--sort', dest='sort', default='cumulative',
+                    help='pstats sort key of the summaries.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['token']:
+            self.stdout.write('{0}: {1}'.format(
+                profiling.get_header(),
+                profiling.make_token(options['user'])))
+            return
+
+        if not args:
+            raise CommandError('Give the profiles to summarise, or --token.')
+
+        for path in args:
+            try:
+                summary = profiling.summarise(path, limit=options['limit'],
+                                              sort=options['sort'])
+            except IOError as e:
+                raise CommandError(e)
+
+            self.stdout.write(summary)
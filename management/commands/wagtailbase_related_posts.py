@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from wagtailbase import related
+
+import time
+
+
+class Command(BaseCommand):
+    help = ('Computes the related posts of every blog post, from the tags '
+            'they share. Run it after bulk changes to the posts or tags, '
+            'single publications update the related posts as they happen.')
+
+    def handle(self, *args, **options):
+        start = time.time()
+        count = related.rebuild()
+
+        self.stdout.write('Computed the related posts of {0} posts in '
+                          '{1:.2f}s.'.format(count, time.time() - start))
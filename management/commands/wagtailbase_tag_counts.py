@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from wagtailbase import tagcloud
+
+import time
+
+
+class Command(BaseCommand):
+    help = ('Counts the posts of every tag of every blog, for the tag clouds '
+            'and the tag autocomplete. Run it after migrating, and after '
+            'bulk changes to the posts or tags, single publications update '
+            'the counts as they happen.')
+
+    def handle(self, *args, **options):
+        start = time.time()
+        count = tagcloud.rebuild()
+
+        self.stdout.write('Counted the tags of {0} blogs in '
+                          '{1:.2f}s.'.format(count, time.time() - start))
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailbase', '0002_blogpost_featured'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedBlogPost',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('post', models.ForeignKey(related_name='+', to='wagtailbase.BlogPost')),
+                ('related', models.ForeignKey(related_name='+', to='wagtailbase.BlogPost')),
+            ],
+            options={
+                'ordering': ['rank'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='relatedblogpost',
+            unique_together=set([('post', 'rank')]),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailbase', '0003_relatedblogpost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogPostViews',
+            fields=[
+                ('post', models.OneToOneField(related_name='views', primary_key=True, serialize=False, to='wagtailbase.BlogPost')),
+                ('count', models.PositiveIntegerField(default=0, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailimages', '0006_add_verbose_names'),
+        ('wagtailbase', '0004_blogpostviews'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResponsiveImage',
+            fields=[
+                ('image', models.OneToOneField(related_name='responsive', primary_key=True, serialize=False, to='wagtailimages.Image')),
+                ('file', models.CharField(max_length=255)),
+                ('src', models.CharField(max_length=255)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('srcset', models.TextField()),
+                ('placeholder', models.TextField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailbase', '0005_responsiveimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baseindexpage',
+            name='items_per_page',
+            field=models.PositiveIntegerField(help_text=b'Number of items in each page of the listing, the site default if not set', null=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import datetime
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailbase', '0006_baseindexpage_items_per_page'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blogpost',
+            name='date',
+            field=models.DateField(default=datetime.date.today, verbose_name=b'Post Date', db_index=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wagtailbase', '0007_blogpost_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogAuthor',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('slug', models.CharField(max_length=255)),
+                ('name', models.CharField(max_length=255)),
+                ('post_count', models.PositiveIntegerField()),
+                ('latest_date', models.DateField()),
+                ('blog', models.ForeignKey(related_name='+', to='wagtailbase.BlogIndexPage')),
+                ('user', models.ForeignKey(related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['name', 'slug'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='blogauthor',
+            unique_together=set([('blog', 'user')]),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taggit', '0001_initial'),
+        ('wagtailbase', '0008_blogauthor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogTagCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=100)),
+                ('key', models.CharField(max_length=100)),
+                ('post_count', models.PositiveIntegerField()),
+                ('blog', models.ForeignKey(related_name='+', to='wagtailbase.BlogIndexPage')),
+                ('tag', models.ForeignKey(related_name='+', to='taggit.Tag')),
+            ],
+            options={
+                'ordering': ['key'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='blogtagcount',
+            unique_together=set([('blog', 'tag')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='blogtagcount',
+            index_together=set([('blog', 'key')]),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import migrations
+from django.db.models import Count, Max
+
+from wagtailbase.util import unslugify
+
+
+def populate_authors(apps, schema_editor):
+    """Builds the author directories of the existing blogs, see
+    wagtailbase.authors."""
+    BlogIndexPage = apps.get_model('wagtailbase', 'BlogIndexPage')
+    BlogPost = apps.get_model('wagtailbase', 'BlogPost')
+    BlogAuthor = apps.get_model('wagtailbase', 'BlogAuthor')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    username_field = get_user_model().USERNAME_FIELD
+
+    for blog in BlogIndexPage.objects.all():
+        counts = list(BlogPost.objects.filter(
+            live=True, path__startswith=blog.path,
+            owner__isnull=False).order_by().values('owner').annotate(
+                count=Count('pk'), latest=Max('date')))
+        users = User.objects.in_bulk([row['owner'] for row in counts])
+        authors = []
+
+        for row in counts:
+            user = users[row['owner']]
+            slug = getattr(user, username_field)
+            name = '{0} {1}'.format(getattr(user, 'first_name', ''),
+                                    getattr(user, 'last_name', '')).strip()
+
+            authors.append(BlogAuthor(
+                blog=blog, user=user, slug=slug,
+                name=name or unslugify(slug), post_count=row['count'],
+                latest_date=row['latest']))
+
+        BlogAuthor.objects.bulk_create(authors)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailbase', '0009_blogtagcount'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_authors, migrations.RunPython.noop),
+    ]
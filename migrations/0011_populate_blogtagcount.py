@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def populate_tag_counts(apps, schema_editor):
+    """Counts the tags of the existing blogs, see wagtailbase.tagcloud."""
+    BlogIndexPage = apps.get_model('wagtailbase', 'BlogIndexPage')
+    BlogPostTag = apps.get_model('wagtailbase', 'BlogPostTag')
+    BlogTagCount = apps.get_model('wagtailbase', 'BlogTagCount')
+    Tag = apps.get_model('taggit', 'Tag')
+
+    for blog in BlogIndexPage.objects.all():
+        counts = dict(BlogPostTag.objects.filter(
+            content_object__live=True,
+            content_object__path__startswith=blog.path).order_by(
+                ).values_list('tag').annotate(
+                    count=Count('content_object', distinct=True)))
+        names = dict(Tag.objects.filter(pk__in=list(counts)).values_list(
+            'pk', 'name'))
+
+        BlogTagCount.objects.bulk_create([
+            BlogTagCount(blog=blog, tag_id=tag_id, name=names[tag_id],
+                         key=names[tag_id].lower(), post_count=post_count)
+            for tag_id, post_count in counts.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailbase', '0010_populate_blogauthor'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_tag_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+INDEX = 'wagtailbase_blogtagcount_blog_id_key_like'
+
+
+def create_index(apps, schema_editor):
+    """On PostgreSQL, the plain index of (blog, key) is not used for the
+    `LIKE 'prefix%'` lookups of the tag autocomplete unless the database
+    uses the C collation, see wagtailbase.tagcloud.complete."""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX {0} ON wagtailbase_blogtagcount '
+            '(blog_id, key varchar_pattern_ops)'.format(INDEX))
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS {0}'.format(INDEX))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailbase', '0011_populate_blogtagcount'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -3,10 +3,9 @@ from base import (AbstractRelatedLink, AbstractAttachment,
 
 from datetime import date
 
-from django.db import models
 from django.conf import settings
+from django.db import models
 from django.conf.urls import url
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.http import Http404
 from django.shortcuts import render
 
@@ -19,11 +18,20 @@ from wagtail.wagtailadmin.edit_handlers import (
     FieldPanel, InlinePanel, MultiFieldPanel)
 from wagtail.wagtailcore.models import Orderable
 from wagtail.contrib.wagtailroutablepage.models import route
-from wagtailbase.util import unslugify
+from wagtailbase import api, archive
+from wagtailbase.instrumentation import instrumented
+from wagtailbase.listings import cached_route
+from wagtailbase.profiling import profiled
+from wagtailbase.purging import record
+from wagtailbase.lookups import resolve_author, resolve_tag
+from wagtailbase.util import attach_blog_indexes, get_month_number
+from wagtailbase import neighbours
+from wagtailbase import related as related_posts  # noqa, registers receivers
+from wagtailbase import renditions  # noqa, registers receivers
+from wagtailbase import tagcloud  # noqa, registers receivers
 
 from wagtail.wagtailsearch import index
 
-import calendar
 import logging
 
 logger = logging.getLogger(__name__)
@@ -52,6 +60,7 @@ IndexPage.content_panels = [
 
 IndexPage.promote_panels = [
     MultiFieldPanel(BaseIndexPage.promote_panels, "Common page configuration"),
+    FieldPanel('items_per_page'),
 ]
 
 
@@ -113,6 +122,8 @@ class BlogIndexPage(BaseIndexPage):
 
     subpage_types = ['BlogPost']
 
+    fragment_template = 'wagtailbase/includes/blog_index_posts_items.html'
+
     @property
     def posts(self):
         """Returns a list of the blog posts that are children of this page."""
@@ -127,33 +138,23 @@ class BlogIndexPage(BaseIndexPage):
 
         return sorted(new_dates, reverse=True)
 
-    def _paginate(self, request, posts):
-        """ Paginate posts """
-
-        # Pagination
-        page = request.GET.get('page')
-        paginator = Paginator(posts, settings.ITEMS_PER_PAGE)
-
-        try:
-            posts = paginator.page(page)
-        except EmptyPage:
-            posts = paginator.page(paginator.num_pages)
-        except PageNotAnInteger:
-            posts = paginator.page(1)
-
-        return posts
-
     @route(r'^$')
+    @profiled
+    @cached_route
+    @instrumented('route.serve_listing')
     def serve_listing(self, request):
         """main listing"""
+        record('blog', self.pk)
         posts = self.posts
 
-        return render(request,
-                      self.get_template(request),
-                      {'self': self,
-                       'posts': self._paginate(request, posts)})
+        return self.render_listing(
+            request, {'self': self,
+                      'posts': self._paginate(request, posts)})
 
     @route(r'^author/(?P<author>[\w ]+)/$')
+    @profiled
+    @cached_route
+    @instrumented('route.author')
     def author(self, request, author=None):
         """listing of posts by a specific author"""
 
@@ -161,34 +162,66 @@ class BlogIndexPage(BaseIndexPage):
             # Invalid author filter
             raise Http404('Invalid Author')
 
-        posts = self.posts.filter(
-            models.Q(owner__username=author) |
-            models.Q(owner__username=unslugify(author)))
+        owner_id = resolve_author(author)
+
+        if owner_id is None:
+            raise Http404('Unknown Author')
+
+        record('author', self.pk, owner_id)
+
+        posts = self.posts.filter(owner_id=owner_id)
+
+        return self.render_listing(
+            request, {'self': self,
+                      'posts': self._paginate(request, posts),
+                      'filter_type': 'author',
+                      'filter': author})
+
+    @route(r'^authors/$')
+    @profiled
+    @cached_route
+    @instrumented('route.authors')
+    def authors(self, request):
+        """directory of the authors of the posts, see `wagtailbase.authors`"""
+        record('blog', self.pk)
+
+        return render(request, 'wagtailbase/blog_authors.html',
+                      {'self': self})
+
+    @route(r'^tags/$')
+    @profiled
+    @cached_route
+    @instrumented('route.tags')
+    def tags(self, request):
+        """index of the tags of the posts, see `wagtailbase.tagcloud`"""
+        record('blog', self.pk)
 
-        return render(request,
-                      self.get_template(request),
-                      {'self': self,
-                       'posts': self._paginate(request, posts),
-                       'filter_type': 'author',
-                       'filter': author})
+        return render(request, 'wagtailbase/blog_tags.html', {'self': self})
 
     @route(r'^tag/(?P<tag>[\w ]+)/$')
+    @profiled
+    @cached_route
+    @instrumented('route.tag')
     def tag(self, request, tag=None):
         """listing of posts in a specific tag"""
         if not tag:
             # Invalid tag filter
             raise Http404('Invalid Tag')
 
-        posts = self.posts.filter(
-            models.Q(tags__name=tag) |
-            models.Q(tags__name=unslugify(tag)))
+        tag_id = resolve_tag(tag)
 
-        return render(request,
-                      self.get_template(request),
-                      {'self': self,
-                       'posts': self._paginate(request, posts),
-                       'filter_type': 'tag',
-                       'filter': tag})
+        if tag_id is None:
+            raise Http404('Unknown Tag')
+
+        record('tag', self.pk, tag_id)
+
+        posts = self.posts.filter(tagged_items__tag_id=tag_id)
+
+        return self.render_listing(
+            request, {'self': self,
+                      'posts': self._paginate(request, posts),
+                      'filter_type': 'tag',
+                      'filter': tag})
 
     @route((r'^date'
             r'/(?P<year>\d{4})'
@@ -202,6 +235,9 @@ class BlogIndexPage(BaseIndexPage):
             r'/(?P<month>(?:\w+|\d{1,2}))'
             r'/(?P<day>\d{1,2})'
             r'/$'))
+    @profiled
+    @cached_route
+    @instrumented('route.date')
     def date(self, request, year=None, month=None, day=None):
         """listing of posts published within a specific year, month, or date"""
 
@@ -210,6 +246,7 @@ class BlogIndexPage(BaseIndexPage):
             raise Http404('Invalid Year')
 
         # filter by date
+        record('date', self.pk, int(year))
         date_filter = {'date__year': int(year)}
         date_factory = [int(year)]
         date_format = 'Y'
@@ -245,27 +282,91 @@ class BlogIndexPage(BaseIndexPage):
             # Invalid date filter
             raise Http404
 
-        return render(request,
-                      self.get_template(request),
-                      {'self': self,
-                       'posts': self._paginate(request, posts),
-                       'filter_type': 'date',
-                       'filter_format': date_format,
-                       'filter': date(*date_factory)})
+        return self.render_listing(
+            request, {'self': self,
+                      'posts': self._paginate(request, posts),
+                      'filter_type': 'date',
+                      'filter_format': date_format,
+                      'filter': date(*date_factory)})
+
+    @route(r'^archive/$')
+    @instrumented('route.archive')
+    def archive(self, request):
+        """streamed listing of all the posts, by year and month, see
+        `wagtailbase.archive`"""
+        record('blog', self.pk)
+
+        return archive.archive(request, self, self.posts)
+
+    @route(r'^api/posts/$')
+    @instrumented('route.api_posts')
+    def api_posts(self, request):
+        """JSON listing of the posts, see `wagtailbase.api`"""
+        return api.listing(request, self, self.posts)
+
+    @route(r'^api/posts/author/(?P<author>[\w ]+)/$')
+    @instrumented('route.api_author')
+    def api_author(self, request, author):
+        """JSON listing of the posts by a specific author"""
+        owner_id = resolve_author(author)
+
+        if owner_id is None:
+            raise Http404('Unknown Author')
+
+        return api.listing(request, self, self.posts.filter(owner_id=owner_id))
+
+    @route(r'^api/posts/tag/(?P<tag>[\w ]+)/$')
+    @instrumented('route.api_tag')
+    def api_tag(self, request, tag):
+        """JSON listing of the posts in a specific tag"""
+        tag_id = resolve_tag(tag)
+
+        if tag_id is None:
+            raise Http404('Unknown Tag')
+
+        return api.listing(request, self, self.posts.filter(
+            tagged_items__tag_id=tag_id))
+
+    @route(r'^api/posts/date/(?P<year>\d{4})/$')
+    @route(r'^api/posts/date/(?P<year>\d{4})/(?P<month>(?:\w+|\d{1,2}))/$')
+    @route((r'^api/posts/date/(?P<year>\d{4})/(?P<month>(?:\w+|\d{1,2}))'
+            r'/(?P<day>\d{1,2})/$'))
+    @instrumented('route.api_date')
+    def api_date(self, request, year, month=None, day=None):
+        """JSON listing of the posts published within a specific year, month,
+        or date"""
+        date_filter = {'date__year': int(year)}
 
-    def get_month_number(self, month):
-        names = dict((v, k) for k, v in enumerate(calendar.month_name))
-        abbrs = dict((v, k) for k, v in enumerate(calendar.month_abbr))
+        try:
+            if month:
+                date_filter['date__month'] = (
+                    self.get_month_number(month) or int(month))
+            if day:
+                date_filter['date__day'] = int(day)
+        except ValueError:
+            raise Http404('Invalid Date')
 
-        month_str = month.title()
+        return api.listing(request, self, self.posts.filter(**date_filter))
 
-        try:
-            return names[month_str]
-        except KeyError:
-            try:
-                return abbrs[month_str]
-            except KeyError:
-                return 0
+    @route(r'^api/tags/$')
+    @instrumented('route.api_tags')
+    def api_tags(self, request):
+        """JSON of the most used tags that start with the `prefix`"""
+        return api.tag_completions(request, self)
+
+    @route(r'^api/posts/(?P<slug>[-\w]+)/$')
+    @instrumented('route.api_post')
+    def api_post(self, request, slug):
+        """JSON of a single post"""
+        response = api.detail(request, self.posts, slug)
+
+        if response is None:
+            raise Http404('Unknown Post')
+
+        return response
+
+    def get_month_number(self, month):
+        return get_month_number(month)
 
 
 class BlogIndexPageRelatedLink(Orderable, AbstractRelatedLink):
@@ -288,6 +389,7 @@ BlogIndexPage.content_panels = [
 BlogIndexPage.promote_panels = [
     MultiFieldPanel(BaseIndexPage.promote_panels,
                     "Common page configuration"),
+    FieldPanel('items_per_page'),
 ]
 
 
@@ -297,7 +399,9 @@ class BlogPostTag(TaggedItemBase):
 
 
 class BlogPost(BaseRichTextPage):
-    date = models.DateField('Post Date', default=date.today)
+    # Indexed for the seeks of the older and newer posts, see
+    # `wagtailbase.neighbours`
+    date = models.DateField('Post Date', default=date.today, db_index=True)
     tags = ClusterTaggableManager(through=BlogPostTag, blank=True)
     featured = models.BooleanField(
         default=False, help_text="Feature this post")
@@ -311,16 +415,42 @@ class BlogPost(BaseRichTextPage):
         index.FilterField('featured'),
     )
 
+    @property
+    def tag_list(self):
+        """Returns the tags of the post, fetched in a single query."""
+        try:
+            return [tagged_item.tag for tagged_item in
+                    self.tagged_items.select_related('tag')]
+        except AttributeError:
+            # Tags held in memory, e.g. when previewing the post
+            return self.tags.all()
+
+    @property
+    def related_posts(self):
+        """Returns the live posts related to this post, most related first,
+        fetched in a single query. See `wagtailbase.related`."""
+        if self.pk is None:
+            return []
+
+        return [entry.related for entry in RelatedBlogPost.objects.filter(
+            post=self, related__live=True).select_related('related')]
+
+    @property
+    def neighbour_posts(self):
+        """Returns the older and the newer post than this one in its blog, as
+        dictionaries of their id, title and date, or None. See
+        `wagtailbase.neighbours`."""
+        return neighbours.get_neighbours(self)
+
     @property
     def blog_index(self):
-        # Find blog index in ancestors
-        for ancestor in reversed(self.get_ancestors()):
-            if isinstance(ancestor.specific, BlogIndexPage):
-                return ancestor
+        """Returns the nearest blog index ancestor of the post, or the first
+        blog index in the database if it has none. Lists of posts can fetch
+        theirs in bulk with `wagtailbase.util.attach_blog_indexes`."""
+        if not hasattr(self, '_blog_index'):
+            attach_blog_indexes([self])
 
-        # No ancestors are blog indexes,
-        # just return first blog index in database
-        return BlogIndexPage.objects.first()
+        return self._blog_index
 
 
 class BlogPostRelatedLink(Orderable, AbstractRelatedLink):
@@ -332,6 +462,78 @@ class BlogPostAttachment(Orderable, AbstractAttachment):
                        related_name='attachments')
 
 
+class RelatedBlogPost(models.Model):
+
+    """A post related to a blog post, with its similarity score and rank.
+    Built by `wagtailbase.related`."""
+    post = models.ForeignKey('wagtailbase.BlogPost', related_name='+')
+    related = models.ForeignKey('wagtailbase.BlogPost', related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['rank']
+        unique_together = ('post', 'rank')
+
+
+class ResponsiveImage(models.Model):
+
+    """The responsive renditions and the placeholder of an image, made when
+    the pages that show it are published. See `wagtailbase.renditions`."""
+    image = models.OneToOneField('wagtailimages.Image', primary_key=True,
+                                 related_name='responsive')
+    # Name of the image file the renditions were made from
+    file = models.CharField(max_length=255)
+    src = models.CharField(max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    srcset = models.TextField()
+    placeholder = models.TextField()
+
+
+class BlogPostViews(models.Model):
+
+    """The number of views of a blog post. Written in batches by
+    `wagtailbase.counters`."""
+    post = models.OneToOneField('wagtailbase.BlogPost', primary_key=True,
+                                related_name='views')
+    count = models.PositiveIntegerField(default=0, db_index=True)
+
+
+class BlogAuthor(models.Model):
+
+    """An author of the posts of a blog, with the number of their live posts
+    and the date of the latest one. Maintained by `wagtailbase.authors`."""
+    blog = models.ForeignKey('wagtailbase.BlogIndexPage', related_name='+')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+')
+    # Argument of the author route
+    slug = models.CharField(max_length=255)
+    name = models.CharField(max_length=255)
+    post_count = models.PositiveIntegerField()
+    latest_date = models.DateField()
+
+    class Meta:
+        ordering = ['name', 'slug']
+        unique_together = ('blog', 'user')
+
+
+class BlogTagCount(models.Model):
+
+    """The number of live posts of a blog with a tag, and the lower case name
+    of the tag for the prefix lookups. Maintained by
+    `wagtailbase.tagcloud`."""
+    blog = models.ForeignKey('wagtailbase.BlogIndexPage', related_name='+')
+    tag = models.ForeignKey('taggit.Tag', related_name='+')
+    name = models.CharField(max_length=100)
+    key = models.CharField(max_length=100)
+    post_count = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['key']
+        unique_together = ('blog', 'tag')
+        index_together = [('blog', 'key')]
+
+
 BlogPost.content_panels = [
     FieldPanel('title', classname='full title'),
     FieldPanel('date'),
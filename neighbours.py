@@ -0,0 +1,95 @@
+"""
+Older and newer posts of the blog posts, for the navigation between posts.
+
+The neighbours of a post are the live posts of its blog, the nearest
+`BlogIndexPage` ancestor, that come right before and right after it in
+`(date, id)` order. Each is found with a seek query on the index of
+`BlogPost.date`, whose entries are ordered by primary key within a date, so
+that a single row is read whatever the size of the blog.
+
+The neighbours are cached per post and date, in a namespace per blog whose
+generation is bumped when a post of the blog is published, unpublished or
+deleted, which covers posts whose date changed. Entries for posts moved to
+another blog expire after `WAGTAILBASE_NEIGHBOUR_CACHE_TIMEOUT` seconds.
+"""
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from wagtail.wagtailcore.signals import page_published, page_unpublished
+
+from wagtailbase import cache
+
+NEIGHBOURS = 'neighbours'
+
+
+def get_timeout():
+    return getattr(settings, 'WAGTAILBASE_NEIGHBOUR_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_blog_path(post):
+    """Returns the path of the nearest blog index ancestor of the post, or of
+    its parent if it has none. The blog index is `BlogPost.blog_index`,
+    fetched at most once per instance."""
+    blog = post.blog_index
+
+    if blog is not None and post.path.startswith(blog.path) and (
+            blog.path != post.path):
+        return blog.path
+
+    return post.path[:-post.steplen]
+
+
+def get_namespace(post):
+    """Returns the cache namespace of the neighbours of the post, that of its
+    blog."""
+    return '{0}-{1}'.format(NEIGHBOURS, get_blog_path(post))
+
+
+def find(post):
+    """Returns the id, title and date of the older and of the newer post than
+    the post, or None for either if there is none."""
+    from wagtailbase.models import BlogPost
+
+    posts = BlogPost.objects.filter(
+        live=True, path__startswith=get_blog_path(post)).exclude(pk=post.pk)
+    older = posts.filter(
+        Q(date__lt=post.date) | Q(date=post.date, pk__lt=post.pk)).order_by(
+            '-date', '-pk')
+    newer = posts.filter(
+        Q(date__gt=post.date) | Q(date=post.date, pk__gt=post.pk)).order_by(
+            'date', 'pk')
+
+    return tuple(
+        (queryset.values('id', 'title', 'date')[:1] or [None])[0]
+        for queryset in (older, newer))
+
+
+def get_neighbours(post):
+    """Returns the older and the newer post than the post, from the cache.
+    See `find`."""
+    if post.pk is None:
+        return None, None
+
+    return cache.get(get_namespace(post), (post.pk, post.date.isoformat()),
+                     lambda: find(post), get_timeout())
+
+
+def invalidate(post):
+    """Invalidates the cached neighbours of the siblings of the post."""
+    cache.bump_generation(get_namespace(post))
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def invalidate_published_post(sender, instance, **kwargs):
+    from wagtailbase.models import BlogPost
+
+    if isinstance(instance, BlogPost):
+        invalidate(instance)
+
+
+@receiver(post_delete, sender='wagtailbase.BlogPost')
+def invalidate_deleted_post(sender, instance, **kwargs):
+    invalidate(instance)
@@ -0,0 +1,127 @@
+"""
+Precomputed page urls.
+
+The urls of the pages are kept in the cache, in maps of page id to the site
+of the page and its path within the site, built for `SHARD_SIZE` consecutive
+ids at a time from the `url_path` of the pages and the site root paths. The
+`pageurl` and `slugurl` tags of wagtailbase and `AbstractLinkField.link` look
+the urls up in these maps, instead of going through the site root paths and
+reversing the url of every page they link to.
+
+The maps are rebuilt when a page is moved, renamed or deleted and when a
+site is edited. Urls are only used for page instances whose `url_path` is
+the one in the map, anything else falls back to wagtail.
+"""
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from wagtail.wagtailcore.models import Page, Site
+
+from wagtailbase import cache
+
+URLS = 'page-urls'
+
+SHARD_SIZE = 1000
+
+
+def get_timeout():
+    return getattr(settings, 'WAGTAILBASE_PAGE_URL_TIMEOUT', 60 * 60)
+
+
+def _build_shard(shard):
+    """Returns the url map of the pages with ids in the given shard."""
+    root_paths = Site.get_site_root_paths()
+    urls = {}
+
+    for pk, url_path in Page.objects.filter(
+            pk__gte=shard * SHARD_SIZE,
+            pk__lt=(shard + 1) * SHARD_SIZE).order_by().values_list(
+                'pk', 'url_path'):
+        # Root paths are ordered from the most specific
+        for site_id, root_path, root_url in root_paths:
+            if url_path.startswith(root_path):
+                urls[pk] = (url_path, site_id, root_url, reverse(
+                    'wagtail_serve', args=(url_path[len(root_path):],)))
+                break
+
+    # The number of sites, urls are relative when there is only one
+    urls[None] = len(root_paths)
+
+    return urls
+
+
+def _get_shard(pk):
+    shard = pk // SHARD_SIZE
+
+    return cache.get(URLS, (shard,), lambda: _build_shard(shard),
+                     get_timeout())
+
+
+def _make_url(shard, entry, current_site):
+    url_path, site_id, root_url, path = entry
+
+    if current_site is None:
+        return path if shard[None] == 1 else root_url + path
+
+    return path if current_site.id == site_id else root_url + path
+
+
+def get_page_url(page, current_site=None):
+    """Returns the url of the page, relative to the current site if given,
+    as `page.relative_url(current_site)` or `page.url` would."""
+    if page.pk is None:
+        return page.relative_url(current_site) if current_site else page.url
+
+    shard = _get_shard(page.pk)
+    entry = shard.get(page.pk)
+
+    if entry is None or entry[0] != page.url_path:
+        # Not routable, or moved since the map was built
+        return page.relative_url(current_site) if current_site else page.url
+
+    return _make_url(shard, entry, current_site)
+
+
+def get_page_url_by_id(pk, current_site=None):
+    """Returns the url of the page with the given id, or None if the page
+    does not exist or is not routable."""
+    shard = _get_shard(pk)
+    entry = shard.get(pk)
+
+    if entry is None:
+        return None
+
+    return _make_url(shard, entry, current_site)
+
+
+@receiver(pre_save)
+def remember_url_path(sender, instance, **kwargs):
+    # Read from the database, rather than noted as every page is loaded,
+    # which would load the url_path of deferred pages one at a time
+    if isinstance(instance, Page) and instance.pk is not None:
+        instance._wagtailbase_url_path = Page.objects.filter(
+            pk=instance.pk).values_list('url_path', flat=True).first()
+
+
+@receiver(post_save)
+def invalidate_urls_on_move(sender, instance, **kwargs):
+    if not isinstance(instance, Page):
+        return
+
+    if kwargs.get('created') or instance.url_path != getattr(
+            instance, '_wagtailbase_url_path', None):
+        cache.bump_generation(URLS)
+
+
+@receiver(post_delete)
+def invalidate_urls_on_delete(sender, **kwargs):
+    if issubclass(sender, Page):
+        cache.bump_generation(URLS)
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def invalidate_urls_on_site_change(sender, **kwargs):
+    cache.bump_generation(URLS)
@@ -0,0 +1,149 @@
+"""
+Opt-in cProfile capture of single page requests.
+
+Set `WAGTAILBASE_PROFILING_DIR` to the directory the profiles are written to.
+Requests that carry a valid signed token in the `X-Wagtailbase-Profile`
+header (see `WAGTAILBASE_PROFILING_HEADER`) are then served, and their
+response rendered, under cProfile. Tokens are made with `make_token`, or
+with::
+
+    python manage.py wagtailbase_profile --token --user <username>
+
+and expire after `WAGTAILBASE_PROFILING_MAX_AGE` seconds. For every profiled
+request a `.prof` dump, readable with `pstats` or snakeviz, and a `.txt`
+summary of the hottest wagtailbase functions and template tags are written,
+and the name of the dump is returned in the same response header.
+
+When `WAGTAILBASE_PROFILING_DIR` is not set, the functions decorated with
+`profiled` are called straight away, at the cost of one settings lookup.
+"""
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from django.utils.decorators import available_attrs
+from django.utils.six import StringIO
+
+import cProfile
+import functools
+import logging
+import os
+import pstats
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SALT = 'wagtailbase.profiling'
+
+# Functions shown in the summaries: the wagtailbase code and template tags
+SUMMARY_FILTER = r'wagtailbase|templatetags'
+
+_local = threading.local()
+
+
+def is_enabled():
+    return bool(getattr(settings, 'WAGTAILBASE_PROFILING_DIR', None))
+
+
+def get_header():
+    return getattr(settings, 'WAGTAILBASE_PROFILING_HEADER',
+                   'X-Wagtailbase-Profile')
+
+
+def make_token(username=''):
+    """Returns a signed token that enables the profiling of the requests
+    that send it in the profiling header."""
+    return signing.dumps({'user': username}, salt=SALT)
+
+
+def get_token_user(request):
+    """Returns the user name in the profiling token of the request, or None
+    if the request has no valid token."""
+    meta_key = 'HTTP_{0}'.format(get_header().upper().replace('-', '_'))
+    token = request.META.get(meta_key)
+
+    if not token:
+        return None
+
+    try:
+        data = signing.loads(token, salt=SALT, max_age=getattr(
+            settings, 'WAGTAILBASE_PROFILING_MAX_AGE', 60 * 60))
+    except signing.BadSignature:
+        logger.warning('Invalid profiling token for %s', request.path)
+        return None
+
+    return data.get('user', '')
+
+
+def summarise(source, limit=30, sort='cumulative'):
+    """Returns the summary of the hottest wagtailbase functions and template
+    tags in the profile, either a cProfile.Profile or the path of a dump."""
+    stream = StringIO()
+    stats = pstats.Stats(source, stream=stream)
+    stats.sort_stats(sort).print_stats(SUMMARY_FILTER, limit)
+
+    return stream.getvalue()
+
+
+def dump(profiler, name):
+    """Writes the profile and its summary to the profiling directory.
+    Returns the path of the profile."""
+    directory = settings.WAGTAILBASE_PROFILING_DIR
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    path = os.path.join(directory, '{0}-{1}-{2}.prof'.format(
+        timezone.now().strftime('%Y%m%d-%H%M%S'), name, uuid.uuid4().hex[:8]))
+
+    profiler.create_stats()
+    profiler.dump_stats(path)
+
+    with open('{0}.txt'.format(os.path.splitext(path)[0]), 'w') as f:
+        f.write(summarise(path))
+
+    return path
+
+
+def _serve(func, page, request, *args, **kwargs):
+    response = func(page, request, *args, **kwargs)
+
+    # Template responses are rendered lazily, after the view returns, so
+    # they are rendered here to profile the templates and tags too
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.render()
+
+    return response
+
+
+def profiled(func):
+    """Decorator for the serve method and the routes of the pages, that
+    profiles the requests with a valid profiling token. Nested calls are
+    profiled as part of the outermost one. Whether profiling is enabled is
+    checked on every call."""
+    @functools.wraps(func, assigned=available_attrs(func))
+    def wrapper(page, request, *args, **kwargs):
+        if not is_enabled() or getattr(_local, 'active', False):
+            return func(page, request, *args, **kwargs)
+
+        user = get_token_user(request)
+
+        if user is None:
+            return func(page, request, *args, **kwargs)
+
+        profiler = cProfile.Profile()
+        _local.active = True
+
+        try:
+            response = profiler.runcall(
+                _serve, func, page, request, *args, **kwargs)
+        finally:
+            _local.active = False
+
+        path = dump(profiler, '{0}-{1}'.format(page.pk, func.__name__))
+        logger.info('Profiled %s for %s in %s', request.path, user, path)
+        response[get_header()] = os.path.basename(path)
+
+        return response
+
+    return wrapper
@@ -0,0 +1,314 @@
+"""
+Dependency tracked purging of the frontend cache (a CDN or a caching proxy)
+when pages are published or unpublished.
+
+While a page is rendered, the pages and collections it shows are recorded
+as dependencies, e.g. `('page', 3)` for the page itself, `('children',
+path)` for the menus and listings of the children of a page, `('blog', 5)`
+for the post listing of a blog or `('tag', 5, 12)` for the posts of a blog
+with a tag. `DependencyMiddleware` then adds the url of the response to the
+registry of each of its dependencies, kept in the cache.
+
+When a page is published or unpublished, the dependencies it affects are
+worked out, and kept until its next publication. The urls recorded for them
+and for those it had at its last publication, together with the canonical
+urls of the page, are sent in batches of `WAGTAILBASE_PURGE_BATCH_SIZE` to the
+purge endpoint in `WAGTAILBASE_PURGE_ENDPOINT`, as JSON POST requests with a
+`urls` list. `PurgeStub` stands in for the endpoint locally.
+
+Nothing is recorded or purged while `WAGTAILBASE_PURGE_ENDPOINT` is not set.
+"""
+from django.conf import settings
+from django.core.urlresolvers import NoReverseMatch
+from django.dispatch import receiver
+from django.utils.six.moves import BaseHTTPServer
+from django.utils.six.moves.urllib.request import Request, urlopen
+
+from wagtail.wagtailcore.signals import page_published, page_unpublished
+
+from wagtailbase import cache
+
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEPENDENCIES = 'purge-dependencies'
+SLOT = 'purge-slot'
+RECORDED = 'purge-recorded'
+PUBLISHED = 'purge-published'
+
+REGISTRY_TIMEOUT = 60 * 60 * 24 * 7
+
+# Number of keys read from the shared cache at once
+GET_MANY_SIZE = 1000
+
+_local = threading.local()
+
+
+def is_enabled():
+    return bool(getattr(settings, 'WAGTAILBASE_PURGE_ENDPOINT', None))
+
+
+def record(*dependency):
+    """Records that the response being rendered depends on the given page
+    or collection."""
+    dependencies = getattr(_local, 'dependencies', None)
+
+    if dependencies is not None:
+        dependencies.add(dependency)
+
+
+def _registry_key(dependency):
+    return cache.make_key(DEPENDENCIES, *dependency)
+
+
+def _slot_key(dependency, slot):
+    return cache.make_key(SLOT, slot, *dependency)
+
+
+def _marker_key(url, dependency):
+    return cache.make_key(RECORDED, url, *dependency)
+
+
+def _get_many(shared, keys):
+    keys = list(keys)
+    values = {}
+
+    for start in range(0, len(keys), GET_MANY_SIZE):
+        values.update(shared.get_many(keys[start:start + GET_MANY_SIZE]))
+
+    return values
+
+
+def _next_slot(shared, dependency):
+    key = _registry_key(dependency)
+
+    for attempt in range(2):
+        shared.add(key, 0, REGISTRY_TIMEOUT)
+
+        try:
+            return shared.incr(key) - 1
+        except ValueError:
+            # Evicted between the add and the increment
+            pass
+
+    return None
+
+
+def register(url, dependencies):
+    """Adds the url to the registry of each of the dependencies.
+
+    The registry of a dependency is a counter of numbered slots, each
+    holding a url, so that concurrent workers add their urls with an atomic
+    increment instead of rewriting a shared set. The marker of each url and
+    dependency holds the slot of the url, which is only trusted while the
+    slot still holds the url and is within the counter, so that a url whose
+    registry entries were evicted is added again on its next response."""
+    shared = cache.get_cache().shared
+    markers = dict((_marker_key(url, dependency), dependency)
+                   for dependency in dependencies)
+    slots = shared.get_many(list(markers))
+    held = shared.get_many(
+        [_slot_key(markers[marker], slot) for marker, slot in slots.items()] +
+        [_registry_key(markers[marker]) for marker in slots])
+
+    for marker, dependency in markers.items():
+        slot = slots.get(marker)
+
+        if (slot is not None and
+                held.get(_slot_key(dependency, slot)) == url and
+                slot < held.get(_registry_key(dependency), 0)):
+            continue
+
+        slot = _next_slot(shared, dependency)
+
+        if slot is not None:
+            shared.set(_slot_key(dependency, slot), url, REGISTRY_TIMEOUT)
+            shared.set(marker, slot, REGISTRY_TIMEOUT)
+
+
+def get_urls(dependencies):
+    """Returns the urls recorded for the dependencies."""
+    shared = cache.get_cache().shared
+    dependencies = list(dependencies)
+    counts = shared.get_many(
+        [_registry_key(dependency) for dependency in dependencies])
+
+    return set(_get_many(shared, (
+        _slot_key(dependency, slot) for dependency in dependencies
+        for slot in range(counts.get(_registry_key(dependency), 0))
+    )).values())
+
+
+def get_dependencies(page):
+    """Returns the dependencies affected by the publication of the page."""
+    from wagtailbase.models import BlogPost
+
+    dependencies = set([('page', page.pk), ('children', page.path),
+                        ('children', page.path[:-page.steplen])])
+
+    if isinstance(page, BlogPost):
+        blog = page.blog_index
+
+        dependencies.add(('latest', None))
+
+        if blog is not None:
+            dependencies.update([
+                ('blog', blog.pk),
+                ('author', blog.pk, page.owner_id),
+                ('date', blog.pk, page.date.year),
+                ('latest', blog.pk),
+            ])
+            dependencies.update(
+                ('tag', blog.pk, tag_id) for tag_id in
+                page.tagged_items.values_list('tag_id', flat=True))
+
+    return dependencies
+
+
+def get_canonical_urls(page):
+    """Returns the urls of the page, and for blog posts of the listings of
+    their blog, that are purged even if they were not recorded."""
+    from wagtailbase.models import BlogPost
+
+    urls = set([page.full_url])
+
+    if isinstance(page, BlogPost):
+        blog = page.blog_index
+
+        if blog is not None:
+            blog = blog.specific
+            urls.add(blog.full_url)
+
+            try:
+                urls.add(blog.full_url + blog.reverse_subpage(
+                    'author', args=[page.owner.get_username()]))
+            except (AttributeError, NoReverseMatch):
+                # No owner, or an owner name the author route does not take
+                pass
+
+            urls.add(blog.full_url + blog.reverse_subpage(
+                'date', args=[str(page.date.year)]))
+
+    urls.discard(None)
+
+    return urls
+
+
+def purge(urls):
+    """Sends the urls to the purge endpoint, in batches. Errors are logged,
+    a failed purge must not fail the publication."""
+    endpoint = settings.WAGTAILBASE_PURGE_ENDPOINT
+    batch_size = getattr(settings, 'WAGTAILBASE_PURGE_BATCH_SIZE', 100)
+    urls = sorted(urls)
+
+    for start in range(0, len(urls), batch_size):
+        batch = urls[start:start + batch_size]
+        request = Request(
+            endpoint, json.dumps({'urls': batch}).encode('utf-8'),
+            {'Content-Type': 'application/json'})
+
+        try:
+            urlopen(request, timeout=getattr(
+                settings, 'WAGTAILBASE_PURGE_TIMEOUT', 5)).close()
+        except Exception:
+            logger.exception('Cannot purge %s urls', len(batch))
+
+
+def get_page_urls(page):
+    """Returns the urls affected by the publication of the page: those
+    recorded for its dependencies, and for the dependencies it had when it
+    was last published, e.g. the listings of a date, tag or author it no
+    longer belongs to, with its canonical urls."""
+    shared = cache.get_cache().shared
+    key = cache.make_key(PUBLISHED, page.pk)
+    dependencies = get_dependencies(page)
+
+    urls = (get_urls(dependencies | (shared.get(key) or set())) |
+            get_canonical_urls(page))
+    shared.set(key, dependencies, None)
+
+    return urls
+
+
+def purge_page(page):
+    """Purges the urls affected by the publication of the page."""
+    urls = get_page_urls(page.specific)
+
+    if urls:
+        purge(urls)
+
+    return urls
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def purge_published_page(sender, instance, **kwargs):
+    if is_enabled():
+        purge_page(instance)
+
+
+class DependencyMiddleware(object):
+
+    """Records the dependencies of the successful anonymous GET responses,
+    under their absolute urls."""
+
+    def process_request(self, request):
+        if is_enabled():
+            _local.dependencies = set()
+
+    def process_response(self, request, response):
+        dependencies = getattr(_local, 'dependencies', None)
+
+        if dependencies is None:
+            return response
+
+        del _local.dependencies
+
+        user = getattr(request, 'user', None)
+        if (dependencies and request.method == 'GET' and
+                response.status_code == 200 and
+                (user is None or not user.is_authenticated())):
+            register(request.build_absolute_uri(), dependencies)
+
+        return response
+
+
+class PurgeStub(object):
+
+    """Local stand-in for the purge endpoint. Serves on a free local port
+    from a background thread, and keeps the urls it is sent."""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.urls = []
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                data = json.loads(self.rfile.read(length).decode('utf-8'))
+                stub.requests += 1
+                stub.urls.extend(data['urls'])
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = BaseHTTPServer.HTTPServer((host, port), Handler)
+        self.endpoint = 'http://{0}:{1}/'.format(*self.server.server_address)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,281 @@
+"""
+Precomputed related posts.
+
+The posts related to each live blog post are the posts that share the most
+tags with it, scored by the cosine similarity of their tags, and stored in
+`RelatedBlogPost` with their rank, so that the `related_blog_posts` tag reads
+them with a single indexed query.
+
+The scores are computed from a sparse post by tag matrix, held as the tags
+of every post and the posts of every tag: only the pairs of posts that share
+a tag are ever scored. `rebuild` computes the related posts of every post,
+it is run by the `wagtailbase_related_posts` command. When a post is
+published or unpublished, only the posts whose related posts change are
+updated, see `update`: the other posts that share a tag with it are not
+scored again.
+
+`WAGTAILBASE_RELATED_POSTS` sets how many related posts are kept for each
+post, `WAGTAILBASE_RELATED_POSTS_ON_PUBLISH = False` turns off the updates
+on publication.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.dispatch import receiver
+
+from wagtail.wagtailcore.signals import page_published, page_unpublished
+
+import heapq
+import math
+
+BATCH_SIZE = 500
+
+
+def get_count():
+    return getattr(settings, 'WAGTAILBASE_RELATED_POSTS', 5)
+
+
+def _batches(ids):
+    ids = sorted(set(ids))
+
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def build_matrix(post_ids=None):
+    """Returns the sparse post by tag matrix of the live posts, as the tags
+    of every post and the posts of every tag, and the number of tags of
+    every post. Given the ids of the posts to score, only the rows of the
+    tags of those posts are read, with the number of tags of the posts that
+    share one of them, which is all that scoring those posts needs."""
+    from wagtailbase.models import BlogPostTag
+
+    post_tags = defaultdict(set)
+    tag_posts = defaultdict(set)
+    items = BlogPostTag.objects.filter(content_object__live=True)
+
+    if post_ids is None:
+        rows = items.values_list('content_object_id', 'tag_id')
+    else:
+        tag_ids = set()
+        for batch in _batches(post_ids):
+            tag_ids.update(BlogPostTag.objects.filter(
+                content_object__in=batch).values_list('tag_id', flat=True))
+
+        rows = []
+        for batch in _batches(tag_ids):
+            rows.extend(items.filter(tag__in=batch).values_list(
+                'content_object_id', 'tag_id'))
+
+    for post_id, tag_id in rows:
+        post_tags[post_id].add(tag_id)
+        tag_posts[tag_id].add(post_id)
+
+    if post_ids is None:
+        sizes = dict((post_id, len(tags)) for post_id, tags in
+                     post_tags.items())
+    else:
+        sizes = {}
+        for batch in _batches(post_tags):
+            sizes.update(items.filter(content_object__in=batch).order_by(
+            ).values_list('content_object').annotate(Count('tag')))
+
+    return post_tags, tag_posts, sizes
+
+
+def similarities(post_id, post_tags, tag_posts, sizes=None):
+    """Returns the cosine similarity of the post to every other post that
+    shares a tag with it, by id. The number of tags of each post, if not
+    given, is that in `post_tags`."""
+    tags = post_tags.get(post_id)
+
+    if not tags:
+        return {}
+
+    shared = defaultdict(int)
+
+    for tag_id in tags:
+        for other_id in tag_posts[tag_id]:
+            shared[other_id] += 1
+
+    shared.pop(post_id, None)
+
+    if sizes is None:
+        sizes = dict((other_id, len(post_tags[other_id])) for other_id in
+                     shared)
+
+    norm = math.sqrt(len(tags))
+
+    return dict((other_id, shared_tags / (norm * math.sqrt(sizes[other_id])))
+                for other_id, shared_tags in shared.items())
+
+
+def top(scores, count):
+    """Returns the count items of the scores, by id, with the highest
+    scores, highest first. Ties go to the most recent ids."""
+    return [(other_id, value) for value, other_id in heapq.nlargest(
+        count, ((value, other_id) for other_id, value in scores.items()))]
+
+
+def score(post_id, post_tags, tag_posts, count, sizes=None):
+    """Returns the ids and scores of the count posts most similar to the
+    post, most similar first. Ties go to the most recent ids. The number of
+    tags of each post, if not given, is that in `post_tags`."""
+    return top(similarities(post_id, post_tags, tag_posts, sizes), count)
+
+
+def _lock(post_ids):
+    """Locks the posts, in id order, so that concurrent updates of the same
+    posts run one after the other. Must be called in a transaction."""
+    from wagtailbase.models import BlogPost
+
+    for batch in _batches(post_ids):
+        list(BlogPost.objects.select_for_update().filter(
+            pk__in=batch).order_by('pk').values_list('pk', flat=True))
+
+
+def _store(lists):
+    """Stores the related posts of the posts, given as the ids and scores of
+    the related posts of every post, by id."""
+    from wagtailbase.models import RelatedBlogPost
+
+    for batch in _batches(lists):
+        RelatedBlogPost.objects.filter(post__in=batch).delete()
+
+    RelatedBlogPost.objects.bulk_create(
+        (RelatedBlogPost(post_id=post_id, related_id=related_id,
+                         score=value, rank=rank)
+         for post_id, entries in lists.items()
+         for rank, (related_id, value) in enumerate(entries)),
+        batch_size=BATCH_SIZE)
+
+
+def rebuild(post_ids=None):
+    """Computes and stores the related posts of the posts with the given
+    ids, or of all the posts. Returns the number of posts computed.
+
+    The posts are locked first, in id order, so that concurrent rebuilds of
+    the same posts, e.g. of two publications, run one after the other."""
+    from wagtailbase.models import BlogPost, RelatedBlogPost
+
+    count = get_count()
+    rebuild_all = post_ids is None
+
+    with transaction.atomic():
+        if rebuild_all:
+            post_ids = list(BlogPost.objects.select_for_update().order_by(
+                'pk').values_list('pk', flat=True))
+        else:
+            post_ids = sorted(set(post_ids))
+            _lock(post_ids)
+
+        post_tags, tag_posts, sizes = build_matrix(
+            None if rebuild_all else post_ids)
+        lists = dict((post_id, score(post_id, post_tags, tag_posts, count,
+                                     sizes))
+                     for post_id in post_ids)
+
+        if rebuild_all:
+            RelatedBlogPost.objects.all().delete()
+
+        _store(lists)
+
+    return len(post_ids)
+
+
+def _get_changed(post_ids, exclude, count):
+    """Returns the ids of the posts, other than those in exclude, that share
+    a tag with one of the posts with the given ids and whose related posts
+    one of them now ranks among, reading only the last of the stored related
+    posts of each."""
+    from wagtailbase.models import RelatedBlogPost
+
+    post_tags, tag_posts, sizes = build_matrix(post_ids)
+    candidates = defaultdict(list)
+
+    for post_id in post_ids:
+        for other_id, value in similarities(
+                post_id, post_tags, tag_posts, sizes).items():
+            if other_id not in exclude:
+                candidates[other_id].append((value, post_id))
+
+    changed = set()
+
+    for batch in _batches(candidates):
+        last = dict((post_id, (value, related_id)) for
+                    post_id, related_id, value in
+                    RelatedBlogPost.objects.filter(
+                        post__in=batch, rank=count - 1).values_list(
+                            'post_id', 'related_id', 'score'))
+
+        # Posts with fewer related posts than count take any other one
+        changed.update(other_id for other_id in batch
+                       if other_id not in last or
+                       max(candidates[other_id]) > last[other_id])
+
+    return changed
+
+
+def update(post_ids):
+    """Updates the related posts affected by the publication or the
+    unpublication of the posts with the given ids. Returns the number of
+    posts whose related posts were stored again.
+
+    The related posts of the posts, and of the posts that had one of them
+    among theirs, are computed again. The other posts that share a tag with
+    them keep the related posts they have, which the publication does not
+    change, unless one of the posts now ranks among them: it is then merged
+    into them. Only the posts whose related posts change are locked."""
+    from wagtailbase.models import RelatedBlogPost
+
+    count = get_count()
+    post_ids = set(post_ids)
+    recompute = set(post_ids)
+
+    for batch in _batches(post_ids):
+        recompute.update(RelatedBlogPost.objects.filter(
+            related__in=batch).values_list('post_id', flat=True))
+
+    changed = _get_changed(post_ids, recompute, count)
+
+    with transaction.atomic():
+        _lock(recompute | changed)
+
+        post_tags, tag_posts, sizes = build_matrix(recompute)
+        lists = dict((post_id, score(post_id, post_tags, tag_posts, count,
+                                     sizes))
+                     for post_id in recompute)
+
+        # The stored related posts of the changed posts, read again now
+        # that they are locked, with the posts merged in
+        merged = defaultdict(dict)
+        for batch in _batches(changed):
+            for post_id, related_id, value in RelatedBlogPost.objects.filter(
+                    post__in=batch).values_list(
+                        'post_id', 'related_id', 'score'):
+                merged[post_id][related_id] = value
+
+        for post_id in post_ids:
+            for other_id, value in similarities(
+                    post_id, post_tags, tag_posts, sizes).items():
+                if other_id in changed:
+                    merged[other_id][post_id] = value
+
+        lists.update((post_id, top(scores, count))
+                     for post_id, scores in merged.items())
+
+        _store(lists)
+
+    return len(lists)
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def update_related_posts(sender, instance, **kwargs):
+    from wagtailbase.models import BlogPost
+
+    if (isinstance(instance, BlogPost) and
+            getattr(settings, 'WAGTAILBASE_RELATED_POSTS_ON_PUBLISH', True)):
+        update([instance.pk])
@@ -0,0 +1,170 @@
+"""
+Responsive renditions and placeholders of the attachment images.
+
+When a page is published, the renditions of its attachment images are made
+at each of the `WAGTAILBASE_RESPONSIVE_WIDTHS`, together with a tiny blurred
+placeholder encoded as a data URI, and stored in `ResponsiveImage`. The work
+is done in a pool of `WAGTAILBASE_RENDITION_WORKERS` background threads, or
+in the publishing request when that is 0.
+
+The attachments template then writes the `srcset`, the lazy loading
+attributes and the inline placeholder from the stored data, fetched together
+with the attachments, without looking up any rendition. Images without
+stored renditions, e.g. in previews of unpublished pages, are rendered at a
+single width as before.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from wagtail.wagtailcore.signals import page_published
+from wagtail.wagtailimages.models import Image
+
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+
+import base64
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = (320, 640, 1000, 1600)
+
+# Width of the rendition in the src attribute, for browsers without srcset
+DEFAULT_SRC_WIDTH = 1000
+
+PLACEHOLDER_WIDTH = 16
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_widths():
+    return getattr(settings, 'WAGTAILBASE_RESPONSIVE_WIDTHS', DEFAULT_WIDTHS)
+
+
+def get_workers():
+    return getattr(settings, 'WAGTAILBASE_RENDITION_WORKERS', 2)
+
+
+def make_placeholder(image):
+    """Returns a tiny JPEG version of the image, as a data URI."""
+    from PIL import Image as PILImage
+
+    image.file.open('rb')
+    try:
+        placeholder = PILImage.open(image.file)
+        placeholder = placeholder.convert('RGB')
+        placeholder.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH))
+
+        data = BytesIO()
+        placeholder.save(data, 'JPEG', quality=40)
+    finally:
+        image.file.close()
+
+    return 'data:image/jpeg;base64,{0}'.format(
+        base64.b64encode(data.getvalue()).decode('ascii'))
+
+
+def update_image(image):
+    """Makes the renditions and the placeholder of the image, and stores
+    them. Returns the stored `ResponsiveImage`."""
+    from wagtailbase.models import ResponsiveImage
+
+    renditions = {}
+
+    for width in sorted(get_widths()):
+        rendition = image.get_rendition('width-{0}'.format(width))
+        # Images are not scaled up, larger widths give the same rendition
+        renditions.setdefault(rendition.width, rendition)
+
+    widths = sorted(renditions)
+    default = renditions[max([width for width in widths
+                              if width <= DEFAULT_SRC_WIDTH] or widths[:1])]
+
+    responsive, created = ResponsiveImage.objects.update_or_create(
+        image=image, defaults={
+            'file': image.file.name,
+            'src': default.url,
+            'width': default.width,
+            'height': default.height,
+            'srcset': ', '.join('{0} {1}w'.format(renditions[width].url, width)
+                                for width in widths),
+            'placeholder': make_placeholder(image),
+        })
+
+    return responsive
+
+
+def _update_images(image_ids):
+    try:
+        for image in Image.objects.filter(pk__in=image_ids):
+            try:
+                update_image(image)
+            except Exception:
+                logger.exception('Cannot make the renditions of image %s',
+                                 image.pk)
+    finally:
+        if get_workers():
+            # The connection of a pool thread
+            connection.close()
+
+
+def get_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(get_workers())
+
+    return _pool
+
+
+def get_missing(page):
+    """Returns the ids of the attachment images of the page that have no
+    stored renditions, or renditions of a previous file."""
+    from wagtailbase.models import ResponsiveImage
+
+    attachments = getattr(page, 'attachments', None)
+
+    if attachments is None:
+        return []
+
+    # Read from the database, the page may hold its attachments in memory
+    images = dict(attachments.model._default_manager.filter(
+        page=page.pk, image__isnull=False).values_list(
+            'image_id', 'image__file'))
+    stored = dict(ResponsiveImage.objects.filter(
+        image__in=list(images)).values_list('image_id', 'file'))
+
+    return [image_id for image_id, name in images.items()
+            if stored.get(image_id) != name]
+
+
+def update_page(page):
+    """Makes the renditions of the attachment images of the page that need
+    them, in the background if there are workers."""
+    image_ids = get_missing(page)
+
+    if not image_ids:
+        return
+
+    if get_workers():
+        get_pool().apply_async(_update_images, (image_ids,))
+    else:
+        _update_images(image_ids)
+
+
+@receiver(page_published)
+def update_published_page(sender, instance, **kwargs):
+    update_page(instance)
+
+
+@receiver(post_save, sender=Image)
+def discard_replaced_image(sender, instance, **kwargs):
+    from wagtailbase.models import ResponsiveImage
+
+    ResponsiveImage.objects.filter(image=instance).exclude(
+        file=instance.file.name).delete()
@@ -0,0 +1,140 @@
+"""
+Routing of the public reads to read replicas.
+
+Add the router and the middleware, and list the aliases of the replicas::
+
+    DATABASE_ROUTERS = ['wagtailbase.routers.ReplicaRouter']
+    WAGTAILBASE_DB_REPLICAS = ['replica']
+
+`ReplicaMiddleware` picks a replica for each public request: an anonymous
+GET or HEAD request outside the admin (`WAGTAILBASE_PRIMARY_PATHS`). Every
+read in a public request, e.g. the blog routes, menus and sidebar tags, then
+goes to that replica. All the other requests, and everything outside a
+request, use the primary database.
+
+Once a request saves, deletes, publishes or unpublishes anything, the
+following requests of the same browser are pinned to the primary for
+`WAGTAILBASE_REPLICA_PIN_SECONDS`, so that they do not read stale data from
+a replica that is behind.
+
+The values stored in the wagtailbase caches are computed on the primary, see
+`use_primary`: a publication bumps the generations of the caches, and a
+replica that is behind would otherwise fill the new generation with the
+data from before the publication, e.g. cache a new tag as missing.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from contextlib import contextmanager
+
+from wagtail.wagtailcore.signals import page_published, page_unpublished
+
+import random
+import threading
+import time
+
+PIN_COOKIE = 'wagtailbase_primary'
+
+_local = threading.local()
+
+
+def get_replicas():
+    return getattr(settings, 'WAGTAILBASE_DB_REPLICAS', [])
+
+
+def get_read_alias():
+    """Returns the replica picked for the current request, or None."""
+    return getattr(_local, 'alias', None)
+
+
+@contextmanager
+def use_primary():
+    """Sends the reads of the block to the primary, e.g. to compute a value
+    to cache."""
+    alias = get_read_alias()
+    _local.alias = None
+
+    try:
+        yield
+    finally:
+        _local.alias = alias
+
+
+def is_public(request):
+    """Returns True if the request can read from a replica."""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+
+    for path in getattr(settings, 'WAGTAILBASE_PRIMARY_PATHS',
+                        ('/admin/', '/wagtail/', '/django-admin/')):
+        if request.path.startswith(path):
+            return False
+
+    try:
+        if int(request.COOKIES.get(PIN_COOKIE, 0)) > time.time():
+            return False
+    except ValueError:
+        pass
+
+    user = getattr(request, 'user', None)
+
+    return user is None or not user.is_authenticated()
+
+
+class ReplicaRouter(object):
+
+    """Sends the reads of the public requests to their replica, everything
+    else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in getattr(
+                settings, 'WAGTAILBASE_PRIMARY_APPS', ('sessions',)):
+            return DEFAULT_DB_ALIAS
+
+        return get_read_alias() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+
+class ReplicaMiddleware(object):
+
+    """Picks the database of each request, and pins the browsers that made
+    changes to the primary. Must come after the authentication middleware."""
+
+    def process_request(self, request):
+        _local.wrote = False
+        _local.alias = None
+        replicas = get_replicas()
+
+        if replicas and is_public(request):
+            _local.alias = random.choice(replicas)
+
+    def process_response(self, request, response):
+        wrote = getattr(_local, 'wrote', False)
+        _local.alias = None
+        _local.wrote = False
+
+        if wrote:
+            seconds = getattr(settings, 'WAGTAILBASE_REPLICA_PIN_SECONDS', 15)
+            response.set_cookie(PIN_COOKIE, str(int(time.time() + seconds)),
+                                max_age=seconds, httponly=True)
+
+        return response
+
+    def process_exception(self, request, exception):
+        _local.alias = None
+
+
+@receiver(post_save)
+@receiver(post_delete)
+@receiver(page_published)
+@receiver(page_unpublished)
+def pin_to_primary(sender, **kwargs):
+    _local.wrote = True
@@ -43,5 +43,100 @@ SOUTH_MIGRATION_MODULES = {
 
 ITEMS_PER_PAGE = 10
 
+# Upper limit of the page size that index pages can set for their listings
+WAGTAILBASE_MAX_ITEMS_PER_PAGE = 100
+
 ALLOW_COMMENTS = True
 DISQUS_SHORTNAME = None
+
+# Timing and query count instrumentation of the wagtailbase tags and routes,
+# it also needs wagtailbase.instrumentation.InstrumentationMiddleware
+WAGTAILBASE_INSTRUMENTATION = False
+WAGTAILBASE_METRICS_SINK = None
+
+# Directory of the cProfile dumps of the requests sent with a signed profiling
+# token, see wagtailbase.profiling. Profiling is disabled when not set
+WAGTAILBASE_PROFILING_DIR = None
+WAGTAILBASE_PROFILING_HEADER = 'X-Wagtailbase-Profile'
+WAGTAILBASE_PROFILING_MAX_AGE = 60 * 60
+
+# Seconds the blog listings and sidebar posts are cached, 0 disables the
+# cache, and seconds more their stale renders are served while one worker
+# refreshes them, see wagtailbase.listings
+WAGTAILBASE_LISTING_CACHE_TIMEOUT = 300
+WAGTAILBASE_LISTING_CACHE_STALE_TIMEOUT = 60 * 60
+
+# Cache of the wagtailbase lookups, and its in-process tier: maximum number
+# of entries (0 disables it), seconds entries are kept, and seconds between
+# the checks for invalidations made by other workers, see wagtailbase.cache
+WAGTAILBASE_CACHE = 'default'
+WAGTAILBASE_LOCAL_CACHE_MAX_ENTRIES = 1000
+WAGTAILBASE_LOCAL_CACHE_TIMEOUT = 60
+WAGTAILBASE_GENERATION_CHECK_INTERVAL = 1
+WAGTAILBASE_MENU_CACHE_TIMEOUT = 300
+
+# Renders main_menu, local_menu and latest_blog_post as edge side includes,
+# with the given max ages, see wagtailbase.fragments
+WAGTAILBASE_ESI = False
+WAGTAILBASE_ESI_MAX_AGES = {
+    'main_menu': 300,
+    'local_menu': 300,
+    'latest_blog_post': 60,
+}
+
+# Frontend cache purge endpoint, the urls affected by a publication are sent
+# to it in batches, see wagtailbase.purging. Also needs
+# wagtailbase.purging.DependencyMiddleware
+WAGTAILBASE_PURGE_ENDPOINT = None
+WAGTAILBASE_PURGE_BATCH_SIZE = 100
+WAGTAILBASE_PURGE_TIMEOUT = 5
+
+# Aliases of the read replicas the public requests read from, with
+# DATABASE_ROUTERS = ['wagtailbase.routers.ReplicaRouter'] and
+# wagtailbase.routers.ReplicaMiddleware, see wagtailbase.routers
+WAGTAILBASE_DB_REPLICAS = []
+WAGTAILBASE_REPLICA_PIN_SECONDS = 15
+WAGTAILBASE_PRIMARY_PATHS = ('/admin/', '/wagtail/', '/django-admin/')
+WAGTAILBASE_PRIMARY_APPS = ('sessions',)
+
+# Time the precomputed page urls are kept for, they are also rebuilt when a
+# page is moved or renamed and when a site is edited, see wagtailbase.pageurls
+WAGTAILBASE_PAGE_URL_TIMEOUT = 60 * 60
+
+# Number of related posts kept for each blog post, and whether they are
+# updated when posts are published, see wagtailbase.related
+WAGTAILBASE_RELATED_POSTS = 5
+WAGTAILBASE_RELATED_POSTS_ON_PUBLISH = True
+
+# Counts the views of the blog posts in memory, and writes them every
+# WAGTAILBASE_VIEW_FLUSH_INTERVAL seconds, see wagtailbase.counters
+WAGTAILBASE_VIEW_COUNTS = False
+WAGTAILBASE_VIEW_FLUSH_INTERVAL = 60
+
+# Widths of the responsive renditions of the attachment images, made when
+# pages are published by this many background threads (0 makes them in the
+# publishing request), see wagtailbase.renditions
+WAGTAILBASE_RESPONSIVE_WIDTHS = (320, 640, 1000, 1600)
+WAGTAILBASE_RENDITION_WORKERS = 2
+
+# Number of posts read at a time by the streamed blog archives, see
+# wagtailbase.archive
+WAGTAILBASE_ARCHIVE_CHUNK_SIZE = 500
+
+# Time the older and newer posts of each blog post are cached for, they are
+# also invalidated when a post of the blog is published, see
+# wagtailbase.neighbours
+WAGTAILBASE_NEIGHBOUR_CACHE_TIMEOUT = 60 * 60
+
+# Time the author directory of each blog is cached for, it is also
+# invalidated when a post is published, see wagtailbase.authors
+WAGTAILBASE_AUTHOR_CACHE_TIMEOUT = 60 * 60
+
+# Time the tag cloud of each blog is cached for, it is also invalidated when
+# a post is published, and its number of weights, see wagtailbase.tagcloud
+WAGTAILBASE_TAG_CLOUD_CACHE_TIMEOUT = 60 * 60
+WAGTAILBASE_TAG_CLOUD_STEPS = 5
+
+# Number of pages published or unpublished per transaction by the bulk
+# publication, see wagtailbase.bulk
+WAGTAILBASE_BULK_BATCH_SIZE = 500
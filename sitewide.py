@@ -0,0 +1,131 @@
+"""
+Listings of the posts of every blog of a site, by tag or by date.
+
+The views in this module, mounted by `wagtailbase.urls` under `_posts/`,
+list the live posts under the root page of the current site, across all
+its blogs, with a single query per page of posts that filters on the
+indexed tag or date columns, instead of one query per blog. The blog index
+of every listed post, used to build the author and tag urls, is attached
+with one more query for the whole page, see
+`wagtailbase.util.attach_blog_indexes`. The `site_blog_posts` tag lists
+the latest of those posts on any page.
+"""
+from django.conf import settings
+from django.conf.urls import patterns, url
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.http import Http404
+from django.shortcuts import render
+
+from wagtailbase.instrumentation import instrumented
+from wagtailbase.lookups import resolve_tag
+from wagtailbase.util import attach_blog_indexes, get_month_number
+
+from datetime import date, timedelta
+
+TEMPLATE = 'wagtailbase/site_blog_posts.html'
+
+
+def get_date_range(year, month=None, day=None):
+    """Returns the first day of the year, month or day, and the first day
+    after it."""
+    start = date(year, month or 1, day or 1)
+
+    if day is not None:
+        return start, start + timedelta(days=1)
+    if month is not None:
+        return start, date(year + month // 12, month % 12 + 1, 1)
+
+    return start, date(year + 1, 1, 1)
+
+
+def get_posts(root, tag_id=None, year=None, month=None, day=None):
+    """Returns the live posts under the root page, newest first, with the
+    given tag or date. Dates are filtered as ranges, which the index of
+    `BlogPost.date` serves, unlike the `__month` and `__day` lookups."""
+    from wagtailbase.models import BlogPost
+
+    posts = BlogPost.objects.filter(live=True, path__startswith=root.path)
+
+    if tag_id is not None:
+        posts = posts.filter(tagged_items__tag_id=tag_id)
+
+    if year is not None:
+        start, end = get_date_range(year, month, day)
+        posts = posts.filter(date__gte=start, date__lt=end)
+
+    return posts.select_related('owner').order_by('-date', '-id')
+
+
+def paginate(request, posts):
+    """Returns the requested page of the posts, with their blog indexes."""
+    paginator = Paginator(posts, settings.ITEMS_PER_PAGE)
+
+    try:
+        page = paginator.page(request.GET.get('page'))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+
+    page.object_list = attach_blog_indexes(page.object_list)
+
+    return page
+
+
+def render_posts(request, posts, context):
+    root = request.site.root_page.specific
+
+    return render(request, TEMPLATE, dict(
+        context, self=root, posts=paginate(request, posts)))
+
+
+@instrumented('route.site_tag')
+def tag_posts(request, tag):
+    """listing of the posts of all the blogs in a specific tag"""
+    tag_id = resolve_tag(tag)
+
+    if tag_id is None:
+        raise Http404('Unknown Tag')
+
+    return render_posts(
+        request, get_posts(request.site.root_page, tag_id=tag_id),
+        {'filter_type': 'tag', 'filter': tag})
+
+
+@instrumented('route.site_date')
+def date_posts(request, year, month=None, day=None):
+    """listing of the posts of all the blogs published within a specific
+    year, month, or date"""
+    filters = {'year': int(year)}
+    filter_date = [int(year), 1, 1]
+    date_format = 'Y'
+
+    if month:
+        filters['month'] = filter_date[1] = (
+            int(month) if month.isdigit() else get_month_number(month))
+        date_format = 'N Y'
+    if day:
+        filters['day'] = filter_date[2] = int(day)
+        date_format = 'N d, Y'
+
+    try:
+        filter_date = date(*filter_date)
+    except ValueError:
+        raise Http404('Invalid Date')
+
+    return render_posts(
+        request, get_posts(request.site.root_page, **filters),
+        {'filter_type': 'date', 'filter_format': date_format,
+         'filter': filter_date})
+
+
+urlpatterns = patterns(
+    '',
+    url(r'^tag/(?P<tag>[\w ]+)/$', tag_posts, name='wagtailbase_site_tag'),
+    url(r'^date/(?P<year>\d{4})/$', date_posts,
+        name='wagtailbase_site_date'),
+    url(r'^date/(?P<year>\d{4})/(?P<month>(?:\w+|\d{1,2}))/$', date_posts,
+        name='wagtailbase_site_date'),
+    url((r'^date/(?P<year>\d{4})/(?P<month>(?:\w+|\d{1,2}))'
+         r'/(?P<day>\d{1,2})/$'), date_posts, name='wagtailbase_site_date'),
+)
@@ -0,0 +1,208 @@
+"""
+Tag counts of each blog, for the tag cloud, the tag index and the tag
+autocomplete.
+
+`BlogTagCount` keeps, for every blog and every tag of its live posts, the
+number of posts with the tag, and the lower case name of the tag, indexed
+together with the blog for the prefix lookups of the autocomplete. On
+PostgreSQL that index is also created with `varchar_pattern_ops`, which the
+`LIKE` prefix lookups need whatever the collation of the database.
+
+When a post is published or unpublished, only the tags of the post are
+counted again, in the blogs the post belongs to, together with the tags
+removed from it since the last publication, which are noted as the tagged
+items are deleted. Renaming a tag updates its rows. Run `python manage.py
+wagtailbase_tag_counts` to rebuild the whole table, e.g. after importing
+posts.
+
+The cloud of each blog is read from the cache, as a single entry, and has
+`WAGTAILBASE_TAG_CLOUD_STEPS` weights, scaled on the log of the counts.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from taggit.models import Tag
+
+from wagtail.wagtailcore.signals import page_published, page_unpublished
+
+from wagtailbase import cache
+from wagtailbase.util import get_blogs, update_rows
+
+import math
+import threading
+
+CLOUD = 'tag-cloud'
+
+# Number of tags in the autocomplete suggestions
+COMPLETE_LIMIT = 10
+
+_local = threading.local()
+
+
+def get_timeout():
+    return getattr(settings, 'WAGTAILBASE_TAG_CLOUD_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_steps():
+    return getattr(settings, 'WAGTAILBASE_TAG_CLOUD_STEPS', 5)
+
+
+def count(blog_path, tag_ids=None, exclude=None):
+    """Returns the number of live posts of the blog with each tag, or with
+    the given tags only."""
+    from wagtailbase.models import BlogPostTag
+
+    items = BlogPostTag.objects.filter(
+        content_object__live=True,
+        content_object__path__startswith=blog_path)
+
+    if tag_ids is not None:
+        items = items.filter(tag__in=list(tag_ids))
+
+    if exclude is not None:
+        items = items.exclude(content_object=exclude)
+
+    return dict(items.order_by().values_list('tag').annotate(
+        count=Count('content_object', distinct=True)))
+
+
+def update(blogs, tag_ids=None, exclude=None):
+    """Counts again the posts with the given tags, or with any tag, in the
+    given blogs, as (id, path) pairs."""
+    from wagtailbase.models import BlogTagCount
+
+    counts = dict((blog_id, count(path, tag_ids, exclude))
+                  for blog_id, path in blogs)
+    names = dict(Tag.objects.filter(pk__in=list(set(
+        tag_id for tags in counts.values() for tag_id in tags))).values_list(
+            'pk', 'name'))
+
+    with transaction.atomic():
+        for blog_id, tags in counts.items():
+            update_rows(BlogTagCount, blog_id, 'tag', dict(
+                (tag_id, {'name': names[tag_id],
+                          'key': names[tag_id].lower(),
+                          'post_count': post_count})
+                for tag_id, post_count in tags.items()), tag_ids)
+
+    cache.bump_generation(CLOUD)
+
+
+def rebuild():
+    """Counts the tags of every blog. Returns the number of blogs."""
+    from wagtailbase.models import BlogIndexPage
+
+    blogs = list(BlogIndexPage.objects.values_list('pk', 'path'))
+    update(blogs)
+
+    return len(blogs)
+
+
+def get_weights(counts):
+    """Returns the weights, from 1 to the number of steps, of the counts."""
+    if not counts:
+        return []
+
+    steps = get_steps()
+    low, high = math.log(min(counts)), math.log(max(counts))
+    spread = (high - low) or 1
+
+    return [1 + int(round((steps - 1) * (math.log(value) - low) / spread))
+            for value in counts]
+
+
+def _build_cloud(blog_id):
+    from wagtailbase.models import BlogTagCount
+
+    tags = list(BlogTagCount.objects.filter(blog=blog_id).order_by(
+        'key').values('tag_id', 'name', 'post_count'))
+
+    for tag, weight in zip(tags, get_weights(
+            [tag['post_count'] for tag in tags])):
+        tag['weight'] = weight
+
+    return tags
+
+
+def get_cloud(blog_id, limit=None):
+    """Returns the tags of the blog, by name, as dictionaries of their
+    `tag_id`, `name`, `post_count` and `weight`. With a limit, only the most
+    used tags are returned."""
+    tags = cache.get(CLOUD, (blog_id,), lambda: _build_cloud(blog_id),
+                     get_timeout())
+
+    if limit is not None and len(tags) > limit:
+        top = set(tag['tag_id'] for tag in sorted(
+            tags, key=lambda tag: -tag['post_count'])[:limit])
+        tags = [tag for tag in tags if tag['tag_id'] in top]
+
+    return tags
+
+
+def complete(blog_id, prefix, limit=COMPLETE_LIMIT):
+    """Returns the names and counts of the most used tags of the blog that
+    start with the prefix, in a single indexed query."""
+    from wagtailbase.models import BlogTagCount
+
+    return list(BlogTagCount.objects.filter(
+        blog=blog_id, key__startswith=prefix.lower()).order_by(
+            '-post_count', 'key').values('name', 'post_count')[:limit])
+
+
+def _get_removed():
+    if not hasattr(_local, 'removed'):
+        _local.removed = defaultdict(set)
+
+    return _local.removed
+
+
+@receiver(post_delete, sender='wagtailbase.BlogPostTag')
+def note_removed_tag(sender, instance, **kwargs):
+    _get_removed()[instance.content_object_id].add(instance.tag_id)
+
+
+@receiver(request_finished)
+def forget_removed_tags(sender, **kwargs):
+    _get_removed().clear()
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def update_published_post(sender, instance, **kwargs):
+    from wagtailbase.models import BlogPost, BlogPostTag
+
+    if not isinstance(instance, BlogPost):
+        return
+
+    tag_ids = _get_removed().pop(instance.pk, set())
+    tag_ids.update(BlogPostTag.objects.filter(
+        content_object=instance.pk).values_list('tag_id', flat=True))
+
+    if tag_ids:
+        # Posts are unpublished in memory only before they are deleted
+        update(get_blogs(instance), tag_ids,
+               exclude=None if instance.live else instance.pk)
+
+
+@receiver(post_delete, sender=Tag)
+def invalidate_deleted_tag(sender, **kwargs):
+    cache.bump_generation(CLOUD)
+
+
+@receiver(post_save, sender=Tag)
+def update_renamed_tag(sender, instance, **kwargs):
+    from wagtailbase.models import BlogTagCount
+
+    if instance is None or kwargs.get('created'):
+        return
+
+    if BlogTagCount.objects.filter(tag=instance).exclude(
+            name=instance.name).update(name=instance.name,
+                                       key=instance.name.lower()):
+        cache.bump_generation(CLOUD)
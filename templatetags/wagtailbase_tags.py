@@ -7,11 +7,19 @@ from django.template.defaultfilters import stringfilter
 
 
 from wagtail.wagtailcore.models import Page
-from wagtail.wagtailcore.templatetags.wagtailcore_tags import pageurl
 
 from wagtail.contrib.wagtailroutablepage.templatetags.wagtailroutablepage_tags import routablepageurl
 
-from wagtailbase.util import unslugify
+from wagtailbase.authors import get_author, get_directory, get_name
+from wagtailbase.fragments import esi_src
+from wagtailbase.instrumentation import instrument_library, measure
+from wagtailbase.listings import cached_menu, cached_posts
+from wagtailbase.pageurls import get_page_url, get_page_url_by_id
+from wagtailbase.purging import record
+from wagtailbase.lookups import resolve_tag
+from wagtailbase.sitewide import get_posts
+from wagtailbase.tagcloud import get_cloud
+from wagtailbase.util import attach_blog_indexes, unslugify
 
 import logging
 logger = logging.getLogger(__name__)
@@ -57,6 +65,20 @@ def get_request_parameters(context, exclude=None):
     return params
 
 
+@register.assignment_tag(takes_context=False)
+def get_blog_author(post, blog):
+    """Returns the author of the post, with their slug and display name, from
+    the author directory of the blog, see `wagtailbase.authors`. Authors not
+    in the directory yet, e.g. in previews, are read from the post."""
+    author = get_author(blog.pk, post.owner_id)
+
+    if author is None and post.owner_id is not None:
+        slug, name = get_name(post.owner)
+        author = {'slug': slug, 'name': name}
+
+    return author
+
+
 @register.assignment_tag(takes_context=True)
 def get_site_root(context):
     """Returns the site root Page, not the implementation-specific model used.
@@ -99,12 +121,20 @@ def is_current_or_ancestor(page, current_page):
 def latest_blog_post(context, parent=None):
     """Returns the latest blog post that is child of the given parent. If no
     parent is given it defaults to the latest BlogPost object."""
-    post = None
+    src = esi_src(context, 'latest_blog_post', parent=parent)
+    if src:
+        return {'esi_src': src}
 
-    if parent:
-        post = parent.posts.order_by('-date').first()
-    else:
-        post = BlogPost.objects.filter(live=True).order_by('-date').first()
+    def compute():
+        if parent:
+            posts = parent.posts
+        else:
+            posts = BlogPost.objects.filter(live=True)
+
+        return posts.select_related('owner').order_by('-date').first()
+
+    record('latest', parent.pk if parent else None)
+    post = cached_posts('latest_blog_post', parent, compute)
 
     return {'request': context['request'], 'post': post}
 
@@ -114,11 +144,17 @@ def latest_blog_post(context, parent=None):
 def featured_blog_post(context, parent=None):
     """Returns the latest featured blog post that is child of the given parent.
     If no parent is given it defaults to the latest featured BlogPost object."""
-    post = None
-    if parent:
-        post = parent.posts.filter(featured=True).order_by('-date').first()
-    else:
-        post = BlogPost.objects.filter(featured=True).order_by('-date').first()
+    def compute():
+        if parent:
+            posts = parent.posts
+        else:
+            posts = BlogPost.objects.all()
+
+        return posts.filter(featured=True).select_related(
+            'owner').order_by('-date').first()
+
+    record('latest', parent.pk if parent else None)
+    post = cached_posts('featured_blog_post', parent, compute)
 
     return {'request': context['request'], 'post': post}
 
@@ -131,36 +167,143 @@ def latest_n_blog_posts(context, nentries, parent=None):
     there are not enough blog posts, it returns all the existing entries.
     If no parent is given it defaults to the latest BlogPost object."""
 
-    posts = []
-    base_model = BlogPost
+    def compute():
+        if parent:
+            posts = parent.posts
+        else:
+            posts = BlogPost.objects.all()
 
-    if parent:
-        base_model = parent
+        return list(posts.select_related('owner').order_by(
+            '-date')[0:nentries])
 
-    posts = base_model.objects.all().order_by('-date')[0:nentries]
+    record('latest', parent.pk if parent else None)
+    posts = cached_posts('latest_n_blog_posts', parent, compute, nentries)
 
     return {'request': context['request'], 'posts': posts}
 
 
+@register.inclusion_tag('wagtailbase/tags/latest_n_blog_posts.html',
+                        takes_context=True)
+def popular_blog_posts(context, nentries, parent=None):
+    """Returns the nentries most read blog posts that are children of the
+    given parent, or of any blog if no parent is given. The ranking is
+    rebuilt periodically from the view counts, see `wagtailbase.counters`."""
+
+    def compute():
+        if parent:
+            posts = parent.posts
+        else:
+            posts = BlogPost.objects.filter(live=True)
+
+        return list(posts.filter(views__count__gt=0).select_related(
+            'owner').order_by('-views__count')[0:nentries])
+
+    record('latest', parent.pk if parent else None)
+    posts = cached_posts('popular_blog_posts', parent, compute, nentries)
+
+    return {'request': context['request'], 'posts': posts}
+
+
+@register.inclusion_tag('wagtailbase/tags/related_blog_posts.html',
+                        takes_context=True)
+def related_blog_posts(context, post):
+    """Returns the posts related to the given post, precomputed from the tags
+    they share, see `wagtailbase.related`."""
+    return {'request': context['request'], 'posts': post.related_posts}
+
+
+@register.inclusion_tag('wagtailbase/tags/blog_post_navigation.html',
+                        takes_context=True)
+def blog_post_navigation(context, post):
+    """Returns the links to the older and the newer post than the given post
+    in its blog, see `wagtailbase.neighbours`."""
+    request = context['request']
+    site = getattr(request, 'site', None)
+    links = {}
+
+    for name, neighbour in zip(('older', 'newer'), post.neighbour_posts):
+        if neighbour is not None:
+            links[name] = dict(
+                neighbour, url=get_page_url_by_id(neighbour['id'], site))
+
+    return dict(links, request=request)
+
+
+@register.inclusion_tag('wagtailbase/tags/blog_authors.html',
+                        takes_context=True)
+def blog_authors(context, blog):
+    """Returns the authors of the blog, with the number of their posts and the
+    date of the latest one, see `wagtailbase.authors`."""
+    return {'request': context['request'], 'blog': blog,
+            'authors': get_directory(blog.pk)}
+
+
+@register.inclusion_tag('wagtailbase/tags/tag_cloud.html',
+                        takes_context=True)
+def tag_cloud(context, blog, limit=None):
+    """Returns the tags of the blog, with their number of posts and their
+    weight in the cloud, or only the limit most used ones, see
+    `wagtailbase.tagcloud`."""
+    return {'request': context['request'], 'blog': blog,
+            'tags': get_cloud(blog.pk, limit)}
+
+
+@register.inclusion_tag('wagtailbase/tags/latest_n_blog_posts.html',
+                        takes_context=True)
+def site_blog_posts(context, nentries, tag=None):
+    """Returns the nentries latest blog posts of all the blogs of the current
+    site, or only those with the given tag, see `wagtailbase.sitewide`."""
+    request = context['request']
+    tag_id = None
+
+    if tag is not None:
+        tag_id = resolve_tag(tag)
+
+        if tag_id is None:
+            return {'request': request, 'posts': []}
+
+    posts = attach_blog_indexes(get_posts(
+        request.site.root_page, tag_id=tag_id)[:nentries])
+
+    return {'request': request, 'posts': posts}
+
+
+def _local_menu_pages(current_page):
+    """Returns the local menu pages of the current page, and the label of
+    the menu."""
+    label = current_page.title
+    menu_pages = list(current_page.get_children().filter(
+        live=True, show_in_menus=True))
+
+    # if no children, get siblings instead
+    if len(menu_pages) == 0:
+        menu_pages = list(current_page.get_siblings().filter(
+            live=True, show_in_menus=True))
+
+    if current_page.get_children_count() == 0:
+        if not isinstance(current_page.get_parent().specific, HomePage):
+            label = current_page.get_parent().title
+
+    return menu_pages, label
+
+
 @register.inclusion_tag('wagtailbase/tags/local_menu.html', takes_context=True)
 def local_menu(context, current_page=None):
     """Retrieves the secondary links for the 'also in this section' links -
     either the children or siblings of the current page."""
+    src = esi_src(context, 'local_menu', current_page=current_page)
+    if src:
+        return {'esi_src': src}
+
     menu_pages = []
     label = current_page.title
 
     if current_page:
-        menu_pages = current_page.get_children().filter(
-            live=True, show_in_menus=True)
-
-        # if no children, get siblings instead
-        if len(menu_pages) == 0:
-            menu_pages = current_page.get_siblings().filter(
-                live=True, show_in_menus=True)
-
-        if current_page.get_children_count() == 0:
-            if not isinstance(current_page.get_parent().specific, HomePage):
-                label = current_page.get_parent().title
+        record('children', current_page.path)
+        record('children', current_page.path[:-current_page.steplen])
+        menu_pages, label = cached_menu(
+            'local_menu', current_page,
+            lambda: _local_menu_pages(current_page))
 
     # required by the pageurl tag that we want to use within this template
     return {'request': context['request'], 'current_page': current_page,
@@ -171,12 +314,27 @@ def local_menu(context, current_page=None):
 def main_menu(context, root, current_page=None):
     """Returns the main menu items, the children of the root page. Only live
     pages that have the show_in_menus setting on are returned."""
-    menu_pages = root.get_children().filter(live=True, show_in_menus=True)
+    src = esi_src(context, 'main_menu', root=root, current_page=current_page)
+    if src:
+        return {'esi_src': src}
+
+    record('children', root.path)
+    menu_pages = cached_menu('main_menu', root, lambda: list(
+        root.get_children().filter(live=True, show_in_menus=True)))
 
     return {'request': context['request'], 'root': root,
             'current_page': current_page, 'menu_pages': menu_pages}
 
 
+@register.simple_tag(takes_context=True)
+def pageurl(context, page):
+    """Returns the URL for the page, relative to the current site. Same as
+    the wagtail tag, but looked up in the precomputed page urls."""
+    request = context.get('request')
+
+    return get_page_url(page, getattr(request, 'site', None))
+
+
 @register.simple_tag(takes_context=True)
 def slugurl(context, slug):
     """Returns the URL for the page that has the given slug."""
@@ -224,6 +382,22 @@ def archiveurl(context, page, *args):
     return routablepageurl(context, page.specific, url_name, *a_args)
 
 
+@register.filter
+def select_link_targets(links):
+    """Returns the given related links or attachments with the pages,
+    documents and images they link to, and the responsive renditions of the
+    images, fetched in the same query."""
+    try:
+        fields = [field.name for field in links.model._meta.fields
+                  if field.name in ('link_page', 'link_document', 'image')]
+        if 'image' in fields:
+            fields.append('image__responsive')
+        return links.select_related(*fields)
+    except AttributeError:
+        # Child objects held in memory, e.g. when previewing a page
+        return links
+
+
 @register.filter(name="unslugify")
 @stringfilter
 def unslugify_filter(value):
@@ -233,3 +407,35 @@ def unslugify_filter(value):
 @register.filter
 def get_item(dictionary, key):
     return dictionary[key]
+
+
+instrument_library(register)
+
+
+class InstrumentNode(template.Node):
+
+    def __init__(self, name, nodelist):
+        self.name = name
+        self.nodelist = nodelist
+
+    def render(self, context):
+        with measure('include.{0}'.format(self.name.resolve(context))):
+            return self.nodelist.render(context)
+
+
+# Registered after the library is instrumented, it measures on its own
+@register.tag
+def instrument(parser, token):
+    """Measures the render of the enclosed block, when instrumentation is
+    enabled, e.g. `{% instrument "attachments" %}...{% endinstrument %}`."""
+    try:
+        tag_name, name = token.split_contents()
+    except ValueError:
+        raise template.TemplateSyntaxError(
+            '{0} tag requires a single argument'.format(
+                token.contents.split()[0]))
+
+    nodelist = parser.parse(('endinstrument',))
+    parser.delete_first_token()
+
+    return InstrumentNode(parser.compile_filter(name), nodelist)
@@ -0,0 +1,218 @@
+"""
+Query budgets for every page type and blog route.
+
+Each page is rendered through the test client on two sites with the same
+structure, a small one and a large one with more posts, children, tags and
+related links (or attachments, in `test_attachments`). Every render must stay
+within the budget of its page, and the large site must not need more queries
+than the small one. Failures list the queries of the offending render.
+"""
+from datetime import date
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from taggit.models import Tag
+
+from wagtailbase import authors, cache, renditions
+from wagtailbase.benchmarks import synthetic
+from wagtailbase.models import (BlogPost, HomePageAttachment,
+                                RichTextAttachment, RichTextPage,
+                                RichTextPageRelatedLink)
+
+import os
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+
+# Maximum number of queries of the render of each page
+BUDGETS = {
+    'home': 13,
+    'index': 20,
+    'index_page_2': 20,
+    'rich_text': 25,
+    'blog': 55,
+    'blog_page_2': 55,
+    'blog_author': 56,
+    'blog_tag': 56,
+    'blog_year': 55,
+    'blog_month': 55,
+    'blog_day': 55,
+    'blog_post': 30,
+}
+
+# Sizes of the small and the large site
+SMALL = 2
+LARGE = 8
+
+DATE = date(2015, 3, 14)
+
+
+def build_site(hostname, size, image, attachments=1):
+    """Builds a site whose collections have a number of items that grows
+    with size. Listings always have more items than fit in one page."""
+    home = synthetic.create_home(slug=hostname.split('.')[0],
+                                 hostname=hostname)
+    HomePageAttachment.objects.bulk_create([
+        HomePageAttachment(page=home, image=image, sort_order=n)
+        for n in range(attachments)])
+
+    index = synthetic.build_wide_index(home, 12 * size)
+    synthetic.add_children(home, RichTextPage, [
+        {'title': 'Menu page {0}'.format(n), 'slug': 'menu-page-{0}'.format(n),
+         'content': synthetic.CONTENT, 'show_in_menus': True}
+        for n in range(size)])
+
+    page = RichTextPage.objects.get(pk=synthetic.add_children(
+        index, RichTextPage, [{'title': 'Rich text', 'slug': 'rich-text',
+                               'content': synthetic.CONTENT,
+                               'show_in_menus': True}])[0])
+    RichTextAttachment.objects.bulk_create([
+        RichTextAttachment(page=page, image=image, sort_order=n)
+        for n in range(attachments)])
+    RichTextPageRelatedLink.objects.bulk_create([
+        RichTextPageRelatedLink(page=page, title='Link {0}'.format(n),
+                                link_page=index, sort_order=n)
+        for n in range(size)])
+
+    blog = synthetic.build_blog(
+        home, 12 * size, tags=size, tags_per_post=size, authors=1,
+        attachments=attachments, image=image, slug='blog', start=DATE,
+        days=1)
+
+    return {
+        'home': home,
+        'index': index,
+        'page': page,
+        'blog': blog,
+        'post': BlogPost.objects.filter(
+            path__startswith=blog.path).order_by('-date').first(),
+        'tag': Tag.objects.filter(
+            wagtailbase_blogposttag_items__content_object__path__startswith=(
+                blog.path)
+        ).first(),
+    }
+
+
+@override_settings(
+    ROOT_URLCONF='wagtailbase.urls',
+    MIDDLEWARE_CLASSES=(
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'wagtail.wagtailcore.middleware.SiteMiddleware',
+    ),
+    TEMPLATE_DIRS=(TEMPLATE_DIR,),
+    TEMPLATES=[{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [TEMPLATE_DIR],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+            ],
+        },
+    }],
+    ITEMS_PER_PAGE=10)
+class TestQueryBudgets(TestCase):
+
+    def setUp(self):
+        self.image = synthetic.create_image(width=64, height=48)
+        # Renditions are made when the pages are published
+        renditions.update_image(self.image)
+
+        self.sites = [
+            ('small.test', build_site('small.test', SMALL, self.image)),
+            ('large.test', build_site('large.test', LARGE, self.image))]
+        # The author directories are maintained when posts are published
+        authors.rebuild()
+
+    def render(self, hostname, url):
+        """Renders the url with cold caches, returns the queries."""
+        cache.clear()
+        ContentType.objects.clear_cache()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_HOST=hostname)
+
+        self.assertEqual(200, response.status_code,
+                         '{0}{1} returned {2}'.format(
+                             hostname, url, response.status_code))
+
+        return queries.captured_queries
+
+    def assertWithinBudget(self, name, get_url):
+        """Renders the url returned by get_url for the pages of each site, and
+        checks the number of queries against the budget and against the
+        number of queries on the small site."""
+        counts = []
+
+        for hostname, pages in self.sites:
+            url = get_url(pages)
+            queries = self.render(hostname, url)
+            counts.append(len(queries))
+
+            if len(queries) > BUDGETS[name] or len(queries) > counts[0]:
+                self.fail(
+                    '{0}: {1}{2} ran {3} queries, the budget is {4} and the '
+                    'small site ran {5}:\n{6}'.format(
+                        name, hostname, url, len(queries), BUDGETS[name],
+                        counts[0], '\n'.join(
+                            '{0}. {1}'.format(i, query['sql'])
+                            for i, query in enumerate(queries, 1))))
+
+        return counts
+
+    def test_home_page(self):
+        self.assertWithinBudget('home', lambda pages: '/')
+
+    def test_index_page(self):
+        self.assertWithinBudget(
+            'index', lambda pages: pages['index'].url_path[
+                len(pages['home'].url_path) - 1:])
+        self.assertWithinBudget(
+            'index_page_2', lambda pages: pages['index'].url_path[
+                len(pages['home'].url_path) - 1:] + '?page=2')
+
+    def test_rich_text_page(self):
+        self.assertWithinBudget(
+            'rich_text', lambda pages: pages['page'].url_path[
+                len(pages['home'].url_path) - 1:])
+
+    def test_blog_routes(self):
+        routes = (
+            ('blog', ''),
+            ('blog_page_2', '?page=2'),
+            ('blog_author', 'author/{author}/'),
+            ('blog_tag', 'tag/{tag}/'),
+            ('blog_year', 'date/{date:%Y}/'),
+            ('blog_month', 'date/{date:%Y}/{date:%m}/'),
+            ('blog_day', 'date/{date:%Y}/{date:%m}/{date:%d}/'),
+        )
+
+        for name, route in routes:
+            self.assertWithinBudget(
+                name, lambda pages: '/blog/' + route.format(
+                    author=pages['post'].owner.username,
+                    tag=pages['tag'].name.replace(' ', '_').lower(),
+                    date=DATE))
+
+    def test_blog_post(self):
+        self.assertWithinBudget(
+            'blog_post', lambda pages: '/blog/{0}/'.format(
+                pages['post'].slug))
+
+    def test_attachments(self):
+        self.sites = [
+            ('few.test', build_site('few.test', SMALL, self.image,
+                                    attachments=SMALL)),
+            ('many.test', build_site('many.test', SMALL, self.image,
+                                     attachments=LARGE))]
+        authors.rebuild()
+
+        self.assertWithinBudget(
+            'rich_text', lambda pages: pages['page'].url_path[
+                len(pages['home'].url_path) - 1:])
+        self.assertWithinBudget(
+            'blog_post', lambda pages: '/blog/{0}/'.format(
+                pages['post'].slug))
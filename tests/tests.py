@@ -3,10 +3,54 @@ from wagtailbase.models import (
     IndexPage,
     RichTextPage,
     BlogIndexPage,
+    BlogAuthor,
     BlogPost,
-    IndexPageRelatedLink)
+    BlogPostTag,
+    BlogPostViews,
+    IndexPageRelatedLink,
+    RelatedBlogPost,
+    RichTextAttachment)
 
-from wagtail.wagtailcore.models import Page
+from wagtailbase import (api, archive, authors, bulk,
+                         cache as wagtailbase_cache, compression, counters,
+                         neighbours, purging, related, renditions, sitewide,
+                         tagcloud, util)
+from wagtailbase.benchmarks import load, synthetic
+from wagtailbase.instrumentation import (
+    InstrumentationMiddleware, UDPSink, get_timings, instrumented, measure)
+from wagtailbase.listings import LISTINGS
+from wagtailbase.lookups import resolve_author, resolve_tag
+from wagtailbase.pageurls import get_page_url, get_page_url_by_id
+from wagtailbase.profiling import make_token, profiled
+from wagtailbase.purging import PurgeStub
+from wagtailbase.routers import PIN_COOKIE, ReplicaMiddleware
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.utils.html import escape
+from django.db import connections
+from django.db.models.signals import post_save
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from django.contrib.auth.models import User
+
+from taggit.models import Tag
+
+from wagtail.wagtailcore.models import Page, Site
+from wagtail.wagtailcore.signals import page_published
+
+from datetime import date
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
 
 
 FIXTURES = ['test_data.json']
@@ -38,6 +82,18 @@ class TestIndexPage(TestCase):
                          self.index_page.get_children().first().specific)
         self.assertEqual(self.child_page, self.index_page.children.first().specific)
 
+    def test_specific_children(self):
+        expected = [page.specific for page in self.index_page.children]
+
+        # One query for the children and one for each page type
+        types = len(set(type(page) for page in expected))
+        with self.assertNumQueries(1 + types):
+            children = self.index_page.specific_children
+
+        self.assertEqual(expected, children)
+        self.assertEqual([type(page) for page in expected],
+                         [type(page) for page in children])
+
 
 class TestRichTextPage(TestCase):
     fixtures = FIXTURES
@@ -51,6 +107,15 @@ class TestRichTextPage(TestCase):
     def test_index_page(self):
         self.assertEqual(self.index_page, self.page.index_page.specific)
 
+    def test_is_current_or_ancestor(self):
+        self.assertTrue(self.page.is_current_or_ancestor(self.page))
+        self.assertTrue(self.page.is_current_or_ancestor(
+            Page.objects.get(pk=self.index_page.pk)))
+        # Not a wagtailbase page
+        self.assertFalse(self.page.is_current_or_ancestor(
+            Page.objects.get(depth=1)))
+        self.assertFalse(self.index_page.is_current_or_ancestor(self.page))
+
 
 class TestBlogIndexPage(TestCase):
     fixtures = FIXTURES
@@ -61,3 +126,1327 @@ class TestBlogIndexPage(TestCase):
 
     def test_posts(self):
         self.assertEqual(self.post, self.blog.posts.last().specific)
+
+
+class TestLookups(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        self.user = User.objects.get(username='alejandro')
+
+    def test_resolve_author(self):
+        self.assertEqual(self.user.id, resolve_author('alejandro'))
+        self.assertIsNone(resolve_author('nobody'))
+
+    def test_resolve_tag(self):
+        self.assertIsNone(resolve_tag('wagtail_tips'))
+
+        tag = Tag.objects.create(name='Wagtail tips', slug='wagtail-tips')
+
+        self.assertEqual(tag.id, resolve_tag('Wagtail tips'))
+        self.assertEqual(tag.id, resolve_tag('wagtail_tips'))
+
+
+class TestInstrumentation(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        self.middleware = InstrumentationMiddleware()
+        self.request = RequestFactory().get('/blog/')
+
+    def test_disabled(self):
+        self.middleware.process_request(self.request)
+        self.assertIsNone(get_timings())
+
+        with measure('posts'):
+            list(BlogPost.objects.all())
+
+        response = self.middleware.process_response(
+            self.request, HttpResponse())
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(WAGTAILBASE_INSTRUMENTATION=True)
+    def test_server_timing(self):
+        self.middleware.process_request(self.request)
+
+        for i in range(2):
+            with measure('posts'):
+                list(BlogPost.objects.all())
+
+        self.assertEqual(2, get_timings()['posts'].queries)
+
+        response = self.middleware.process_response(
+            self.request, HttpResponse())
+        self.assertIsNone(get_timings())
+        self.assertRegexpMatches(
+            response['Server-Timing'],
+            r'^posts;dur=[\d.]+;desc="2 queries, 2 calls"$')
+
+    def test_runtime_toggle(self):
+        # Decorated while instrumentation is disabled
+        count = instrumented('count')(BlogPost.objects.count)
+
+        with override_settings(WAGTAILBASE_INSTRUMENTATION=True):
+            self.middleware.process_request(self.request)
+            count()
+            timings = get_timings()
+            self.middleware.process_response(self.request, HttpResponse())
+
+        self.assertEqual(1, timings['count'].queries)
+
+    def test_udp_sink(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        self.addCleanup(server.close)
+
+        with override_settings(WAGTAILBASE_INSTRUMENTATION=True):
+            self.middleware.process_request(self.request)
+            with measure('posts'):
+                list(BlogPost.objects.all())
+            timings = get_timings()
+            self.middleware.process_response(self.request, HttpResponse())
+
+        sink = UDPSink(port=server.getsockname()[1], prefix='test')
+        sink.send(timings, self.request, None)
+
+        lines = server.recv(4096).decode('utf-8').splitlines()
+        self.assertEqual('test.posts.queries:1|c', lines[1])
+        self.assertEqual('test.posts.calls:1|c', lines[2])
+
+
+class TestLoadHarness(TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(50, load.percentile(values, 50))
+        self.assertEqual(95, load.percentile(values, 95))
+        self.assertEqual(100, load.percentile(values, 100))
+        self.assertIsNone(load.percentile([], 50))
+
+    def test_schedule(self):
+        urls = {'home': ['/'], 'blog_post': ['/blog/a/', '/blog/b/'],
+                'tag': []}
+        mix = {'home': 1, 'blog_post': 3, 'tag': 5}
+        requests = load.schedule(urls, mix, 400)
+
+        self.assertEqual(requests, load.schedule(urls, mix, 400))
+        self.assertEqual(set(['home', 'blog_post']),
+                         set(kind for kind, url in requests))
+        self.assertGreater(
+            len([kind for kind, url in requests if kind == 'blog_post']),
+            len([kind for kind, url in requests if kind == 'home']))
+
+    def test_empty_schedule(self):
+        urls = {'home': ['/'], 'tag': []}
+
+        self.assertRaises(ValueError, load.schedule, urls, {'home': 0}, 10)
+        self.assertRaises(ValueError, load.schedule, urls, {'tag': 1}, 10)
+
+    def test_private_cache(self):
+        shared = wagtailbase_cache.get_cache().shared
+        shared.set('wagtailbase-test', 1)
+
+        with synthetic.private_cache():
+            wagtailbase_cache.clear()
+
+        # The cache of the project is left alone
+        self.assertEqual(1, shared.get('wagtailbase-test'))
+
+
+class TestProfiling(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.page = RichTextPage.objects.filter(
+            slug='first-page-index').first()
+
+    def _serve(self, **headers):
+        def serve(page, request):
+            return HttpResponse(page.title)
+
+        serve = profiled(serve)
+
+        with override_settings(WAGTAILBASE_PROFILING_DIR=self.directory):
+            return serve(self.page, RequestFactory().get('/', **headers))
+
+    def test_disabled(self):
+        response = self.client.get(
+            self.page.url, HTTP_X_WAGTAILBASE_PROFILE=make_token('me'))
+
+        self.assertNotIn('X-Wagtailbase-Profile', response)
+
+    def test_page(self):
+        with override_settings(WAGTAILBASE_PROFILING_DIR=self.directory):
+            response = self.client.get(
+                self.page.url, HTTP_X_WAGTAILBASE_PROFILE=make_token('me'))
+
+        self.assertIn('X-Wagtailbase-Profile', response)
+
+    def test_profile(self):
+        response = self._serve(HTTP_X_WAGTAILBASE_PROFILE=make_token('me'))
+        dump = response['X-Wagtailbase-Profile']
+
+        self.assertTrue(dump.endswith('.prof'))
+        self.assertEqual(
+            sorted([dump, dump.replace('.prof', '.txt')]),
+            sorted(os.listdir(self.directory)))
+
+    def test_invalid_token(self):
+        for headers in ({}, {'HTTP_X_WAGTAILBASE_PROFILE': 'me'}):
+            response = self._serve(**headers)
+
+            self.assertNotIn('X-Wagtailbase-Profile', response)
+            self.assertEqual([], os.listdir(self.directory))
+
+
+class TestListingsCache(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+        self.calls = []
+
+    def compute(self):
+        self.calls.append(1)
+        return len(self.calls)
+
+    def fetch(self, local=False):
+        return wagtailbase_cache.fetch('test', ('key',), self.compute,
+                                       local=local)
+
+    def test_fetch(self):
+        self.assertEqual(1, self.fetch())
+        self.assertEqual(1, self.fetch())
+        # Kept out of the local tier
+        self.assertEqual(0, len(wagtailbase_cache.get_cache().local))
+
+        wagtailbase_cache.bump_generation('test')
+        self.assertEqual(2, self.fetch())
+
+    def test_fetch_local(self):
+        self.assertEqual(1, self.fetch(local=True))
+
+        # Served by the local tier, even if the shared one is lost
+        wagtailbase_cache.get_cache().shared.clear()
+        self.assertEqual(1, self.fetch(local=True))
+        self.assertEqual(1, len(self.calls))
+
+        wagtailbase_cache.bump_generation('test')
+        self.assertEqual(2, self.fetch(local=True))
+
+    def test_fetch_stale(self):
+        self.fetch()
+        wagtailbase_cache.bump_generation('test')
+
+        # Another worker is refreshing the entry
+        tiered = wagtailbase_cache.get_cache()
+        key = wagtailbase_cache.make_key('test', 'key')
+        self.assertTrue(tiered._acquire(key))
+
+        self.assertEqual(1, self.fetch())
+        self.assertEqual(1, len(self.calls))
+
+        tiered._release(key)
+        self.assertEqual(2, self.fetch())
+
+    def test_listing(self):
+        self.client.get(self.blog.url)
+
+        post = self.blog.posts.first()
+        BlogPost.objects.filter(pk=post.pk).update(title='Updated title')
+        self.assertNotContains(self.client.get(self.blog.url),
+                               'Updated title')
+
+        page_published.send(sender=BlogPost, instance=post.specific)
+        self.assertContains(self.client.get(self.blog.url), 'Updated title')
+
+
+class TestCompression(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+
+    def test_negotiate(self):
+        available = {'gzip': b'', 'br': b''}
+
+        self.assertEqual('br', compression.negotiate('gzip, br', available))
+        self.assertEqual('gzip', compression.negotiate(
+            'gzip, br;q=0.5', available))
+        self.assertIsNone(compression.negotiate('br', {'gzip': b''}))
+        self.assertIsNone(compression.negotiate('deflate', available))
+        self.assertIsNone(compression.negotiate('', available))
+        self.assertEqual('gzip', compression.negotiate(
+            '*;q=0.1', {'gzip': b''}))
+
+    def test_cached_listing(self):
+        plain = self.client.get(self.blog.url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+        for i in range(2):
+            response = self.client.get(self.blog.url,
+                                       HTTP_ACCEPT_ENCODING='gzip')
+
+            self.assertEqual('gzip', response['Content-Encoding'])
+            self.assertIn('Accept-Encoding', response['Vary'])
+            self.assertEqual(plain.content, compression.gzip_decompress(
+                response.content))
+
+
+class TestLoadMore(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        BlogIndexPage.objects.filter(slug='blog').update(items_per_page=1)
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+        self.index_page = IndexPage.objects.filter(
+            slug='standard-index').first()
+
+    def test_items_per_page(self):
+        self.assertEqual(1, self.blog.get_items_per_page())
+        self.assertEqual(settings.ITEMS_PER_PAGE,
+                         self.index_page.get_items_per_page())
+
+        self.blog.items_per_page = 1000
+        with self.settings(WAGTAILBASE_MAX_ITEMS_PER_PAGE=50):
+            self.assertEqual(50, self.blog.get_items_per_page())
+
+    def test_blog_fragment(self):
+        first, second = self.blog.posts
+
+        response = self.client.get(self.blog.url + '?fragment=1')
+        self.assertContains(response, escape(first.title))
+        self.assertNotContains(response, escape(second.title))
+        self.assertNotContains(response, '<body')
+        self.assertContains(response, 'data-next-cursor="2"')
+        self.assertContains(response, '?page=2&amp;fragment=1')
+
+        response = self.client.get(self.blog.url + '?page=2&fragment=1')
+        self.assertContains(response, escape(second.title))
+        self.assertNotContains(response, 'data-next-cursor')
+
+        response = self.client.get(self.blog.url + '?page=3&fragment=1')
+        self.assertEqual(404, response.status_code)
+
+    def test_index_fragment(self):
+        response = self.client.get(self.index_page.url + '?fragment=1')
+
+        for page in self.index_page.children:
+            self.assertContains(response, escape(page.title))
+        self.assertNotContains(response, '<body')
+
+
+class TestApi(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+        self.posts = list(self.blog.posts.order_by('-date', '-id'))
+
+    def get(self, url, **kwargs):
+        response = self.client.get(url, **kwargs)
+        self.assertEqual(200, response.status_code)
+
+        return response, json.loads(b''.join(
+            response.streaming_content).decode('utf-8'))
+
+    def test_listing(self):
+        response, data = self.get(self.blog.url + 'api/posts/')
+
+        self.assertEqual([post.pk for post in self.posts],
+                         [item['id'] for item in data['results']])
+        self.assertEqual(set(api.DEFAULT_FIELDS), set(data['results'][0]))
+        self.assertTrue(data['results'][0]['url'].endswith(
+            self.posts[0].url))
+        self.assertIsNone(data['next'])
+
+    def test_fields(self):
+        response, data = self.get(self.blog.url + 'api/posts/',
+                                  data={'fields': 'title,owner,tags'})
+
+        self.assertEqual({'title': self.posts[0].title,
+                          'owner': self.posts[0].owner.username,
+                          'tags': []}, data['results'][0])
+
+        response = self.client.get(self.blog.url + 'api/posts/',
+                                   data={'fields': 'title,password'})
+        self.assertEqual(400, response.status_code)
+
+    def test_cursor(self):
+        response, data = self.get(self.blog.url + 'api/posts/',
+                                  data={'limit': 1})
+        self.assertEqual([self.posts[0].pk],
+                         [item['id'] for item in data['results']])
+
+        response, data = self.get(data['next'])
+        self.assertEqual([self.posts[1].pk],
+                         [item['id'] for item in data['results']])
+        self.assertIsNone(data['next'])
+
+        response = self.client.get(self.blog.url + 'api/posts/',
+                                   data={'cursor': 'invalid'})
+        self.assertEqual(400, response.status_code)
+
+    def test_etag(self):
+        response, data = self.get(self.blog.url + 'api/posts/')
+        etag = response['ETag']
+
+        response = self.client.get(self.blog.url + 'api/posts/',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+
+        # Publications change the validators
+        page_published.send(sender=BlogPost, instance=self.posts[0])
+        response, data = self.get(self.blog.url + 'api/posts/',
+                                  HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_post(self):
+        post = self.posts[0]
+        url = '{0}api/posts/{1}/'.format(self.blog.url, post.slug)
+
+        response = self.client.get(url, data={'fields': 'title,content'})
+        self.assertEqual({'title': post.title, 'content': post.content},
+                         json.loads(response.content.decode('utf-8')))
+
+        self.assertEqual(404, self.client.get(
+            self.blog.url + 'api/posts/unknown/').status_code)
+
+
+    def test_tags(self):
+        post = self.posts[0]
+        post.tags.add('Beta', 'Alpha')
+        post.save()
+
+        response, data = self.get(self.blog.url + 'api/posts/',
+                                  data={'fields': 'id,tags'})
+        tags = dict((item['id'], item['tags']) for item in data['results'])
+
+        self.assertEqual(['Alpha', 'Beta'], tags.pop(post.pk))
+        self.assertEqual(set([()]), set(tuple(value)
+                                        for value in tags.values()))
+
+    def test_richtext(self):
+        post = self.posts[0]
+        content = '<p><a linktype="page" id="{0}">Blog</a></p>'.format(
+            self.blog.pk)
+        BlogPost.objects.filter(pk=post.pk).update(content=content)
+        url = '{0}api/posts/{1}/'.format(self.blog.url, post.slug)
+
+        response = self.client.get(url, data={'fields': 'content'})
+        self.assertEqual(content, json.loads(
+            response.content.decode('utf-8'))['content'])
+
+        response = self.client.get(url, data={'fields': 'content',
+                                              'richtext': 'html'})
+        self.assertIn('href="{0}"'.format(self.blog.url), json.loads(
+            response.content.decode('utf-8'))['content'])
+
+    def test_filtered_routes(self):
+        post = self.posts[0]
+        post.tags.add('Alpha')
+        post.save()
+
+        response, data = self.get(self.blog.url + 'api/posts/tag/Alpha/')
+        self.assertEqual([post.pk], [item['id'] for item in data['results']])
+
+        response, data = self.get('{0}api/posts/author/{1}/'.format(
+            self.blog.url, post.owner.username))
+        self.assertEqual([post.pk for post in self.posts],
+                         [item['id'] for item in data['results']])
+
+        response, data = self.get('{0}api/posts/date/{1}/{2}/'.format(
+            self.blog.url, post.date.year, post.date.strftime('%B')))
+        self.assertIn(post.pk, [item['id'] for item in data['results']])
+
+        for route in ('tag/Unknown/', 'author/unknown/'):
+            self.assertEqual(404, self.client.get(
+                self.blog.url + 'api/posts/' + route).status_code)
+
+class TestArchive(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+        for n, day in enumerate(('2014-01-05', '2014-01-20', '2013-12-24')):
+            self.blog.add_child(instance=BlogPost(
+                title='Post {0}'.format(n), slug='post-{0}'.format(n),
+                content='Content', date=day))
+        self.posts = list(self.blog.posts.order_by('-date', '-id'))
+
+    def test_iter_posts(self):
+        # Chunks smaller than the posts, and than a month
+        self.assertEqual(
+            [post.pk for post in self.posts],
+            [pk for pk, title, day in archive.iter_posts(self.blog.posts, 2)])
+
+    def test_iter_months(self):
+        months = list(archive.iter_months(self.blog.posts))
+
+        self.assertEqual(sorted(set(
+            date(post.date.year, post.date.month, 1) for post in self.posts),
+            reverse=True), [month for month, items in months])
+        self.assertEqual(
+            [post.pk for post in self.posts],
+            [item['id'] for month, items in months for item in items])
+
+    def test_archive(self):
+        response = self.client.get(self.blog.url + 'archive/')
+        self.assertTrue(response.streaming)
+
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertNotIn(archive.MARKER, content)
+        self.assertIn('</html>', content)
+
+        # Newest first
+        positions = [content.index(escape(post.url)) for post in self.posts]
+        self.assertEqual(sorted(positions), positions)
+        self.assertIn('December 2013', content)
+
+
+class TestNeighbours(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+        for n, day in enumerate(('2014-01-05', '2014-01-05', '2013-12-24')):
+            self.blog.add_child(instance=BlogPost(
+                title='Post {0}'.format(n), slug='post-{0}'.format(n),
+                content='Content', date=day))
+        # Oldest first
+        self.posts = list(self.blog.posts.order_by('date', 'id'))
+
+    def ids(self, post):
+        return [neighbour and neighbour['id']
+                for neighbour in neighbours.find(post)]
+
+    def test_find(self):
+        self.assertEqual([None, self.posts[1].pk], self.ids(self.posts[0]))
+        self.assertEqual([self.posts[-2].pk, None], self.ids(self.posts[-1]))
+
+        # Posts of the same date are ordered by id
+        for older, post, newer in zip(self.posts, self.posts[1:],
+                                      self.posts[2:]):
+            self.assertEqual([older.pk, newer.pk], self.ids(post))
+
+    def test_cache(self):
+        post = self.posts[1]
+        newer = self.posts[2]
+        post.neighbour_posts
+
+        with self.assertNumQueries(0):
+            self.assertEqual(newer.pk, post.neighbour_posts[1]['id'])
+
+        # Re-dated and published
+        newer.date = date(2000, 1, 1)
+        newer.save()
+        page_published.send(sender=BlogPost, instance=newer)
+
+        self.assertEqual(self.posts[3].pk, post.neighbour_posts[1]['id'])
+
+    def test_sub_folders(self):
+        post = self.posts[-1]
+        post.neighbour_posts
+
+        folder = self.blog.add_child(instance=IndexPage(
+            title='Folder', slug='folder'))
+        newer = folder.add_child(instance=BlogPost(
+            title='Newest', slug='newest', content='Content',
+            date=date(2040, 1, 1)))
+        page_published.send(sender=BlogPost, instance=newer)
+
+        # Same blog, other folder
+        post = BlogPost.objects.get(pk=post.pk)
+        self.assertEqual(newer.pk, post.neighbour_posts[1]['id'])
+
+    def test_navigation(self):
+        post = self.posts[1]
+        content = self.client.get(post.url).content.decode('utf-8')
+
+        self.assertIn('rel="prev" href="{0}"'.format(self.posts[0].url),
+                      content)
+        self.assertIn('rel="next" href="{0}"'.format(self.posts[2].url),
+                      content)
+
+
+class TestAuthors(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+        self.user = User.objects.first()
+        self.other = User.objects.create(username='other',
+                                         first_name='Other', last_name='One')
+        authors.rebuild()
+
+    def test_rebuild(self):
+        self.assertEqual(
+            [{'user_id': self.user.pk, 'slug': self.user.username,
+              'name': 'Alejandro',
+              'post_count': self.blog.posts.count(),
+              'latest_date': self.blog.posts.first().date}],
+            authors.get_directory(self.blog.pk))
+
+    def test_publish(self):
+        post = self.blog.add_child(instance=BlogPost(
+            title='New post', slug='new-post', content='Content',
+            owner=self.other, date=date(2030, 1, 1)))
+        page_published.send(sender=BlogPost, instance=post)
+
+        author = authors.get_author(self.blog.pk, self.other.pk)
+        self.assertEqual(('Other One', 1, date(2030, 1, 1)), (
+            author['name'], author['post_count'], author['latest_date']))
+
+        post.unpublish()
+        self.assertIsNone(authors.get_author(self.blog.pk, self.other.pk))
+
+    def test_update_in_place(self):
+        row = BlogAuthor.objects.get(blog=self.blog, user=self.user)
+        BlogAuthor.objects.filter(pk=row.pk).update(post_count=0)
+
+        authors.rebuild()
+
+        # Updated, not deleted and inserted again
+        self.assertEqual(
+            [(row.pk, self.blog.posts.count())],
+            list(BlogAuthor.objects.filter(
+                blog=self.blog, user=self.user).values_list(
+                    'pk', 'post_count')))
+
+    def test_rename(self):
+        self.user.first_name = 'Alex'
+        self.user.save()
+
+        self.assertEqual(
+            'Alex', authors.get_author(self.blog.pk, self.user.pk)['name'])
+
+    def test_authors(self):
+        response = self.client.get(self.blog.url + 'authors/')
+
+        self.assertContains(response, 'href="{0}author/{1}/"'.format(
+            self.blog.url, self.user.username))
+
+    def test_byline(self):
+        posts = list(self.blog.posts)
+        authors.get_directory(self.blog.pk)
+        template = Template(
+            '{% load wagtailbase_tags %}{% for post in posts %}'
+            '{% get_blog_author post blog as author %}{{ author.name }}'
+            '{% endfor %}')
+
+        with self.assertNumQueries(0):
+            content = template.render(Context({'posts': posts,
+                                               'blog': self.blog}))
+        self.assertEqual('Alejandro' * len(posts), content)
+
+
+class TestTagCloud(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+        self.posts = []
+        for n, tags in enumerate(('Apple Banana', 'Apple', 'Apricot')):
+            post = self.blog.add_child(instance=BlogPost(
+                title='Post {0}'.format(n), slug='post-{0}'.format(n),
+                content='Content'))
+            post.tags.add(*tags.split())
+            post.save()
+            self.posts.append(post)
+        tagcloud.rebuild()
+
+    def counts(self):
+        return dict((tag['name'], tag['post_count'])
+                    for tag in tagcloud.get_cloud(self.blog.pk))
+
+    def test_rebuild(self):
+        self.assertEqual({'Apple': 2, 'Apricot': 1, 'Banana': 1},
+                         self.counts())
+        self.assertEqual(
+            [5, 1, 1], [tag['weight'] for tag in tagcloud.get_cloud(
+                self.blog.pk)])
+        self.assertEqual(['Apple'], [tag['name'] for tag in tagcloud.get_cloud(
+            self.blog.pk, limit=1)])
+
+    def test_publish(self):
+        post = self.posts[0]
+        post.tags.remove('Banana')
+        post.tags.add('Cherry')
+        post.save()
+        page_published.send(sender=BlogPost, instance=post)
+
+        self.assertEqual({'Apple': 2, 'Apricot': 1, 'Cherry': 1},
+                         self.counts())
+
+        post.unpublish()
+        self.assertEqual({'Apple': 1, 'Apricot': 1}, self.counts())
+
+    def test_complete(self):
+        self.assertEqual(['Apple', 'Apricot'], [
+            tag['name'] for tag in tagcloud.complete(self.blog.pk, 'ap')])
+
+        response = self.client.get(self.blog.url + 'api/tags/',
+                                   data={'prefix': 'APR'})
+        self.assertEqual({'results': [{'name': 'Apricot', 'count': 1}]},
+                         json.loads(response.content.decode('utf-8')))
+
+    def test_tags(self):
+        response = self.client.get(self.blog.url + 'tags/')
+
+        self.assertContains(response, 'href="{0}tag/Apple/"'.format(
+            self.blog.url))
+
+
+class TestSitewide(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+        self.other = self.blog.get_parent().add_child(instance=BlogIndexPage(
+            title='Other blog', slug='other-blog'))
+        self.posts = []
+        for n, blog in enumerate((self.blog, self.other)):
+            post = blog.add_child(instance=BlogPost(
+                title='March post {0}'.format(n),
+                slug='march-post-{0}'.format(n), content='Content',
+                date=date(2031, 3, n + 1)))
+            post.tags.add('Shared')
+            post.save()
+            self.posts.append(post)
+
+    def test_attach_blog_indexes(self):
+        posts = list(BlogPost.objects.filter(
+            pk__in=[post.pk for post in self.posts]).order_by('date'))
+
+        with self.assertNumQueries(1):
+            util.attach_blog_indexes(posts)
+        with self.assertNumQueries(0):
+            self.assertEqual([self.blog.pk, self.other.pk],
+                             [post.blog_index.pk for post in posts])
+            self.assertIsInstance(posts[0].blog_index.specific, BlogIndexPage)
+
+    def test_get_posts(self):
+        site = Site.objects.get(is_default_site=True)
+
+        self.assertEqual(
+            list(reversed(self.posts)),
+            list(sitewide.get_posts(site.root_page, year=2031, month=3)))
+        self.assertEqual(list(reversed(self.posts)), list(sitewide.get_posts(
+            site.root_page, tag_id=resolve_tag('Shared'))))
+        self.assertEqual([self.posts[1]], list(sitewide.get_posts(
+            site.root_page, year=2031, month=3, day=2)))
+
+    def test_date_range(self):
+        self.assertEqual((date(2031, 12, 1), date(2032, 1, 1)),
+                         sitewide.get_date_range(2031, 12))
+        self.assertEqual((date(2031, 2, 28), date(2031, 3, 1)),
+                         sitewide.get_date_range(2031, 2, 28))
+        self.assertEqual((date(2031, 1, 1), date(2032, 1, 1)),
+                         sitewide.get_date_range(2031))
+
+    def test_routes(self):
+        for url in ('/_posts/tag/Shared/', '/_posts/date/2031/march/',
+                    '/_posts/date/2031/3/1/'):
+            response = self.client.get(url)
+            self.assertContains(response, self.posts[0].title)
+
+        response = self.client.get('/_posts/date/2031/march/')
+        self.assertContains(response, self.posts[1].title)
+        self.assertEqual(404, self.client.get(
+            '/_posts/date/2031/smarch/').status_code)
+        self.assertEqual(404, self.client.get(
+            '/_posts/tag/Unknown/').status_code)
+
+
+class TestBulk(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        self.user = User.objects.create_superuser(
+            'editor', 'editor@example.com', 'password')
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+        self.posts = []
+        for n in range(3):
+            post = self.blog.add_child(instance=BlogPost(
+                title='Bulk post {0}'.format(n),
+                slug='bulk-post-{0}'.format(n), content='Content',
+                owner=self.user))
+            post.tags.add('Embargo')
+            post.save()
+            self.posts.append(post)
+        authors.rebuild()
+        tagcloud.rebuild()
+        self.received = []
+        bulk.pages_unpublished.connect(self.receive)
+
+    def tearDown(self):
+        bulk.pages_unpublished.disconnect(self.receive)
+
+    def receive(self, sender, pages, **kwargs):
+        self.received.append(len(pages))
+
+    def counts(self):
+        author = authors.get_author(self.blog.pk, self.user.pk)
+
+        return (dict((tag['name'], tag['post_count'])
+                     for tag in tagcloud.get_cloud(self.blog.pk)),
+                author and author['post_count'])
+
+    def test_unpublish(self):
+        ids = [post.pk for post in self.posts]
+        generation = wagtailbase_cache.get_generation(LISTINGS)
+
+        with self.settings(WAGTAILBASE_BULK_BATCH_SIZE=2):
+            self.assertEqual(3, len(bulk.unpublish(ids)))
+
+        self.assertFalse(BlogPost.objects.filter(pk__in=ids, live=True))
+        self.assertEqual(generation + 1,
+                         wagtailbase_cache.get_generation(LISTINGS))
+        self.assertEqual([3], self.received)
+        self.assertEqual(({}, None), self.counts())
+
+        # Already unpublished
+        self.assertEqual([], bulk.unpublish(ids))
+
+        self.assertEqual(3, len(bulk.publish(ids)))
+        self.assertEqual(3, BlogPost.objects.filter(
+            pk__in=ids, live=True).count())
+        self.assertEqual(({'Embargo': 3}, 3), self.counts())
+
+    def test_unpublished_changes(self):
+        ids = [post.pk for post in self.posts]
+        bulk.unpublish(ids)
+
+        # Unpublished pages have unpublished changes, as in wagtail
+        self.assertEqual(3, BlogPost.objects.filter(
+            pk__in=ids, has_unpublished_changes=True).count())
+
+        draft = BlogPost.objects.get(pk=self.posts[0].pk)
+        draft.title = 'Edited'
+        draft.save_revision()
+
+        bulk.publish(ids)
+
+        # The draft is published
+        self.assertEqual('Edited', BlogPost.objects.get(pk=draft.pk).title)
+        self.assertFalse(BlogPost.objects.filter(
+            pk__in=ids, has_unpublished_changes=True))
+        self.assertEqual(3, BlogPost.objects.filter(
+            pk__in=ids, live=True).count())
+        self.assertEqual(({'Embargo': 3}, 3), self.counts())
+
+    def test_admin_view(self):
+        self.client.login(username='editor', password='password')
+        url = reverse('wagtailbase_bulk_publish', args=(self.blog.pk,))
+
+        response = self.client.post(url, {
+            'action': 'unpublish',
+            'page': [post.pk for post in self.posts[:2]]})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertEqual([2], self.received)
+        self.assertEqual(1, BlogPost.objects.filter(
+            pk__in=[post.pk for post in self.posts], live=True).count())
+
+
+class TestTieredCache(TestCase):
+
+    def setUp(self):
+        # Stand-in for the shared cache, e.g. memcached
+        self.shared = LocMemCache('tiered', {})
+        self.shared.clear()
+        self.workers = [wagtailbase_cache.TieredCache(
+            self.shared, max_entries=2, check_interval=0) for i in range(2)]
+        self.calls = []
+
+    def compute(self):
+        self.calls.append(1)
+        return len(self.calls)
+
+    def test_tiers(self):
+        first, second = self.workers
+
+        self.assertEqual(1, first.get('test', ('key',), self.compute, 60))
+        self.assertEqual(1, second.get('test', ('key',), self.compute, 60))
+
+        # Served by the local tier, even if the shared one is lost
+        self.shared.delete(first.versioned_key('test', 'key'))
+        self.assertEqual(1, first.get('test', ('key',), self.compute, 60))
+        self.assertEqual(1, len(self.calls))
+
+    def test_invalidation(self):
+        first, second = self.workers
+
+        first.get('test', ('key',), self.compute, 60)
+        second.get('test', ('key',), self.compute, 60)
+        second.bump_generation('test')
+
+        self.assertEqual(2, first.get('test', ('key',), self.compute, 60))
+        self.assertEqual(2, second.get('test', ('key',), self.compute, 60))
+
+    def test_lru(self):
+        local = wagtailbase_cache.LocalCache(max_entries=2)
+        local.set('a', 1, 60)
+        local.set('b', 2, 60)
+        local.get('a')
+        local.set('c', 3, 60)
+
+        self.assertEqual(1, local.get('a'))
+        self.assertIsNone(local.get('b'))
+        self.assertEqual(2, len(local))
+
+
+@override_settings(WAGTAILBASE_ESI=True)
+class TestFragments(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        self.page = RichTextPage.objects.filter(
+            slug='first-page-index').first()
+
+    def test_esi_markers(self):
+        response = self.client.get(self.page.url)
+
+        self.assertContains(response, '<esi:include src="/_fragments/')
+        self.assertNotContains(response, 'class="local-navigation"')
+
+    def test_fragment(self):
+        response = self.client.get('/_fragments/local_menu/', {
+            'current_page': self.page.pk})
+
+        self.assertContains(response, 'class="local-navigation"')
+        self.assertNotContains(response, '<esi:include')
+        self.assertIn('max-age=300', response['Cache-Control'])
+
+        self.assertEqual(404, self.client.get(
+            '/_fragments/local_menu/').status_code)
+        self.assertEqual(404, self.client.get(
+            '/_fragments/unknown/').status_code)
+
+    def test_fragment_page_type(self):
+        blog = BlogIndexPage.objects.filter(slug='blog').first()
+
+        self.assertEqual(200, self.client.get(
+            '/_fragments/latest_blog_post/', {'parent': blog.pk}).status_code)
+        # Not a blog
+        self.assertEqual(404, self.client.get(
+            '/_fragments/latest_blog_post/', {
+                'parent': self.page.pk}).status_code)
+
+    def test_middleware(self):
+        middleware = settings.MIDDLEWARE_CLASSES + (
+            'wagtailbase.fragments.ESIMiddleware',)
+
+        with self.settings(MIDDLEWARE_CLASSES=middleware):
+            response = self.client.get(self.page.url)
+
+        self.assertNotContains(response, '<esi:include')
+        self.assertContains(response, 'class="local-navigation"')
+
+
+class TestPurging(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        self.stub = PurgeStub().start()
+        self.addCleanup(self.stub.stop)
+
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+        self.post = BlogPost.objects.filter(slug='s-it').first()
+        self.page = RichTextPage.objects.filter(
+            slug='first-page-index').first()
+
+        middleware = settings.MIDDLEWARE_CLASSES + (
+            'wagtailbase.purging.DependencyMiddleware',)
+        self.settings_override = override_settings(
+            MIDDLEWARE_CLASSES=middleware,
+            WAGTAILBASE_PURGE_ENDPOINT=self.stub.endpoint)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        for page in (self.blog, self.post, self.page):
+            self.client.get(page.url)
+
+    def test_purge(self):
+        page_published.send(sender=BlogPost, instance=self.post)
+
+        self.assertIn('http://testserver{0}'.format(self.blog.url),
+                      self.stub.urls)
+        self.assertIn('http://testserver{0}'.format(self.post.url),
+                      self.stub.urls)
+        self.assertIn(self.post.full_url, self.stub.urls)
+        # It shows the latest blog post
+        self.assertIn('http://testserver{0}'.format(self.page.url),
+                      self.stub.urls)
+
+    def test_purge_page(self):
+        page_published.send(sender=RichTextPage, instance=self.page)
+
+        self.assertIn('http://testserver{0}'.format(self.page.url),
+                      self.stub.urls)
+        self.assertNotIn('http://testserver{0}'.format(self.post.url),
+                         self.stub.urls)
+
+    def test_evicted_registry(self):
+        url = 'http://testserver{0}'.format(self.page.url)
+        dependency = ('page', self.page.pk)
+        shared = wagtailbase_cache.get_cache().shared
+
+        shared.delete(purging._slot_key(dependency, 0))
+        self.assertNotIn(url, purging.get_urls([dependency]))
+
+        # Registered again on its next response
+        self.client.get(self.page.url)
+        self.assertIn(url, purging.get_urls([dependency]))
+
+    def test_retagged(self):
+        self.post.tags.add('Before')
+        self.post.save()
+        page_published.send(sender=BlogPost, instance=self.post)
+
+        url = 'http://testserver/only-before/'
+        purging.register(url, [('tag', self.blog.pk, resolve_tag('Before'))])
+
+        self.post.tags.remove('Before')
+        self.post.save()
+        page_published.send(sender=BlogPost, instance=self.post)
+
+        self.assertIn(url, self.stub.urls)
+
+    def test_batches(self):
+        with self.settings(WAGTAILBASE_PURGE_BATCH_SIZE=1):
+            page_published.send(sender=BlogPost, instance=self.post)
+
+        self.assertEqual(len(self.stub.urls), self.stub.requests)
+        self.assertGreater(self.stub.requests, 1)
+
+
+class TestPageUrls(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+        self.site = Site.objects.get(is_default_site=True)
+
+    def test_urls(self):
+        for page in Page.objects.all():
+            self.assertEqual(page.url, get_page_url(page))
+            self.assertEqual(page.relative_url(self.site),
+                             get_page_url(page, self.site))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.blog.url, get_page_url(self.blog))
+            self.assertEqual(self.blog.url,
+                             get_page_url_by_id(self.blog.pk))
+
+    def test_rename(self):
+        post = self.blog.posts.first()
+        get_page_url(post)
+
+        self.blog.slug = 'news'
+        self.blog.save()
+
+        post = BlogPost.objects.get(pk=post.pk)
+        self.assertIn('/news/', get_page_url(post))
+        self.assertEqual(post.url, get_page_url_by_id(post.pk))
+
+    def test_deferred_pages(self):
+        with self.assertNumQueries(1):
+            list(Page.objects.only('title'))
+
+    def test_sites(self):
+        get_page_url(self.blog)
+
+        other = Site.objects.create(hostname='other.example.com',
+                                    root_page=self.blog)
+
+        self.assertEqual('http://other.example.com/', get_page_url(self.blog))
+        self.assertEqual('/', get_page_url(self.blog, other))
+        self.assertEqual(self.blog.relative_url(self.site),
+                         get_page_url(self.blog, self.site))
+
+
+class TestRelatedPosts(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+        self.posts = [post.specific for post in self.blog.posts]
+        for n in range(len(self.posts), 4):
+            self.posts.append(self.blog.add_child(instance=BlogPost(
+                title='Post {0}'.format(n), slug='post-{0}'.format(n),
+                content='Content')))
+        self.tags = [Tag.objects.create(name=name) for name in 'abc']
+
+        for post, tags in zip(self.posts, ('ab', 'ab', 'a', 'c')):
+            for tag in tags:
+                BlogPostTag.objects.create(content_object=post,
+                                           tag=self.tags['abc'.index(tag)])
+
+        related.rebuild()
+
+    def test_score(self):
+        post_tags = {1: set([1, 2]), 2: set([1, 2]), 3: set([1])}
+        tag_posts = {1: set([1, 2, 3]), 2: set([1, 2])}
+
+        self.assertEqual([2, 3], [post_id for post_id, score in related.score(
+            1, post_tags, tag_posts, 5)])
+        self.assertEqual([2], [post_id for post_id, score in related.score(
+            1, post_tags, tag_posts, 1)])
+
+    def test_build_matrix(self):
+        first, second, third, fourth = self.posts
+        post_tags, tag_posts, sizes = related.build_matrix([third.pk])
+
+        # Only the rows of the tags of the post, with the number of tags of
+        # every post that shares one
+        self.assertEqual([self.tags[0].pk], list(tag_posts))
+        self.assertEqual(set([first.pk, second.pk, third.pk]), set(sizes))
+        self.assertEqual(2, sizes[first.pk])
+
+    def test_related_posts(self):
+        first, second, third, fourth = self.posts
+
+        with self.assertNumQueries(1):
+            self.assertEqual([second, third], first.related_posts)
+
+        self.assertEqual([], fourth.related_posts)
+        self.assertContains(self.client.get(first.url), 'Related posts')
+
+    def test_update(self):
+        first, second, third, fourth = self.posts
+        BlogPostTag.objects.create(content_object=third, tag=self.tags[2])
+
+        related.update([third.pk])
+
+        self.assertEqual([third], fourth.related_posts)
+
+        # A post with only the shared tag scores higher than posts with
+        # other tags as well
+        posts = third.related_posts
+        self.assertEqual(fourth, posts[0])
+        self.assertEqual(set([first, second]), set(posts[1:]))
+
+    def stored(self):
+        return sorted(RelatedBlogPost.objects.values_list(
+            'post', 'related', 'rank'))
+
+    @override_settings(WAGTAILBASE_RELATED_POSTS=1)
+    def test_update_changed_only(self):
+        first, second, third, fourth = self.posts
+        related.rebuild()
+        fifth = self.blog.add_child(instance=BlogPost(
+            title='Post 5', slug='post-5', content='Content'))
+        BlogPostTag.objects.create(content_object=fifth, tag=self.tags[0])
+
+        # Only the new post and the post it now ranks first for
+        self.assertEqual(2, related.update([fifth.pk]))
+        self.assertEqual([fifth], third.related_posts)
+        self.assertEqual([second], first.related_posts)
+
+        stored = self.stored()
+        related.rebuild()
+        self.assertEqual(stored, self.stored())
+
+
+@override_settings(WAGTAILBASE_VIEW_COUNTS=True,
+                   WAGTAILBASE_VIEW_FLUSH_INTERVAL=3600)
+class TestViewCounters(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        counters._take_pending()
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+        self.posts = [post.specific for post in self.blog.posts]
+
+    def view(self, post, times):
+        for i in range(times):
+            self.assertEqual(200, self.client.get(post.url).status_code)
+
+    def get_counts(self):
+        return [BlogPostViews.objects.filter(post=post).values_list(
+            'count', flat=True).first() for post in self.posts]
+
+    def test_flush(self):
+        first, second = self.posts
+        self.view(first, 3)
+        self.view(second, 1)
+
+        # Nothing is written until the counts are flushed
+        self.assertEqual([None, None], self.get_counts())
+
+        self.assertEqual(2, counters.flush())
+        self.assertEqual([3, 1], self.get_counts())
+
+        self.view(first, 2)
+        self.view(second, 2)
+        counters.flush()
+        self.assertEqual([5, 3], self.get_counts())
+
+    def test_flush_interval(self):
+        with self.settings(WAGTAILBASE_VIEW_FLUSH_INTERVAL=0):
+            self.view(self.posts[0], 1)
+
+        self.assertEqual([1, None], self.get_counts())
+
+    def test_popular_posts(self):
+        first, second = self.posts
+        self.view(second, 2)
+        self.view(first, 1)
+        counters.flush()
+
+        template = Template('{% load wagtailbase_tags %}'
+                            '{% popular_blog_posts 2 %}')
+        content = template.render(Context({'request': None}))
+
+        self.assertLess(content.index(escape(second.title)),
+                        content.index(escape(first.title)))
+
+
+@override_settings(WAGTAILBASE_RENDITION_WORKERS=0,
+                   WAGTAILBASE_RESPONSIVE_WIDTHS=(16, 32, 64))
+class TestRenditions(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        self.image = synthetic.create_image(width=48, height=24)
+        self.page = RichTextPage.objects.filter(
+            slug='first-page-index').first()
+        RichTextAttachment.objects.create(page=self.page, image=self.image)
+
+    def test_update_image(self):
+        responsive = renditions.update_image(self.image)
+
+        # Images are not scaled up, 64 gives the 48 pixels wide original
+        self.assertEqual(['16w', '32w', '48w'], [
+            source.split()[1] for source in responsive.srcset.split(', ')])
+        self.assertEqual((48, 24), (responsive.width, responsive.height))
+        self.assertTrue(responsive.placeholder.startswith(
+            'data:image/jpeg;base64,'))
+
+    def test_publish(self):
+        self.assertNotContains(self.client.get(self.page.url), 'srcset')
+
+        self.page.save_revision().publish()
+        self.assertEqual([], renditions.get_missing(self.page))
+
+        response = self.client.get(self.page.url)
+        self.assertContains(response, 'srcset')
+        self.assertContains(response, 'loading="lazy"')
+
+        # The stored renditions are dropped when the file is replaced
+        self.image.file.name = 'replaced.png'
+        self.image.save()
+        self.assertEqual([self.image.pk], renditions.get_missing(self.page))
+
+
+class ReplicaOnly(object):
+
+    def db_for_read(self, model, **hints):
+        return 'replica'
+
+    def db_for_write(self, model, **hints):
+        return 'replica'
+
+
+@override_settings(
+    DATABASE_ROUTERS=['wagtailbase.routers.ReplicaRouter'],
+    WAGTAILBASE_DB_REPLICAS=['replica'],
+    MIDDLEWARE_CLASSES=settings.MIDDLEWARE_CLASSES + (
+        'wagtailbase.routers.ReplicaMiddleware',))
+class TestReplicaRouter(TestCase):
+    fixtures = FIXTURES
+
+    @classmethod
+    def setUpClass(cls):
+        # A second SQLite database stands in for the replica
+        cls.directory = tempfile.mkdtemp()
+        connections.databases['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.directory, 'replica.sqlite3'),
+            'TEST': {'NAME': os.path.join(cls.directory, 'replica.sqlite3')},
+        }
+
+        # Some data migrations do not pass the database they run on
+        with override_settings(DATABASE_ROUTERS=[ReplicaOnly()]):
+            connections['replica'].creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False)
+
+        super(TestReplicaRouter, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections.databases['replica']
+        shutil.rmtree(cls.directory)
+
+        super(TestReplicaRouter, cls).tearDownClass()
+
+    def setUp(self):
+        wagtailbase_cache.clear()
+        self.blog = BlogIndexPage.objects.filter(slug='blog').first()
+
+    def test_public_reads(self):
+        middleware = ReplicaMiddleware()
+        request = RequestFactory().get(self.blog.url)
+
+        middleware.process_request(request)
+        try:
+            with CaptureQueriesContext(connections['replica']) as queries:
+                # The fixtures are only in the primary
+                self.assertEqual(0, BlogPost.objects.count())
+        finally:
+            middleware.process_response(request, HttpResponse())
+
+        self.assertEqual(1, len(queries))
+        self.assertGreater(BlogPost.objects.count(), 0)
+
+    def test_cache_fills(self):
+        tag = Tag.objects.create(name='Fresh')
+        middleware = ReplicaMiddleware()
+        request = RequestFactory().get(self.blog.url)
+
+        middleware.process_request(request)
+        try:
+            with CaptureQueriesContext(connections['replica']) as queries:
+                # Not cached as missing from the replica, which is behind
+                self.assertEqual(tag.pk, resolve_tag('Fresh'))
+        finally:
+            middleware.process_response(request, HttpResponse())
+
+        self.assertEqual(0, len(queries))
+
+    def test_pinned(self):
+        self.client.cookies[PIN_COOKIE] = str(int(time.time() + 60))
+
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = self.client.get(self.blog.url)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(0, len(queries))
+
+    def test_pin_after_write(self):
+        middleware = ReplicaMiddleware()
+        request = RequestFactory().post('/')
+        middleware.process_request(request)
+        post_save.send(sender=Tag, instance=None)
+        response = middleware.process_response(request, HttpResponse())
+
+        self.assertIn(PIN_COOKIE, response.cookies)
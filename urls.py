@@ -5,9 +5,13 @@ from wagtail.wagtailadmin import urls as wagtailadmin_urls
 from wagtail.wagtaildocs import urls as wagtaildocs_urls
 from wagtail.wagtailsearch.urls import frontend as wagtailsearch_frontend_urls
 
+from wagtailbase import fragments, sitewide
+
 urlpatterns = patterns('',
                        url(r'^wagtail/', include(wagtailadmin_urls)),
                        url(r'^search/', include(wagtailsearch_frontend_urls)),
                        url(r'^documents/', include(wagtaildocs_urls)),
+                       url(r'^_fragments/', include(fragments)),
+                       url(r'^_posts/', include(sitewide)),
                        url(r'', include(wagtail_urls)),
                        )
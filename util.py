@@ -1,3 +1,128 @@
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+
+import calendar
+
 
 def unslugify(value):
-    return value.replace('_', ' ').capitalize()
\ No newline at end of file
+    return value.replace('_', ' ').capitalize()
+
+
+def get_month_number(month):
+    """Returns the number of the month given by its full or abbreviated
+    name, in any case, or 0."""
+    names = dict((v, k) for k, v in enumerate(calendar.month_name))
+    abbrs = dict((v, k) for k, v in enumerate(calendar.month_abbr))
+
+    month_str = month.title()
+
+    return names.get(month_str) or abbrs.get(month_str) or 0
+
+
+def specific_pages(pages):
+    """Returns the specific instances of the pages, in the same order. The
+    pages are grouped by content type, and the instances of each type are
+    fetched in one query, instead of one query per page with `.specific`."""
+    pages = list(pages)
+    by_type = defaultdict(list)
+
+    for page in pages:
+        by_type[page.content_type_id].append(page.pk)
+
+    specific = {}
+
+    for content_type_id, pks in by_type.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+
+        if model is None:
+            # The model of the page is gone, keep the generic pages
+            continue
+
+        specific.update(model._default_manager.in_bulk(pks))
+
+    return [specific.get(page.pk, page) for page in pages]
+
+
+def get_blogs(*posts):
+    """Returns the ids and paths of the blogs the posts belong to, those of
+    all their blog index ancestors, in a single query."""
+    from wagtailbase.models import BlogIndexPage
+
+    paths = set(post.path[:end] for post in posts
+                for end in range(post.steplen, len(post.path), post.steplen))
+
+    return list(BlogIndexPage.objects.filter(
+        path__in=list(paths)).values_list('pk', 'path'))
+
+
+def attach_blog_indexes(posts):
+    """Sets the blog index of the posts, read by `BlogPost.blog_index`: the
+    nearest blog index ancestor of each post, or the first blog index for
+    posts that have none. The blog indexes of all the posts are fetched in a
+    single query."""
+    from wagtailbase.models import BlogIndexPage
+
+    posts = list(posts)
+    paths = set(post.path[:end] for post in posts
+                for end in range(post.steplen, len(post.path), post.steplen))
+    blogs = dict((blog.path, blog) for blog in
+                 BlogIndexPage.objects.filter(path__in=list(paths)))
+    fallback = []
+
+    for post in posts:
+        for end in range(len(post.path) - post.steplen, 0, -post.steplen):
+            blog = blogs.get(post.path[:end])
+            if blog is not None:
+                break
+        else:
+            # No ancestors are blog indexes
+            if not fallback:
+                fallback.append(BlogIndexPage.objects.first())
+            blog = fallback[0]
+
+        post._blog_index = blog
+
+    return posts
+
+
+def update_rows(model, blog_id, field, rows, keys=None):
+    """Replaces the rows of the blog in the model, unique on the blog and on
+    the given foreign key field, with the given rows, as a dictionary of the
+    values of the other fields by key. Only the rows of the given keys are
+    replaced, or all of them.
+
+    Rows are updated in place and inserted when they are missing, never
+    deleted and inserted again, so that concurrent updates of the same rows,
+    e.g. by two publications, do not collide on the unique constraint."""
+    column = field + '_id'
+    existing = model.objects.filter(blog=blog_id)
+
+    if keys is not None:
+        existing = existing.filter(**{field + '__in': list(keys)})
+
+    values = list(next(iter(rows.values()), {}))
+    existing = dict((row.pop(column), row) for row in
+                    existing.values(column, *values))
+    removed = [key for key in existing if key not in rows]
+
+    for start in range(0, len(removed), 500):
+        model.objects.filter(blog=blog_id, **{
+            field + '__in': removed[start:start + 500]}).delete()
+
+    for key, row in rows.items():
+        lookup = {'blog_id': blog_id, column: key}
+
+        if existing.get(key) == row:
+            continue
+
+        if key in existing and model.objects.filter(**lookup).update(**row):
+            continue
+
+        try:
+            with transaction.atomic():
+                model.objects.create(**dict(lookup, **row))
+        except IntegrityError:
+            # Inserted by a concurrent update
+            model.objects.filter(**lookup).update(**row)
@@ -0,0 +1,38 @@
+from django.conf.urls import include, url
+from django.core import urlresolvers
+
+from wagtail.wagtailadmin.menu import MenuItem
+from wagtail.wagtailcore import hooks
+
+from wagtailbase import bulk, counters
+from wagtailbase.models import BlogPost
+from wagtailbase.purging import record
+
+
+@hooks.register('before_serve_page')
+def record_page_dependency(page, request, serve_args, serve_kwargs):
+    """Records the page as a dependency of its response, see
+    wagtailbase.purging."""
+    record('page', page.pk)
+
+
+@hooks.register('before_serve_page')
+def count_post_view(page, request, serve_args, serve_kwargs):
+    """Counts the views of the blog posts, see wagtailbase.counters."""
+    if (counters.is_enabled() and isinstance(page, BlogPost) and
+            request.method == 'GET'):
+        counters.record_view(page.pk)
+
+
+@hooks.register('register_admin_urls')
+def register_bulk_publish_urls():
+    """Admin view to publish or unpublish many pages at once, see
+    wagtailbase.bulk."""
+    return [url(r'^wagtailbase/bulk-publish/', include(bulk))]
+
+
+@hooks.register('register_admin_menu_item')
+def register_bulk_publish_menu_item():
+    return MenuItem('Bulk publish',
+                    urlresolvers.reverse('wagtailbase_bulk_publish'),
+                    classnames='icon icon-doc-full-inverse', order=900)